@@ -73,6 +73,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+ASGI_APPLICATION = 'config.asgi.application'
 
 
 # Database
@@ -126,6 +127,55 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are stored once per distinct content (documents.storage)
+STORAGES = {
+    'default': {'BACKEND': 'documents.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Background text extraction from uploaded files
+TEXT_EXTRACTION_WORKERS = 2
+TEXT_EXTRACTION_ASYNC = True
+
+# How permission-checked downloads are transferred: 'django' sends them
+# itself, 'x-accel' hands them to nginx through an internal location that
+# maps FILE_SERVING_ACCEL_PREFIX to MEDIA_ROOT, 'x-sendfile' to Apache
+FILE_SERVING_BACKEND = 'django'
+FILE_SERVING_ACCEL_PREFIX = '/protected-media/'
+# Seconds a signed download link stays valid
+DOWNLOAD_TOKEN_MAX_AGE = 3600
+
+# Thumbnails and text previews, an LRU cache trimmed to this many bytes
+PREVIEW_CACHE_DIR = BASE_DIR / 'previews'
+PREVIEW_CACHE_MAX_BYTES = 256 * 1024 ** 2
+
+# Superseded document versions are kept as binary deltas (documents.deltas),
+# encoded by `manage.py compact_versions` only: longest chain it leaves,
+# largest file it encodes, and the per-process cache of rebuilt versions
+VERSION_DELTA_MAX_CHAIN = 8
+VERSION_DELTA_MAX_SIZE = 64 * 1024 ** 2
+VERSION_DELTA_CACHE_MAX_BYTES = 64 * 1024 ** 2
+
+# Resumable uploads: partial files are kept here until finalized
+CHUNKED_UPLOAD_DIR = BASE_DIR / 'uploads'
+CHUNKED_UPLOAD_MAX_SIZE = 2 * 1024 ** 3
+# Seconds an unfinished upload may stay idle before clear_uploads removes it
+CHUNKED_UPLOAD_TTL = 24 * 60 * 60
+
+# Shared by all worker processes, so cache-based invalidation (statistics
+# snapshots, compiled approval routes) reaches every one of them. The table
+# is created by the workflow migrations; its primary key makes add() atomic
+# across processes, which the snapshot recompute lock relies on
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'edms_cache',
+    }
+}
+
+# Seconds a cached statistics snapshot is served before it is recomputed
+STATISTICS_CACHE_TTL = 60
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
 ]
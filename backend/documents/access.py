@@ -0,0 +1,151 @@
+"""
+Materialized document visibility.
+
+DocumentAccess holds one row per (user, document) pair for users whose
+access is scoped. Roles in FULL_ACCESS_ROLES see every document and have
+no rows. The rules mirror the original role-based filter:
+
+- everyone sees documents they created or are assigned to, and documents
+  whose current route stage they have to sign;
+- prorectors and department heads also see documents they approve or
+  assigned, documents created by members of their department or of
+  any department below it (see documents.department_tree), and documents
+  created by their direct and indirect subordinates (see users.hierarchy).
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Q
+
+from users.hierarchy import subordinate_ids, supervisor_chains
+from workflow.models import StageApproval
+
+from .department_tree import subtree_q
+from .models import DepartmentClosure, Document, DocumentAccess, DocumentAssignment
+
+FULL_ACCESS_ROLES = ['admin', 'rector', 'secretary']
+SCOPED_MANAGER_ROLES = ['prorector', 'dept_head']
+
+User = get_user_model()
+
+
+def has_full_access(user):
+    return user.role in FULL_ACCESS_ROLES
+
+
+def visibility_q(user):
+    """Reference visibility filter, used to (re)build a user's rows"""
+    q = Q(creator=user) | Q(assignments__assignee=user)
+    q |= Q(status='pending', stage_approvals__approver=user, stage_approvals__step=F('current_step'))
+    if user.role in SCOPED_MANAGER_ROLES:
+        q |= Q(current_approver=user) | Q(assignments__assigned_by=user)
+        q |= Q(creator_id__in=subordinate_ids(user))
+        if user.department_id:
+            q |= subtree_q('creator__department', user.department_id)
+    return q
+
+
+def visible_documents(user, queryset=None):
+    """Restrict a Document queryset to what the user may see"""
+    if queryset is None:
+        queryset = Document.objects.all()
+    if has_full_access(user):
+        return queryset
+    return queryset.filter(access_entries__user=user)
+
+
+def rebuild_for_user(user):
+    """Recompute every access row of one user (role or department change)"""
+    with transaction.atomic():
+        DocumentAccess.objects.filter(user=user).delete()
+        if has_full_access(user):
+            return
+        document_ids = Document.objects.filter(visibility_q(user)).values_list('id', flat=True).distinct()
+        DocumentAccess.objects.bulk_create(
+            [DocumentAccess(user_id=user.id, document_id=doc_id) for doc_id in document_ids],
+            ignore_conflicts=True
+        )
+
+
+def rebuild_for_documents(document_ids):
+    """Recompute access rows for a batch of documents with a fixed number of queries"""
+    document_ids = list(document_ids)
+    if not document_ids:
+        return
+
+    docs = list(Document.objects.filter(id__in=document_ids).values_list(
+        'id', 'creator_id', 'current_approver_id', 'creator__department_id'
+    ))
+    assignments = list(DocumentAssignment.objects.filter(document_id__in=document_ids).values_list(
+        'document_id', 'assignee_id', 'assigned_by_id'
+    ))
+    stage_approvers = list(StageApproval.objects.filter(
+        document_id__in=document_ids, document__status='pending', step=F('document__current_step'),
+        approver__isnull=False,
+    ).values_list('document_id', 'approver_id'))
+
+    # Users whose role grants the extra manager rules
+    candidate_ids = {approver for _, _, approver, _ in docs if approver}
+    candidate_ids.update(assigned_by for _, _, assigned_by in assignments if assigned_by)
+    # Everyone above a creator in the supervisor chain
+    supervisors = supervisor_chains({creator for _, creator, _, _ in docs})
+    for ids in supervisors.values():
+        candidate_ids.update(ids)
+    # Managers of a document's department and of every department above it
+    ancestors = {}
+    for descendant_id, ancestor_id in DepartmentClosure.objects.filter(
+        descendant_id__in={dept for _, _, _, dept in docs if dept}
+    ).values_list('descendant_id', 'ancestor_id'):
+        ancestors.setdefault(descendant_id, []).append(ancestor_id)
+    department_ids = {ancestor_id for ids in ancestors.values() for ancestor_id in ids}
+    managers = User.objects.filter(role__in=SCOPED_MANAGER_ROLES).filter(
+        Q(id__in=candidate_ids) | Q(department_id__in=department_ids)
+    ).values_list('id', 'department_id')
+    manager_ids = set()
+    managers_by_department = {}
+    for user_id, department_id in managers:
+        manager_ids.add(user_id)
+        if department_id:
+            managers_by_department.setdefault(department_id, []).append(user_id)
+
+    pairs = set()
+    for doc_id, creator_id, approver_id, department_id in docs:
+        pairs.add((creator_id, doc_id))
+        if approver_id in manager_ids:
+            pairs.add((approver_id, doc_id))
+        for ancestor_id in ancestors.get(department_id, []):
+            for manager_id in managers_by_department.get(ancestor_id, []):
+                pairs.add((manager_id, doc_id))
+        pairs.update((supervisor_id, doc_id) for supervisor_id in supervisors.get(creator_id, ())
+                     if supervisor_id in manager_ids)
+    pairs.update((approver_id, doc_id) for doc_id, approver_id in stage_approvers)
+    for doc_id, assignee_id, assigned_by_id in assignments:
+        pairs.add((assignee_id, doc_id))
+        if assigned_by_id in manager_ids:
+            pairs.add((assigned_by_id, doc_id))
+
+    full_access_ids = set(User.objects.filter(
+        id__in={user_id for user_id, _ in pairs}, role__in=FULL_ACCESS_ROLES
+    ).values_list('id', flat=True))
+
+    with transaction.atomic():
+        DocumentAccess.objects.filter(document_id__in=document_ids).delete()
+        DocumentAccess.objects.bulk_create(
+            [DocumentAccess(user_id=user_id, document_id=doc_id)
+             for user_id, doc_id in pairs if user_id not in full_access_ids],
+            ignore_conflicts=True
+        )
+
+
+def rebuild_all(batch_size=1000):
+    """Recompute the whole table; returns the number of documents processed"""
+    total = 0
+    last_id = 0
+    with transaction.atomic():
+        DocumentAccess.objects.all().delete()
+        while True:
+            ids = list(Document.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return total
+            rebuild_for_documents(ids)
+            total += len(ids)
+            last_id = ids[-1]
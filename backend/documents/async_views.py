@@ -0,0 +1,147 @@
+"""
+Async read endpoints.
+
+Under ASGI (config.asgi) the busiest GET endpoints are answered by the
+coroutines here. Queries go through Django's async ORM and file bodies are
+streamed with serving.aread_range, so a request waiting on SQLite or on a
+slow client does not hold a worker thread and one process serves many of
+them. Every other method, and HEAD/OPTIONS, still goes to the DRF view in
+a thread (see async_read()).
+
+The coroutines reuse the viewsets' get_queryset() and serializers, so
+filters, visibility and output stay the same. Serializers must find
+everything they touch already loaded: the async ORM cannot run lazily
+from inside them.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import serving
+from .serializers import pending_approvers
+from .views import DocumentAssignmentViewSet, DocumentViewSet
+
+User = get_user_model()
+
+
+async def authenticate(request):
+    """The user of the request's JWT, with what the user serializers read loaded"""
+    # The same checks as the sync views: token, revocation, inactive users
+    result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    if result is None:
+        return None
+    return await User.objects.select_related('department', 'supervisor').aget(pk=result[0].pk)
+
+
+def api_response(data, status=200):
+    """A rendered DRF Response, as the sync views return"""
+    response = Response(data, status=status)
+    response.accepted_renderer = JSONRenderer()
+    response.accepted_media_type = response.accepted_renderer.media_type
+    response.renderer_context = {}
+    return response.render()
+
+
+def routed(router, name):
+    """The sync view a DRF router generated for a URL name"""
+    return next(pattern.callback for pattern in router.urls if pattern.name == name)
+
+
+def read_view(view_class, request, action=None, **kwargs):
+    """A DRF view instance set up as for a routed request, for its get_queryset() and serializers"""
+    return view_class(request=request, action=action, args=(), kwargs=kwargs, format_kwarg=None)
+
+
+def async_read(handler, fallback, anonymous=False):
+    """
+    View answering GET with the coroutine `handler(request, **kwargs)` and
+    anything else with the sync DRF view `fallback`. The handler gets a
+    DRF Request with the JWT user set; without one it is refused with 401
+    unless `anonymous`.
+    """
+    fallback = sync_to_async(fallback)
+
+    async def view(request, *args, **kwargs):
+        if request.method != 'GET':
+            return await fallback(request, *args, **kwargs)
+        request = Request(request, authenticators=())
+        try:
+            user = await authenticate(request)
+            if user is None and not anonymous:
+                raise NotAuthenticated()
+            request.user = user or AnonymousUser()
+            return await handler(request, **kwargs)
+        except Http404:
+            return api_response({'detail': NotFound.default_detail}, status=404)
+        except APIException as exc:
+            response = api_response(exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail},
+                                    status=exc.status_code)
+            if exc.status_code == 401:
+                response['WWW-Authenticate'] = JWTAuthentication().authenticate_header(request)
+            return response
+
+    return csrf_exempt(view)
+
+
+async def fetch_all(queryset):
+    return [obj async for obj in queryset]
+
+
+async def document_list(request):
+    view = read_view(DocumentViewSet, request, 'list')
+    paginator = view.paginator
+    page = await paginator.apaginate_queryset(view.get_queryset(), request, view)
+    return api_response(paginator.get_paginated_response(view.get_serializer(page, many=True).data).data)
+
+
+async def document_detail(request, pk):
+    view = read_view(DocumentViewSet, request, 'retrieve', pk=pk)
+    document = await view.get_queryset().filter(pk=pk).afirst()
+    if document is None:
+        raise Http404
+    if document.status == 'pending':
+        document.pending_approver_ids = await fetch_all(pending_approvers(document))
+    return api_response(view.get_serializer(document).data)
+
+
+async def assignment_list(request):
+    view = read_view(DocumentAssignmentViewSet, request, 'list')
+    # Managers' subordinates come from the cache or a recursive query, both sync
+    queryset = await sync_to_async(view.get_queryset)()
+    return api_response(view.get_serializer(await fetch_all(queryset), many=True).data)
+
+
+async def assignment_detail(request, pk):
+    view = read_view(DocumentAssignmentViewSet, request, 'retrieve', pk=pk)
+    assignment = await (await sync_to_async(view.get_queryset)()).filter(pk=pk).afirst()
+    if assignment is None:
+        raise Http404
+    return api_response(view.get_serializer(assignment).data)
+
+
+def file_download(kind):
+    """Handler serving the file of a download kind (see serving.DOWNLOAD_KINDS), streamed asynchronously"""
+    async def handler(request, pk, version_id=None):
+        user = request.user
+        if not user.is_authenticated:
+            user = await serving.token_users(request, kind, version_id or pk).afirst()
+            if user is None:
+                raise NotAuthenticated()
+        if kind == 'version':
+            objects = serving.download_objects(user, kind, version_id, document_id=pk)
+        else:
+            objects = serving.download_objects(user, kind, pk)
+        obj = await objects.afirst()
+        if obj is None or not obj.file:
+            raise Http404
+        # Stats the file and looks up its digest; the body itself is streamed without a thread
+        return await sync_to_async(serving.serve_file)(request, obj.file.name)
+
+    return handler
@@ -0,0 +1,249 @@
+"""
+Workflow actions applied to many documents, or one document fanned out to
+many assignees, in one transaction.
+
+Compiled routes and assignment flags are loaded once for the whole
+batch, documents are written with bulk_update and logs/assignments with
+bulk_create. Since bulk writes skip model signals, the access table,
+statistics rollups and cached snapshots are updated explicitly.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from workflow import rollups, snapshots
+from workflow.models import ActionLog
+from workflow.routes import get_routes
+
+from . import access
+from .models import Department, Document, DocumentAssignment
+from .transitions import TransitionError, apply_approve, apply_reject, move, save_transition
+
+User = get_user_model()
+
+BULK_ACTIONS = ['approve', 'reject', 'assign']
+MAX_BULK_DOCUMENTS = 500
+
+
+class BulkActionError(Exception):
+    """The whole request is invalid, e.g. an unknown assignee"""
+
+
+LOG_ACTIONS = {'approve': 'approved', 'reject': 'rejected', 'assign': 'assigned'}
+
+
+def run_bulk_action(user, document_ids, action_type, data):
+    """Apply action_type to each document; returns per-document results in request order"""
+    results = {}
+    with transaction.atomic():
+        documents = list(
+            access.visible_documents(user, Document.objects.filter(id__in=document_ids))
+            .select_related('creator').select_for_update(of=('self',))
+        )
+        found = {doc.id for doc in documents}
+        for doc_id in document_ids:
+            if doc_id not in found:
+                results[doc_id] = {'id': doc_id, 'success': False, 'error': 'Документ не найден'}
+
+        if action_type == 'assign':
+            changed, logs, assignments = bulk_assign(user, documents, data, results)
+        else:
+            changed, logs, assignments = bulk_decide(user, documents, action_type, data, results)
+        finish(user, action_type, changed, logs, assignments)
+
+    if logs:
+        snapshots.invalidate()
+    return [results[doc_id] for doc_id in document_ids]
+
+
+def bulk_decide(user, documents, action_type, data, results):
+    pending = []
+    for doc in documents:
+        if doc.status != 'pending':
+            results[doc.id] = {'id': doc.id, 'success': False, 'error': 'Документ не на согласовании'}
+        else:
+            pending.append(doc)
+    ids = [doc.id for doc in pending]
+
+    if action_type == 'approve':
+        assigned = DocumentAssignment.objects.filter(document_id__in=ids)
+        direct_ids = set(assigned.values_list('document_id', flat=True))
+        assignee_ids = set(assigned.filter(assignee=user).values_list('document_id', flat=True))
+        routes = get_routes({doc.document_type_id for doc in pending if doc.id not in direct_ids})
+
+    logs = []
+    decided = []
+    for doc in pending:
+        try:
+            if action_type == 'approve':
+                msg = apply_approve(
+                    doc, user, doc.id in direct_ids, doc.id in assignee_ids, routes.get(doc.document_type_id)
+                )
+            else:
+                msg = apply_reject(doc)
+        except TransitionError as exc:
+            results[doc.id] = {'id': doc.id, 'success': False, 'error': str(exc)}
+            continue
+        decided.append(doc)
+        results[doc.id] = {'id': doc.id, 'success': True, 'status': msg}
+        default_comment = msg if action_type == 'approve' else ''
+        logs.append(ActionLog(document=doc, comment=data.get('comment', default_comment)))
+    return decided, logs, []
+
+
+def create_assignments(user, pairs, instruction, deadline):
+    """
+    bulk_create assignments for (document, assignee) pairs.
+    Returns the assignments and their unsaved 'assigned' log entries;
+    the signature is computed once per document, not per assignee.
+    """
+    from .views import generate_signature
+
+    now = timezone.now()
+    signatures = {}
+    for doc, _ in pairs:
+        if doc.id not in signatures:
+            signatures[doc.id] = generate_signature(user, doc, 'assigned')
+    assignments = DocumentAssignment.objects.bulk_create([
+        DocumentAssignment(
+            document=doc, assignee=assignee, assigned_by=user, instruction=instruction, deadline=deadline,
+            signature=signatures[doc.id], signed_at=now
+        )
+        for doc, assignee in pairs
+    ])
+    logs = [
+        ActionLog(
+            document=doc, assignment=assignment,
+            comment=f'Назначен исполнитель: {assignee.get_full_name()}. Резолюция: {instruction}'
+        )
+        for (doc, assignee), assignment in zip(pairs, assignments)
+    ]
+    return assignments, logs
+
+
+def flag(value):
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+
+def id_list(value):
+    """Accept a JSON list, a single value or comma-separated strings"""
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    parts = [part for item in value for part in str(item).split(',') if part.strip()]
+    try:
+        return list(dict.fromkeys(int(part) for part in parts))
+    except ValueError:
+        raise BulkActionError('Неверный список исполнителей')
+
+
+def resolve_assignees(data):
+    """
+    Users an assignment fans out to. Any combination of `assignee`,
+    `assignees` (list of IDs), `department` (with `include_subdepartments`
+    and `heads_only`) and `role` is accepted; duplicates are dropped.
+    """
+    user_ids = []
+    if data.get('assignee'):
+        user_ids += id_list(data.get('assignee'))
+    if data.get('assignees'):
+        # Form submissions repeat the key, JSON bodies send a list
+        user_ids += id_list(data.getlist('assignees') if hasattr(data, 'getlist') else data.get('assignees'))
+
+    department_id = data.get('department')
+    role = data.get('role')
+    if not (user_ids or department_id or role):
+        raise BulkActionError('Не указан исполнитель')
+
+    users = {}
+    if user_ids:
+        users.update(User.objects.in_bulk(user_ids))
+        if len(users) != len(set(user_ids)):
+            raise BulkActionError('Исполнитель не найден')
+
+    if department_id:
+        department = Department.objects.filter(id=id_list(department_id)[0]).first()
+        if department is None:
+            raise BulkActionError('Подразделение не найдено')
+        department_ids = department.subtree_ids() if flag(data.get('include_subdepartments')) else [department.id]
+        if flag(data.get('heads_only')):
+            members = User.objects.filter(headed_departments__id__in=department_ids).distinct()
+        else:
+            members = User.objects.filter(department_id__in=department_ids, is_active=True)
+        users.update((u.id, u) for u in members)
+
+    if role:
+        users.update((u.id, u) for u in User.objects.filter(role=role, is_active=True))
+
+    if not users:
+        raise BulkActionError('Не найдено ни одного исполнителя')
+    return [users[pk] for pk in sorted(users)]
+
+
+def finish(user, action_type, changed, logs, assignments):
+    """
+    Save changed documents and logs, then do the bookkeeping signals would
+    have done (rollups, access). `changed` documents still carry the rollup
+    state they were loaded with.
+    """
+    from .views import generate_signature
+
+    old_states = [(doc._rollup_state, doc) for doc in changed]
+    now = timezone.now()
+    for doc in changed:
+        doc.updated_at = now
+    # Rows are locked by run_bulk_action, so the conditional UPDATE of
+    # save_transition is not needed here
+    Document.objects.bulk_update(changed, ['status', 'current_step', 'current_approver', 'updated_at'])
+
+    log_action = LOG_ACTIONS[action_type]
+    signatures = {}
+    for log in logs:
+        if log.document_id not in signatures:
+            signatures[log.document_id] = generate_signature(user, log.document, log_action)
+        log.user = user
+        log.action = log_action
+        log.signature = signatures[log.document_id]
+        log.signed_at = now
+    ActionLog.objects.bulk_create(logs)
+
+    rollups.record_bulk('documents.Document', old_states)
+    rollups.record_bulk('documents.DocumentAssignment', [(None, a) for a in assignments])
+    rollups.record_bulk('workflow.ActionLog', [(None, log) for log in logs])
+    access.rebuild_for_documents(list({log.document_id for log in logs}))
+
+
+def fan_out_assignment(user, document, assignees, instruction, deadline):
+    """Assign one document to many users in a single transaction"""
+    with transaction.atomic():
+        assignments, logs = create_assignments(
+            user, [(document, assignee) for assignee in assignees], instruction, deadline
+        )
+        if document.status == 'approved':
+            move(document, 'start')
+            save_transition(document)
+        finish(user, 'assign', [], logs, assignments)
+    snapshots.invalidate()
+    return assignments
+
+
+def bulk_assign(user, documents, data, results):
+    assignees = resolve_assignees(data)
+    instruction = data.get('instruction', '')
+    deadline = data.get('deadline') or None
+
+    assignments, logs = create_assignments(
+        user, [(doc, assignee) for doc in documents for assignee in assignees], instruction, deadline
+    )
+    by_document = {}
+    for assignment in assignments:
+        by_document.setdefault(assignment.document_id, []).append(assignment.id)
+
+    changed = []
+    for doc in documents:
+        if doc.status == 'approved':
+            move(doc, 'start')
+            changed.append(doc)
+        results[doc.id] = {
+            'id': doc.id, 'success': True, 'status': 'Исполнитель назначен', 'assignments': by_document[doc.id]
+        }
+    return changed, logs, assignments
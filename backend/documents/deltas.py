@@ -0,0 +1,333 @@
+"""
+Delta-compressed document versions.
+
+Consecutive versions of a document usually differ by a few paragraphs, so
+`manage.py compact_versions` re-encodes each superseded version's blob as
+a binary delta against the next version and removes its whole file. The
+latest version stays whole; older ones form a chain back from it:
+
+    v1.delta -> v2.delta -> v3 (whole)
+
+A delta file holds a header (magic, SHA-256 of the base blob, size of the
+rebuilt content) followed by a zlib-compressed list of COPY(offset, length)
+ops taken from the base and INSERT(bytes) ops carrying new data. Matches
+are found by indexing the base in BLOCK-sized pieces, so any shared run of
+2 * BLOCK bytes or more is copied rather than stored again.
+
+ContentAddressedStorage rebuilds delta blobs on open; the most recently
+rebuilt contents are kept in a per-process LRU of VERSION_DELTA_CACHE_MAX_BYTES.
+A delta is only kept when it is at most MAX_DELTA_RATIO of the whole file,
+so already compressed formats (.docx, images) simply stay whole. Chains
+longer than VERSION_DELTA_MAX_CHAIN are re-based onto the latest version.
+
+Encoding is pure Python and holds the GIL for seconds on large files, so it
+only runs from the command (e.g. nightly), never inside the web process.
+"""
+import logging
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .storage import blob_path, blob_sha256
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'EDD1'
+HEADER = struct.Struct('>4s32sQ')
+BLOCK = 32
+COPY, INSERT = 0, 1
+MAX_DELTA_RATIO = 0.5
+
+_cache_lock = threading.Lock()
+# sha256 -> rebuilt content, least recently used first
+_cache = OrderedDict()
+_cache_bytes = 0
+
+
+class DeltaError(Exception):
+    """A delta file is damaged or does not match its base"""
+
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return out
+
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _common_length(a, a_start, b, b_start):
+    """Length of the common run of a[a_start:] and b[b_start:], compared in halving steps"""
+    a, b = memoryview(a), memoryview(b)
+    limit = min(len(a) - a_start, len(b) - b_start)
+    length, step = 0, 4096
+    while step and length < limit:
+        n = min(step, limit - length)
+        if a[a_start + length:a_start + length + n] == b[b_start + length:b_start + length + n]:
+            length += n
+        else:
+            step //= 2
+    return length
+
+
+def diff(base, target):
+    """Ops that rebuild `target` from `base`, uncompressed"""
+    index = {}
+    # Walked backwards so the first occurrence of a repeated block wins
+    for offset in range(len(base) - BLOCK, -1, -BLOCK):
+        index[base[offset:offset + BLOCK]] = offset
+
+    ops = bytearray()
+    literal = position = 0
+    while position <= len(target) - BLOCK:
+        offset = index.get(target[position:position + BLOCK])
+        if offset is None:
+            position += 1
+            continue
+        # Grow the match backwards into the pending literal bytes
+        while position > literal and offset > 0 and target[position - 1] == base[offset - 1]:
+            position -= 1
+            offset -= 1
+        length = BLOCK + _common_length(base, offset + BLOCK, target, position + BLOCK)
+        if position > literal:
+            ops += bytes([INSERT]) + _varint(position - literal) + target[literal:position]
+        ops += bytes([COPY]) + _varint(offset) + _varint(length)
+        position += length
+        literal = position
+    if literal < len(target):
+        ops += bytes([INSERT]) + _varint(len(target) - literal) + target[literal:]
+    return bytes(ops)
+
+
+def patch(base, ops):
+    parts, pos = [], 0
+    while pos < len(ops):
+        op = ops[pos]
+        if op == COPY:
+            offset, pos = _read_varint(ops, pos + 1)
+            length, pos = _read_varint(ops, pos)
+            parts.append(base[offset:offset + length])
+        elif op == INSERT:
+            length, pos = _read_varint(ops, pos + 1)
+            parts.append(ops[pos:pos + length])
+            pos += length
+        else:
+            raise DeltaError(f'Unknown delta op {op}')
+    return b''.join(parts)
+
+
+def encode(base_sha256, base, target):
+    """A complete delta file: header and compressed ops"""
+    header = HEADER.pack(MAGIC, bytes.fromhex(base_sha256), len(target))
+    return header + zlib.compress(diff(base, target), 6)
+
+
+def read_header(data):
+    if len(data) < HEADER.size:
+        raise DeltaError('Truncated delta header')
+    magic, base, size = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise DeltaError('Not a delta file')
+    return base.hex(), size
+
+
+def delta_size(path):
+    """Size of the content a delta file rebuilds"""
+    with open(path, 'rb') as fileobj:
+        return read_header(fileobj.read(HEADER.size))[1]
+
+
+def _cached(sha256):
+    with _cache_lock:
+        content = _cache.get(sha256)
+        if content is not None:
+            _cache.move_to_end(sha256)
+        return content
+
+
+def _remember(sha256, content):
+    global _cache_bytes
+    limit = settings.VERSION_DELTA_CACHE_MAX_BYTES
+    if len(content) > limit // 2:
+        return
+    with _cache_lock:
+        if sha256 in _cache:
+            return
+        _cache[sha256] = content
+        _cache_bytes += len(content)
+        while _cache_bytes > limit:
+            _cache_bytes -= len(_cache.popitem(last=False)[1])
+
+
+def clear_cache():
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0
+
+
+def read_blob(sha256):
+    """Whole content of a blob, following its delta chain down to a whole file"""
+    # Collect the deltas from this blob down to cached or whole content
+    chain, content = [], None
+    while content is None:
+        content = _cached(sha256)
+        if content is not None:
+            break
+        try:
+            with open(default_storage.path(blob_path(sha256)), 'rb') as fileobj:
+                content = fileobj.read()
+        except FileNotFoundError:
+            with open(default_storage.delta_path(sha256), 'rb') as fileobj:
+                data = fileobj.read()
+            chain.append((sha256, data))
+            sha256 = read_header(data)[0]
+            if len(chain) > 10000:
+                raise DeltaError('Delta chain does not end')
+        else:
+            if chain:
+                # Bases are read again for every older version rebuilt on them
+                _remember(sha256, content)
+    for sha256, data in reversed(chain):
+        _, size = read_header(data)
+        content = patch(content, zlib.decompress(memoryview(data)[HEADER.size:]))
+        if len(content) != size:
+            raise DeltaError(f'Delta of {sha256} rebuilt {len(content)} bytes instead of {size}')
+        _remember(sha256, content)
+    return content
+
+
+def chain_of(sha256):
+    """The blob and the bases it is encoded against, down to a whole one"""
+    from .models import StoredBlob
+    chain = [sha256]
+    while True:
+        base = StoredBlob.objects.filter(sha256=chain[-1]).values_list('delta_base', flat=True).first()
+        if not base or base in chain:
+            return chain
+        chain.append(base)
+
+
+def pinned(sha256):
+    """Current document files stay whole; only superseded versions are encoded"""
+    from .models import Document
+    return Document.objects.filter(file__startswith=blob_path(sha256) + '/').exists()
+
+
+def materialize(sha256):
+    """Turn a delta blob back into a whole file"""
+    from .models import StoredBlob
+    delta = default_storage.delta_path(sha256)
+    if not os.path.exists(delta):
+        return
+    content = read_blob(sha256)
+    target = default_storage.path(blob_path(sha256))
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(target), delete=False) as tmp:
+        tmp.write(content)
+    os.replace(tmp.name, target)
+    StoredBlob.objects.filter(sha256=sha256).update(delta_base='')
+    os.remove(delta)
+
+
+def encode_blob(sha256, base_sha256):
+    """
+    Store a blob as a delta against another one if that saves enough;
+    returns True when the blob is a delta on base_sha256 afterwards.
+    """
+    from .models import StoredBlob
+    if sha256 == base_sha256 or sha256 in chain_of(base_sha256):
+        return False
+    blobs = dict(StoredBlob.objects.filter(
+        sha256__in=[sha256, base_sha256], size__lte=settings.VERSION_DELTA_MAX_SIZE
+    ).values_list('sha256', 'delta_base'))
+    if len(blobs) != 2:
+        # Rebuilding holds both files in memory, so large ones stay whole
+        return False
+    if blobs[sha256] == base_sha256:
+        return True
+
+    base = read_blob(base_sha256)
+    content = read_blob(sha256)
+    data = encode(base_sha256, base, content)
+    if len(data) > len(content) * MAX_DELTA_RATIO:
+        materialize(sha256)
+        return False
+    # Never trust a delta that does not rebuild the original
+    if patch(base, zlib.decompress(data[HEADER.size:])) != content:
+        logger.error('Delta of %s against %s does not round-trip', sha256, base_sha256)
+        return False
+
+    delta = default_storage.delta_path(sha256)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(delta), delete=False) as tmp:
+        tmp.write(data)
+    os.replace(tmp.name, delta)
+    with transaction.atomic():
+        # The base must still exist; once this row points at it, it is kept
+        encoded = StoredBlob.objects.filter(sha256=base_sha256).exists() and StoredBlob.objects.filter(
+            sha256=sha256
+        ).update(delta_base=base_sha256)
+    whole = default_storage.path(blob_path(sha256))
+    if not encoded:
+        os.remove(delta)
+        return False
+    if os.path.exists(whole):
+        os.remove(whole)
+    return True
+
+
+def version_blobs(document_id):
+    """Blob hashes of a document's versions, newest first, without repeats"""
+    from .models import DocumentVersion
+    names = DocumentVersion.objects.filter(document_id=document_id).order_by('-version_number').values_list(
+        'file', flat=True
+    )
+    hashes = []
+    for name in names:
+        sha256 = blob_sha256(name)
+        if sha256 and sha256 not in hashes:
+            hashes.append(sha256)
+    return hashes
+
+
+def compact_document(document_id):
+    """
+    Encode every older version against the next one and re-base chains
+    that would grow past VERSION_DELTA_MAX_CHAIN onto the newest version.
+    Returns the number of blobs re-encoded.
+    """
+    hashes = version_blobs(document_id)
+    if not hashes:
+        return 0
+    materialize(hashes[0])
+    changed = 0
+    for newer, sha256 in zip(hashes, hashes[1:]):
+        if pinned(sha256):
+            materialize(sha256)
+            continue
+        base = newer
+        if len(chain_of(newer)) > settings.VERSION_DELTA_MAX_CHAIN:
+            base = hashes[0]
+        before = chain_of(sha256)[1:2]
+        if not encode_blob(sha256, base) and base != hashes[0]:
+            encode_blob(sha256, hashes[0])
+        changed += chain_of(sha256)[1:2] != before
+    return changed
@@ -0,0 +1,76 @@
+"""
+Department closure table.
+
+DepartmentClosure holds a row for every (ancestor, descendant) pair,
+including each department paired with itself at depth 0, so "department
+X and everything below it" is a single indexed join:
+
+    Document.objects.filter(creator__department__ancestor_links__ancestor_id=x)
+
+Signal handlers keep the table in step with Department.parent; rebuild()
+recomputes it from scratch (data migration, rebuild_department_tree).
+"""
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Department, DepartmentClosure
+
+
+def subtree_q(path, department_id):
+    """Q matching rows whose department at `path` lies in department_id's subtree"""
+    return Q(**{f'{path}__ancestor_links__ancestor_id': department_id})
+
+
+def would_create_cycle(department, parent_id):
+    if department.pk is None or parent_id is None:
+        return False
+    return DepartmentClosure.objects.filter(ancestor_id=department.pk, descendant_id=parent_id).exists()
+
+
+def attach(department_id, parent_id):
+    """Link a department's subtree below parent_id (None for a root)"""
+    subtree = list(DepartmentClosure.objects.filter(ancestor_id=department_id).values_list('descendant_id', 'depth'))
+    if not subtree:
+        # A new department: its subtree is just itself
+        DepartmentClosure.objects.create(ancestor_id=department_id, descendant_id=department_id, depth=0)
+        subtree = [(department_id, 0)]
+    if parent_id is None:
+        return
+    ancestors = DepartmentClosure.objects.filter(descendant_id=parent_id).values_list('ancestor_id', 'depth')
+    DepartmentClosure.objects.bulk_create([
+        DepartmentClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=up + down + 1)
+        for ancestor_id, up in ancestors
+        for descendant_id, down in subtree
+    ])
+
+
+def detach(department_id):
+    """Cut a department's subtree off from the department's former ancestors"""
+    DepartmentClosure.objects.filter(
+        descendant_id__in=DepartmentClosure.objects.filter(ancestor_id=department_id).values('descendant_id'),
+        ancestor_id__in=DepartmentClosure.objects.filter(
+            descendant_id=department_id, depth__gt=0
+        ).values('ancestor_id'),
+    ).delete()
+
+
+def move(department_id, parent_id):
+    with transaction.atomic():
+        detach(department_id)
+        attach(department_id, parent_id)
+
+
+def rebuild():
+    """Recompute the whole table from Department.parent"""
+    parents = dict(Department.objects.values_list('id', 'parent_id'))
+    rows = []
+    for department_id in parents:
+        ancestor_id, depth, seen = department_id, 0, set()
+        while ancestor_id is not None and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            rows.append(DepartmentClosure(ancestor_id=ancestor_id, descendant_id=department_id, depth=depth))
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+    with transaction.atomic():
+        DepartmentClosure.objects.all().delete()
+        DepartmentClosure.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
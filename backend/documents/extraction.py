@@ -0,0 +1,232 @@
+"""
+Plain-text extraction from uploaded files.
+
+Uploads are hashed and parsed in a background worker pool after the
+request commits. Extracted text is cached by SHA-256 in ExtractedText, so
+identical files are parsed once, and the storage name to hash mapping in
+FileDigest spares rereading files. Results feed the search index; the
+same worker pass builds file previews (documents.previews).
+"""
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+SUPPORTED_EXTENSIONS = ('.txt', '.docx', '.doc')
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+# Runs of UTF-16LE Latin/Cyrillic text inside binary .doc files
+DOC_UTF16_RE = re.compile(rb'(?:[\x09\x0a\x0d\x20-\x7e\xa0-\xff]\x00|[\x01-\x5f]\x04){8,}')
+DOC_8BIT_RE = re.compile(rb'[\x09\x0a\x0d\x20-\x7e\xa8\xb8\xc0-\xff]{8,}')
+
+
+def file_sha256(fileobj):
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def extract_txt(fileobj):
+    data = fileobj.read()
+    for encoding in ('utf-8-sig', 'cp1251'):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode('utf-8', errors='replace')
+
+
+def extract_docx(fileobj):
+    paragraphs = []
+    with zipfile.ZipFile(fileobj) as archive:
+        with archive.open('word/document.xml') as xml:
+            parts = []
+            for _, element in ElementTree.iterparse(xml):
+                if element.tag == WORD_NS + 't':
+                    parts.append(element.text or '')
+                elif element.tag == WORD_NS + 'tab':
+                    parts.append('\t')
+                elif element.tag in (WORD_NS + 'br', WORD_NS + 'cr'):
+                    parts.append('\n')
+                elif element.tag == WORD_NS + 'p':
+                    paragraphs.append(''.join(parts))
+                    parts = []
+                    element.clear()
+    return '\n'.join(p for p in paragraphs if p.strip())
+
+
+def extract_doc(fileobj):
+    """Legacy Word: antiword when installed, otherwise scan for text runs"""
+    path = getattr(fileobj, 'name', None)
+    antiword = shutil.which('antiword')
+    if antiword and path and os.path.exists(path):
+        try:
+            result = subprocess.run([antiword, '-m', 'UTF-8.txt', path], capture_output=True, timeout=60)
+            if result.returncode == 0:
+                return result.stdout.decode('utf-8', errors='replace')
+        except subprocess.TimeoutExpired:
+            pass
+
+    data = fileobj.read()
+    runs = [m.group(0).decode('utf-16-le') for m in DOC_UTF16_RE.finditer(data)]
+    if not runs:
+        runs = [m.group(0).decode('cp1251') for m in DOC_8BIT_RE.finditer(data)]
+    text = '\n'.join(run.strip() for run in runs if any(ch.isalpha() for ch in run))
+    return text.replace('\r', '\n')
+
+
+EXTRACTORS = {
+    '.txt': extract_txt,
+    '.docx': extract_docx,
+    '.doc': extract_doc,
+}
+
+
+def extract_text(fileobj, name):
+    extractor = EXTRACTORS.get(os.path.splitext(name)[1].lower())
+    if extractor is None:
+        return ''
+    try:
+        return extractor(fileobj)
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError, UnicodeError, OSError) as exc:
+        logger.warning('Text extraction failed for %s: %s', name, exc)
+        return ''
+
+
+def hash_and_extract(path, name, skip_hashes=()):
+    """Process-pool friendly: hash and parse a file on disk, no DB access"""
+    with open(path, 'rb') as fileobj:
+        return read_and_extract(fileobj, name, skip_hashes)
+
+
+def read_and_extract(fileobj, name, skip_hashes=()):
+    """(name, sha256, size, text) of an open file; text is None for hashes in skip_hashes"""
+    sha256, size = file_sha256(fileobj)
+    if sha256 in skip_hashes:
+        return name, sha256, size, None
+    fileobj.seek(0)
+    return name, sha256, size, extract_text(fileobj, name)
+
+
+def store_result(name, sha256, size, text):
+    from .models import ExtractedText, FileDigest
+    FileDigest.objects.update_or_create(name=name, defaults={'sha256': sha256, 'size': size})
+    if text is not None:
+        ExtractedText.objects.update_or_create(sha256=sha256, defaults={'text': text})
+
+
+def digest_for(name):
+    """Return (sha256, size) of a stored file, hashing it only when unknown"""
+    from .models import FileDigest
+    size = default_storage.size(name)
+    digest = FileDigest.objects.filter(name=name, size=size).values_list('sha256', flat=True).first()
+    if digest:
+        return digest, size
+    with default_storage.open(name, 'rb') as fileobj:
+        sha256, size = file_sha256(fileobj)
+    FileDigest.objects.update_or_create(name=name, defaults={'sha256': sha256, 'size': size})
+    return sha256, size
+
+
+def extract_stored_file(name):
+    from .models import ExtractedText
+    sha256, _ = digest_for(name)
+    if ExtractedText.objects.filter(sha256=sha256).exists():
+        return
+    if os.path.splitext(name)[1].lower() not in SUPPORTED_EXTENSIONS:
+        text = ''
+    else:
+        with default_storage.open(name, 'rb') as fileobj:
+            text = extract_text(fileobj, name)
+    ExtractedText.objects.update_or_create(sha256=sha256, defaults={'text': text})
+
+
+def document_file_names(document_ids):
+    """Map document id -> storage names of its file, versions and log attachments"""
+    from workflow.models import ActionLog
+    from .models import Document, DocumentVersion
+
+    names = {doc_id: [] for doc_id in document_ids}
+    sources = [
+        Document.objects.filter(id__in=document_ids).values_list('id', 'file'),
+        DocumentVersion.objects.filter(document_id__in=document_ids).values_list('document_id', 'file'),
+        ActionLog.objects.filter(document_id__in=document_ids).values_list('document_id', 'file'),
+    ]
+    for rows in sources:
+        for doc_id, name in rows:
+            if name:
+                names[doc_id].append(name)
+    return names
+
+
+def attachment_text(document_id):
+    """Cached extracted text of all files attached to a document"""
+    from .models import ExtractedText, FileDigest
+    names = document_file_names([document_id])[document_id]
+    if not names:
+        return ''
+    hashes = FileDigest.objects.filter(name__in=names).values_list('sha256', flat=True)
+    texts = ExtractedText.objects.filter(sha256__in=hashes).exclude(text='').values_list('text', flat=True)
+    return '\n'.join(texts)
+
+
+def extract_document(document_id):
+    """Extract every file of a document and refresh its search entry"""
+    from .models import Document
+    from .search import get_backend
+
+    from .previews import generate as generate_preview
+
+    for name in document_file_names([document_id]).get(document_id, []):
+        try:
+            extract_stored_file(name)
+            generate_preview(name)
+        except OSError as exc:
+            logger.warning('Cannot read %s: %s', name, exc)
+    document = Document.objects.filter(pk=document_id).first()
+    if document is not None:
+        get_backend().index(document)
+
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, 'TEXT_EXTRACTION_WORKERS', 2)
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='text-extraction')
+    return _executor
+
+
+def _run_in_worker(document_id):
+    close_old_connections()
+    try:
+        extract_document(document_id)
+    except Exception:
+        logger.exception('Text extraction failed for document %s', document_id)
+    finally:
+        connection.close()
+
+
+def schedule_document(document_id):
+    """Queue extraction for a document once the current transaction commits"""
+    if not getattr(settings, 'TEXT_EXTRACTION_ASYNC', True):
+        transaction.on_commit(lambda: extract_document(document_id))
+        return
+    transaction.on_commit(lambda: get_executor().submit(_run_in_worker, document_id))
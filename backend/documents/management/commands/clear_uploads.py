@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents import uploads
+
+
+class Command(BaseCommand):
+    help = 'Remove resumable uploads left unfinished and partial files without a session'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=settings.CHUNKED_UPLOAD_TTL,
+                            help='Seconds a session may stay idle (CHUNKED_UPLOAD_TTL by default)')
+
+    def handle(self, *args, **options):
+        sessions, files = uploads.discard_stale(timedelta(seconds=options['max_age']))
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено незавершённых загрузок: {sessions}, лишних файлов: {files}'
+        ))
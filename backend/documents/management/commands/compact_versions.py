@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from documents import deltas
+from documents.models import DocumentVersion
+
+
+class Command(BaseCommand):
+    help = 'Store superseded document versions as binary deltas and re-base long delta chains'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--document', type=int, action='append', help='Only these document IDs')
+
+    def handle(self, *args, **options):
+        versions = DocumentVersion.objects.order_by().values_list('document_id', flat=True).distinct()
+        if options['document']:
+            versions = versions.filter(document_id__in=options['document'])
+        documents = changed = 0
+        for document_id in list(versions):
+            try:
+                changed += deltas.compact_document(document_id)
+            except (OSError, deltas.DeltaError) as exc:
+                self.stderr.write(f'Документ {document_id}: {exc}')
+                continue
+            documents += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано документов: {documents}, перекодировано версий: {changed}'
+        ))
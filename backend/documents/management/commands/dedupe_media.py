@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from documents import storage
+
+
+class Command(BaseCommand):
+    help = 'Move files into the content-addressed blob store and recount blob references'
+
+    def handle(self, *args, **options):
+        moved = storage.adopt_legacy_files()
+        kept, removed = storage.rebuild_references()
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено файлов: {moved}, уникальных файлов: {kept}, удалено лишних: {removed}'
+        ))
@@ -0,0 +1,81 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from documents import extraction, storage
+from documents.models import Document, ExtractedText
+from documents.search import get_backend
+
+_skip_hashes = frozenset()
+
+
+def _init_worker(skip_hashes):
+    global _skip_hashes
+    _skip_hashes = skip_hashes
+
+
+def _process(path, name):
+    return extraction.hash_and_extract(path, name, _skip_hashes)
+
+
+def stored_names():
+    """Storage names of every document file, version and action attachment with extractable text"""
+    names = set()
+    for model in storage.file_models():
+        rows = model.objects.exclude(file='').exclude(file__isnull=True).values_list('file', flat=True)
+        for name in rows.iterator():
+            if name.lower().endswith(extraction.SUPPORTED_EXTENSIONS):
+                names.add(name)
+    return sorted(names)
+
+
+class Command(BaseCommand):
+    help = 'Re-extract text from stored files in parallel and refresh the search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Worker processes')
+        parser.add_argument('--force', action='store_true', help='Re-extract files whose text is already cached')
+
+    def handle(self, *args, **options):
+        files = stored_names()
+        self.stdout.write(f'Найдено файлов: {len(files)}')
+
+        skip = frozenset() if options['force'] else frozenset(ExtractedText.objects.values_list('sha256', flat=True))
+        names = []
+        # Workers read whole files by path; delta-encoded versions are rebuilt here
+        on_disk = [name for name in files if not default_storage.is_delta(name)]
+        for name in set(files) - set(on_disk):
+            try:
+                with default_storage.open(name, 'rb') as fileobj:
+                    result = extraction.read_and_extract(fileobj, name, skip)
+            except OSError as exc:
+                self.stderr.write(f'Ошибка чтения: {exc}')
+                continue
+            extraction.store_result(*result)
+            names.append(name)
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker, initargs=(skip,)) as pool:
+            futures = [pool.submit(_process, default_storage.path(name), name) for name in on_disk]
+            for future in as_completed(futures):
+                try:
+                    name, sha256, size, text = future.result()
+                except OSError as exc:
+                    self.stderr.write(f'Ошибка чтения: {exc}')
+                    continue
+                extraction.store_result(name, sha256, size, text)
+                names.append(name)
+
+        document_ids = set()
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            document_ids.update(Document.objects.filter(
+                Q(file__in=chunk) | Q(versions__file__in=chunk) | Q(logs__file__in=chunk)
+            ).values_list('id', flat=True))
+        backend = get_backend()
+        for document in Document.objects.filter(id__in=document_ids).iterator():
+            backend.index(document)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано файлов: {len(names)}, переиндексировано документов: {len(document_ids)}'
+        ))
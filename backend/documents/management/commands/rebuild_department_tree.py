@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from documents import department_tree
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the department closure table from Department.parent'
+
+    def handle(self, *args, **options):
+        total = department_tree.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Связей подразделений: {total}'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from documents import access
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized document visibility table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Documents per batch')
+
+    def handle(self, *args, **options):
+        total = access.rebuild_all(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Доступы пересчитаны для {total} документов'))
@@ -0,0 +1,48 @@
+# Generated by Django 6.0 on 2026-10-18 05:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def populate_access(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Document = apps.get_model('documents', 'Document')
+    DocumentAccess = apps.get_model('documents', 'DocumentAccess')
+    for user in User.objects.exclude(role__in=['admin', 'rector', 'secretary']):
+        q = Q(creator=user) | Q(assignments__assignee=user)
+        if user.role in ['prorector', 'dept_head']:
+            q |= Q(current_approver=user) | Q(assignments__assigned_by=user)
+            if user.department_id:
+                q |= Q(creator__department_id=user.department_id)
+        document_ids = Document.objects.filter(q).values_list('id', flat=True).distinct()
+        DocumentAccess.objects.bulk_create(
+            [DocumentAccess(user_id=user.id, document_id=doc_id) for doc_id in document_ids],
+            ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0004_document_list_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_entries', to='documents.document', verbose_name='Документ')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_access', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Доступ к документу',
+                'verbose_name_plural': 'Доступы к документам',
+                'constraints': [models.UniqueConstraint(fields=('user', 'document'), name='unique_document_access')],
+            },
+        ),
+        migrations.RunPython(populate_access, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 6.0 on 2026-10-18 06:10
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Document = apps.get_model('documents', 'Document')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS documents_search_index USING fts5("
+            "title, registration_number, content, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        for doc in Document.objects.only('id', 'title', 'registration_number', 'content').iterator():
+            cursor.execute(
+                'INSERT INTO documents_search_index (rowid, title, registration_number, content) '
+                'VALUES (%s, %s, %s, %s)',
+                [doc.id, doc.title.replace('ё', 'е').replace('Ё', 'Е'), doc.registration_number,
+                 doc.content.replace('ё', 'е').replace('Ё', 'Е')]
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS documents_search_index')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_documentaccess'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 6.0 on 2026-10-18 05:39
+
+from django.db import migrations, models
+
+
+def add_attachments_column(apps, schema_editor):
+    """FTS5 tables cannot be altered, so recreate the index with the new column"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Document = apps.get_model('documents', 'Document')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS documents_search_index')
+        cursor.execute(
+            "CREATE VIRTUAL TABLE documents_search_index USING fts5("
+            "title, registration_number, content, attachments, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        for doc in Document.objects.only('id', 'title', 'registration_number', 'content').iterator():
+            cursor.execute(
+                'INSERT INTO documents_search_index (rowid, title, registration_number, content, attachments) '
+                "VALUES (%s, %s, %s, %s, '')",
+                [doc.id, doc.title.replace('ё', 'е').replace('Ё', 'Е'), doc.registration_number,
+                 doc.content.replace('ё', 'е').replace('Ё', 'Е')]
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_document_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractedText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('text', models.TextField(blank=True, verbose_name='Текст')),
+                ('extracted_at', models.DateTimeField(auto_now=True, verbose_name='Дата извлечения')),
+            ],
+            options={
+                'verbose_name': 'Извлеченный текст',
+                'verbose_name_plural': 'Извлеченные тексты',
+            },
+        ),
+        migrations.CreateModel(
+            name='FileDigest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Имя файла в хранилище')),
+                ('sha256', models.CharField(db_index=True, max_length=64, verbose_name='SHA-256')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер')),
+            ],
+            options={
+                'verbose_name': 'Хэш файла',
+                'verbose_name_plural': 'Хэши файлов',
+            },
+        ),
+        migrations.RunPython(add_attachments_column, migrations.RunPython.noop),
+    ]
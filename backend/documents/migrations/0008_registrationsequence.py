@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 05:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_extracted_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField(verbose_name='Год')),
+                ('last_number', models.PositiveIntegerField(default=0, verbose_name='Последний номер')),
+                ('document_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='registration_sequences', to='documents.documenttype', verbose_name='Тип документа')),
+            ],
+            options={
+                'verbose_name': 'Счетчик регистрации',
+                'verbose_name_plural': 'Счетчики регистрации',
+                'constraints': [models.UniqueConstraint(fields=('year', 'document_type'), name='unique_registration_sequence')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+def replay_action_logs(apps, schema_editor):
+    """
+    Derive the route step of pending documents from their history:
+    submission starts at step 0 and every approval since then moves one
+    step forward, exactly as the old role-scanning approve() did.
+    """
+    Document = apps.get_model('documents', 'Document')
+    ActionLog = apps.get_model('workflow', 'ActionLog')
+    ApprovalRoute = apps.get_model('workflow', 'ApprovalRoute')
+
+    pending = dict(Document.objects.filter(status='pending').values_list('id', 'document_type_id'))
+    if not pending:
+        return
+    route_lengths = {}
+    for type_id in ApprovalRoute.objects.values_list('document_type_id', flat=True):
+        route_lengths[type_id] = route_lengths.get(type_id, 0) + 1
+
+    steps = dict.fromkeys(pending, 0)
+    logs = ActionLog.objects.filter(
+        document_id__in=list(pending), action__in=['submitted', 'approved', 'rejected', 'returned']
+    ).order_by('document_id', 'timestamp', 'id').values_list('document_id', 'action')
+    for document_id, action in logs.iterator():
+        steps[document_id] = steps[document_id] + 1 if action == 'approved' else 0
+
+    for document_id, step in steps.items():
+        # Routes may have been shortened since the document was submitted
+        step = min(step, max(route_lengths.get(pending[document_id], 0) - 1, 0))
+        if step:
+            Document.objects.filter(pk=document_id).update(current_step=step)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_registrationsequence'),
+        ('workflow', '0004_statistics_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='current_step',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Текущий этап согласования'),
+        ),
+        migrations.RunPython(replay_action_logs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 6.0 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_closure(apps, schema_editor):
+    Department = apps.get_model('documents', 'Department')
+    DepartmentClosure = apps.get_model('documents', 'DepartmentClosure')
+    parents = dict(Department.objects.values_list('id', 'parent_id'))
+    rows = []
+    for department_id in parents:
+        ancestor_id, depth, seen = department_id, 0, set()
+        while ancestor_id is not None and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            rows.append(DepartmentClosure(ancestor_id=ancestor_id, descendant_id=department_id, depth=depth))
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+    DepartmentClosure.objects.bulk_create(rows, batch_size=1000)
+
+
+def grant_branch_access(apps, schema_editor):
+    """Managers now also see documents from departments below their own"""
+    User = apps.get_model('users', 'User')
+    Document = apps.get_model('documents', 'Document')
+    DocumentAccess = apps.get_model('documents', 'DocumentAccess')
+    managers = User.objects.filter(role__in=['prorector', 'dept_head'], department__isnull=False)
+    for user_id, department_id in managers.values_list('id', 'department_id'):
+        document_ids = Document.objects.filter(
+            creator__department__ancestor_links__ancestor_id=department_id
+        ).values_list('id', flat=True)
+        DocumentAccess.objects.bulk_create(
+            [DocumentAccess(user_id=user_id, document_id=doc_id) for doc_id in document_ids],
+            ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_document_current_step'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepartmentClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField(verbose_name='Глубина')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='documents.department', verbose_name='Предок')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='documents.department', verbose_name='Потомок')),
+            ],
+            options={
+                'verbose_name': 'Связь подразделений',
+                'verbose_name_plural': 'Связи подразделений',
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_department_closure')],
+            },
+        ),
+        migrations.RunPython(populate_closure, migrations.RunPython.noop),
+        migrations.RunPython(grant_branch_access, migrations.RunPython.noop),
+    ]
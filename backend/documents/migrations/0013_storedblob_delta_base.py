@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0012_storedblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedblob',
+            name='delta_base',
+            field=models.CharField(blank=True, db_index=True, max_length=64, verbose_name='Базовый файл дельты'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0013_storedblob_delta_base'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='documentversion',
+            constraint=models.UniqueConstraint(fields=('document', 'version_number'), name='unique_document_version'),
+        ),
+    ]
@@ -1,5 +1,8 @@
-from django.db import models
+import uuid
+
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
+from django.utils import timezone
 
 class Department(models.Model):
     name = models.CharField(max_length=200, verbose_name='Название')
@@ -13,6 +16,25 @@ class Department(models.Model):
     def __str__(self):
         return self.name
 
+    def subtree_ids(self):
+        """IDs of this department and all of its descendants"""
+        return list(DepartmentClosure.objects.filter(ancestor=self).values_list('descendant_id', flat=True))
+
+
+class DepartmentClosure(models.Model):
+    """Every (ancestor, descendant) pair of the department tree, maintained by documents.department_tree"""
+    ancestor = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='descendant_links', verbose_name='Предок')
+    descendant = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='ancestor_links', verbose_name='Потомок')
+    depth = models.PositiveSmallIntegerField(verbose_name='Глубина')
+
+    class Meta:
+        verbose_name = 'Связь подразделений'
+        verbose_name_plural = 'Связи подразделений'
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_department_closure'),
+        ]
+
+
 class DocumentType(models.Model):
     name = models.CharField(max_length=100, verbose_name='Название типа')
     
@@ -47,8 +69,9 @@ class Document(models.Model):
     creator = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name='created_documents', verbose_name='Создатель')
     current_approver = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='documents_to_approve', verbose_name='Текущий согласующий')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft', verbose_name='Статус')
+    current_step = models.PositiveSmallIntegerField(default=0, verbose_name='Текущий этап согласования')
     priority = models.CharField(max_length=20, choices=PRIORITY_CHOICES, default='medium', verbose_name='Приоритет')
-    file = models.FileField(upload_to='documents/%Y/%m/%d/', blank=True, null=True, verbose_name='Файл')
+    file = models.FileField(upload_to='documents/%Y/%m/%d/', max_length=255, blank=True, null=True, verbose_name='Файл')
     deadline = models.DateField(null=True, blank=True, verbose_name='Срок исполнения')
     registration_number = models.CharField(max_length=50, blank=True, verbose_name='Регистрационный номер')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
@@ -58,27 +81,79 @@ class Document(models.Model):
         verbose_name = 'Документ'
         verbose_name_plural = 'Документы'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='document_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='document_status_created_idx'),
+            models.Index(fields=['priority', '-created_at', '-id'], name='document_priority_created_idx'),
+            models.Index(fields=['deadline'], name='document_deadline_idx'),
+        ]
 
     def __str__(self):
         return f"{self.registration_number or 'Б/Н'} - {self.title}"
 
     def save(self, *args, **kwargs):
         if not self.registration_number and self.status != 'draft':
-            # Auto-generate registration number
-            from django.utils import timezone
-            current_year = timezone.now().year
-            last_doc = Document.objects.exclude(registration_number='').order_by('-id').first()
-            if last_doc and last_doc.registration_number:
-                try:
-                    last_num = int(last_doc.registration_number.split('-')[-1])
-                    self.registration_number = f"{current_year}-{last_num + 1:05d}"
-                except:
-                    self.registration_number = f"{current_year}-00001"
-            else:
-                self.registration_number = f"{current_year}-00001"
+            self.registration_number = RegistrationSequence.next_number(self.document_type_id)
         super().save(*args, **kwargs)
 
 
+class RegistrationSequence(models.Model):
+    """Per-year, per-type counter behind registration numbers"""
+    year = models.PositiveIntegerField(verbose_name='Год')
+    document_type = models.ForeignKey(DocumentType, on_delete=models.CASCADE, related_name='registration_sequences', verbose_name='Тип документа')
+    last_number = models.PositiveIntegerField(default=0, verbose_name='Последний номер')
+
+    class Meta:
+        verbose_name = 'Счетчик регистрации'
+        verbose_name_plural = 'Счетчики регистрации'
+        constraints = [
+            models.UniqueConstraint(fields=['year', 'document_type'], name='unique_registration_sequence'),
+        ]
+
+    @staticmethod
+    def format_number(year, document_type_id, number):
+        return f"{year}-{document_type_id}-{number:05d}"
+
+    @classmethod
+    def reserve(cls, document_type_id, count=1, year=None):
+        """
+        Atomically take `count` consecutive numbers and return them as a range.
+        The conditional UPDATE locks the counter row until the surrounding
+        transaction ends, so parallel callers never get the same number.
+        """
+        year = year or timezone.now().year
+        counter = cls.objects.filter(year=year, document_type_id=document_type_id)
+        with transaction.atomic():
+            if not counter.update(last_number=models.F('last_number') + count):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(year=year, document_type_id=document_type_id, last_number=count)
+                except IntegrityError:
+                    # Another request created the counter first
+                    counter.update(last_number=models.F('last_number') + count)
+            last = counter.values_list('last_number', flat=True).get()
+        return range(last - count + 1, last + 1)
+
+    @classmethod
+    def next_number(cls, document_type_id):
+        year = timezone.now().year
+        number = cls.reserve(document_type_id, year=year)[0]
+        return cls.format_number(year, document_type_id, number)
+
+
+class DocumentAccess(models.Model):
+    """Materialized (user, document) visibility, maintained by documents.access"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='document_access', verbose_name='Пользователь')
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='access_entries', verbose_name='Документ')
+
+    class Meta:
+        verbose_name = 'Доступ к документу'
+        verbose_name_plural = 'Доступы к документам'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'document'], name='unique_document_access'),
+        ]
+
+
 class DocumentAssignment(models.Model):
     """Assignment of document to executor"""
     STATUS_CHOICES = (
@@ -112,7 +187,7 @@ class DocumentAssignment(models.Model):
 
 class DocumentVersion(models.Model):
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='versions', verbose_name='Документ')
-    file = models.FileField(upload_to='documents/versions/%Y/%m/%d/', verbose_name='Файл версии')
+    file = models.FileField(upload_to='documents/versions/%Y/%m/%d/', max_length=255, verbose_name='Файл версии')
     version_number = models.PositiveIntegerField(verbose_name='Номер версии')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     creator = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, verbose_name='Автор версии')
@@ -121,3 +196,96 @@ class DocumentVersion(models.Model):
         verbose_name = 'Версия документа'
         verbose_name_plural = 'Версии документов'
         ordering = ['-version_number']
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'version_number'], name='unique_document_version'),
+        ]
+
+    @classmethod
+    def next_number(cls, document_id):
+        """
+        Number for a new version of a document; call it inside a transaction.
+        Touching the document row locks it until the transaction ends, so
+        parallel uploads wait for each other instead of reading the same
+        maximum.
+        """
+        Document.objects.filter(pk=document_id).update(updated_at=timezone.now())
+        last = cls.objects.filter(document_id=document_id).aggregate(last=models.Max('version_number'))['last']
+        return (last or 0) + 1
+
+
+class FileDigest(models.Model):
+    """SHA-256 of a stored file, keyed by its storage name"""
+    name = models.CharField(max_length=255, unique=True, verbose_name='Имя файла в хранилище')
+    sha256 = models.CharField(max_length=64, db_index=True, verbose_name='SHA-256')
+    size = models.PositiveBigIntegerField(verbose_name='Размер')
+
+    class Meta:
+        verbose_name = 'Хэш файла'
+        verbose_name_plural = 'Хэши файлов'
+
+
+class ExtractedText(models.Model):
+    """Plain text extracted from a file, cached by content hash"""
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name='SHA-256')
+    text = models.TextField(blank=True, verbose_name='Текст')
+    extracted_at = models.DateTimeField(auto_now=True, verbose_name='Дата извлечения')
+
+    class Meta:
+        verbose_name = 'Извлеченный текст'
+        verbose_name_plural = 'Извлеченные тексты'
+
+
+class UploadSession(models.Model):
+    """A resumable upload; chunks are written to a partial file until it is finalized"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions', verbose_name='Пользователь')
+    filename = models.CharField(max_length=255, verbose_name='Имя файла')
+    size = models.PositiveBigIntegerField(verbose_name='Размер')
+    received = models.PositiveBigIntegerField(default=0, verbose_name='Получено байт')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Сессия загрузки'
+        verbose_name_plural = 'Сессии загрузки'
+
+
+class StoredBlob(models.Model):
+    """A file of ContentAddressedStorage and how many file fields point at it"""
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name='SHA-256')
+    size = models.PositiveBigIntegerField(verbose_name='Размер')
+    references = models.PositiveIntegerField(default=0, verbose_name='Число ссылок')
+    # Set while the blob is kept as a binary delta against another one (documents.deltas)
+    delta_base = models.CharField(max_length=64, blank=True, db_index=True, verbose_name='Базовый файл дельты')
+
+    class Meta:
+        verbose_name = 'Файл хранилища'
+        verbose_name_plural = 'Файлы хранилища'
+
+    @classmethod
+    def acquire(cls, sha256, size):
+        """
+        Add a reference. The UPDATE locks the row until the surrounding
+        transaction ends, so a concurrent release() cannot drop the blob
+        between this call and the caller's check that its file exists.
+        """
+        blob = cls.objects.filter(sha256=sha256)
+        if not blob.update(references=models.F('references') + 1):
+            try:
+                with transaction.atomic():
+                    cls.objects.create(sha256=sha256, size=size, references=1)
+            except IntegrityError:
+                blob.update(references=models.F('references') + 1)
+
+    @classmethod
+    def release(cls, sha256):
+        """Drop a reference; True when none are left and the row was deleted"""
+        cls.objects.filter(sha256=sha256, references__gt=0).update(references=models.F('references') - 1)
+        return cls.collect(sha256)
+
+    @classmethod
+    def collect(cls, sha256):
+        """Delete an unreferenced row unless deltas are still based on it; True if deleted"""
+        if cls.objects.filter(delta_base=sha256).exists():
+            return False
+        return bool(cls.objects.filter(sha256=sha256, references=0).delete()[0])
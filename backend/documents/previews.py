@@ -0,0 +1,201 @@
+"""
+File previews.
+
+Images get a JPEG thumbnail (Pillow, when installed; JPEGs are decoded at
+reduced scale, so multi-megabyte photos are cheap), text formats get the
+opening of their extracted text. Previews are generated in the text
+extraction worker, once per SHA-256, into PREVIEW_CACHE_DIR:
+
+    PREVIEW_CACHE_DIR/3f/3fa2...e1.jpg
+
+The directory is an LRU cache: serving a preview refreshes its mtime, and
+after each generation the least recently used files are removed until the
+total is back under PREVIEW_CACHE_MAX_BYTES. An evicted preview is simply
+generated again on the next request. A file whose preview cannot be built
+(a damaged image, say) gets an empty `.failed` marker instead, so it is not
+queued again on every request.
+"""
+import logging
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection
+
+from . import extraction
+from .storage import blob_sha256
+
+try:
+    from PIL import Image
+except ImportError:  # thumbnails are skipped without Pillow
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (320, 320)
+TEXT_PREVIEW_CHARS = 2000
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+CONTENT_TYPES = {'image': 'image/jpeg', 'text': 'text/plain; charset=utf-8'}
+SUFFIXES = {'image': '.jpg', 'text': '.txt'}
+FAILED_SUFFIX = '.failed'
+
+_pending_lock = threading.Lock()
+_pending = set()
+
+
+def preview_kind(name):
+    ext = os.path.splitext(name or '')[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        return 'image' if Image is not None else None
+    if ext in extraction.SUPPORTED_EXTENSIONS:
+        return 'text'
+    return None
+
+
+def preview_path(sha256, kind):
+    return os.path.join(settings.PREVIEW_CACHE_DIR, sha256[:2], sha256 + SUFFIXES[kind])
+
+
+def failed(name, kind):
+    """Whether building the preview of a stored file has already failed"""
+    sha256 = known_sha256(name)
+    return bool(sha256) and os.path.exists(preview_path(sha256, kind) + FAILED_SUFFIX)
+
+
+def known_sha256(name):
+    """The file's hash if it is known without reading the file"""
+    from .models import FileDigest
+    return blob_sha256(name) or FileDigest.objects.filter(name=name).values_list('sha256', flat=True).first()
+
+
+def render_thumbnail(fileobj, target):
+    with Image.open(fileobj) as image:
+        # JPEG decoders can scale down by 1/2..1/8 while decoding
+        image.draft('RGB', THUMBNAIL_SIZE)
+        image.thumbnail(THUMBNAIL_SIZE)
+        image.convert('RGB').save(target, 'JPEG', quality=80, optimize=True)
+
+
+def render_text(sha256, fileobj, name, target):
+    from .models import ExtractedText
+    text = ExtractedText.objects.filter(sha256=sha256).values_list('text', flat=True).first()
+    if text is None:
+        text = extraction.extract_text(fileobj, name)
+    if len(text) > TEXT_PREVIEW_CHARS:
+        # End on a paragraph boundary when there is one in the second half
+        cut = text.rfind('\n', TEXT_PREVIEW_CHARS // 2, TEXT_PREVIEW_CHARS)
+        text = text[:cut if cut > 0 else TEXT_PREVIEW_CHARS].rstrip() + '\n…'
+    target.write(text.encode('utf-8'))
+
+
+def generate(name):
+    """Build the preview of a stored file unless it is cached; returns its path or None"""
+    kind = preview_kind(name)
+    if kind is None:
+        return None
+    sha256, _ = extraction.digest_for(name)
+    path = preview_path(sha256, kind)
+    if os.path.exists(path):
+        return path
+    if os.path.exists(path + FAILED_SUFFIX):
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False) as target:
+        try:
+            with default_storage.open(name, 'rb') as fileobj:
+                if kind == 'image':
+                    render_thumbnail(fileobj, target)
+                else:
+                    render_text(sha256, fileobj, name, target)
+        except Exception as exc:
+            logger.warning('Preview failed for %s: %s', name, exc)
+            target.close()
+            os.remove(target.name)
+            open(path + FAILED_SUFFIX, 'wb').close()
+            return None
+    os.replace(target.name, path)
+    evict()
+    return path
+
+
+def evict():
+    """Remove least recently used previews until the cache fits PREVIEW_CACHE_MAX_BYTES"""
+    entries, total = [], 0
+    for directory, _, files in os.walk(settings.PREVIEW_CACHE_DIR):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+    if total <= settings.PREVIEW_CACHE_MAX_BYTES:
+        return
+    for _, size, path in sorted(entries):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        if total <= settings.PREVIEW_CACHE_MAX_BYTES:
+            break
+
+
+def cached_preview(name):
+    """
+    (path, content type, sha256) of a ready preview, marking it as recently
+    used. Returns None when the file has no preview format or its preview
+    could not be built, and False when the preview is not generated yet
+    (generation is then queued; without TEXT_EXTRACTION_ASYNC it runs right
+    away and its result is returned).
+    """
+    kind = preview_kind(name)
+    if kind is None:
+        return None
+    sha256 = known_sha256(name)
+    if sha256:
+        path = preview_path(sha256, kind)
+        try:
+            os.utime(path)
+            return path, CONTENT_TYPES[kind], sha256
+        except FileNotFoundError:
+            pass
+    if failed(name, kind):
+        return None
+    path = schedule(name)
+    if path:
+        return path, CONTENT_TYPES[kind], os.path.basename(path).removesuffix(SUFFIXES[kind])
+    return None if failed(name, kind) else False
+
+
+def _run_in_worker(name):
+    close_old_connections()
+    try:
+        generate(name)
+    except Exception:
+        logger.exception('Preview generation failed for %s', name)
+    finally:
+        connection.close()
+        with _pending_lock:
+            _pending.discard(name)
+
+
+def schedule(name):
+    """
+    Queue preview generation for a stored file unless it is already queued.
+    Without TEXT_EXTRACTION_ASYNC the preview is generated here and its path returned.
+    """
+    with _pending_lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    if not getattr(settings, 'TEXT_EXTRACTION_ASYNC', True):
+        try:
+            return generate(name)
+        finally:
+            with _pending_lock:
+                _pending.discard(name)
+    extraction.get_executor().submit(_run_in_worker, name)
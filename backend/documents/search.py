@@ -0,0 +1,203 @@
+"""
+Full-text search over documents.
+
+The active backend is chosen by the DOCUMENT_SEARCH_BACKEND setting; by
+default SQLite databases use an FTS5 index and other databases fall back
+to plain substring matching. Query words are stemmed and matched as
+prefixes, so different Russian word forms find each other.
+"""
+import html
+import re
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .extraction import attachment_text
+from .stemmer import stem
+
+WORD_RE = re.compile(r'[^\W_]+')
+
+# Control characters never occur in titles, so they are safe highlight markers
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+
+@dataclass
+class SearchHit:
+    document: object
+    rank: float
+    title_highlight: str
+    snippet: str
+
+
+def query_terms(query):
+    """Split a user query into stemmed search terms"""
+    terms = []
+    for word in WORD_RE.findall(query.lower().replace('ё', 'е')):
+        term = word if word.isdigit() else stem(word)
+        terms.append(term if len(term) >= 2 else word)
+    return terms
+
+
+def render_highlight(text):
+    """HTML-escape text and turn the highlight markers into <mark> tags"""
+    return html.escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+class BaseSearchBackend:
+    def index(self, document):
+        pass
+
+    def remove(self, document_id):
+        pass
+
+    def filter(self, queryset, query):
+        """Restrict a Document queryset to matches without ranking"""
+        raise NotImplementedError
+
+    def search(self, queryset, query, limit=20, offset=0):
+        """Return ranked SearchHit objects for documents in queryset"""
+        raise NotImplementedError
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Portable fallback: substring match on stems, newest first"""
+    snippet_length = 160
+
+    def filter(self, queryset, query):
+        from .models import ExtractedText, FileDigest
+        terms = query_terms(query)
+        if not terms:
+            return queryset.none()
+        for term in terms:
+            file_names = FileDigest.objects.filter(
+                sha256__in=ExtractedText.objects.filter(text__icontains=term).values('sha256')
+            ).values('name')
+            queryset = queryset.filter(
+                Q(title__icontains=term) | Q(content__icontains=term) | Q(registration_number__icontains=term) |
+                Q(file__in=file_names) | Q(versions__file__in=file_names) | Q(logs__file__in=file_names)
+            ).distinct()
+        return queryset
+
+    def search(self, queryset, query, limit=20, offset=0):
+        terms = query_terms(query)
+        documents = self.filter(queryset, query).order_by('-created_at', '-id')[offset:offset + limit]
+        return [
+            SearchHit(
+                document=doc,
+                rank=0.0,
+                title_highlight=render_highlight(self.mark(doc.title, terms)),
+                snippet=render_highlight(self.mark(self.excerpt(doc.content, terms), terms)),
+            )
+            for doc in documents
+        ]
+
+    def mark(self, text, terms):
+        def replace(match):
+            word = match.group(0)
+            if any(word.lower().replace('ё', 'е').startswith(term) for term in terms):
+                return f'{MARK_START}{word}{MARK_END}'
+            return word
+        return WORD_RE.sub(replace, text)
+
+    def excerpt(self, text, terms):
+        lowered = text.lower().replace('ё', 'е')
+        positions = [lowered.find(term) for term in terms if term in lowered]
+        start = max(min(positions) - self.snippet_length // 4, 0) if positions else 0
+        excerpt = text[start:start + self.snippet_length]
+        if start > 0:
+            excerpt = '…' + excerpt
+        if start + self.snippet_length < len(text):
+            excerpt += '…'
+        return excerpt
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """SQLite FTS5 index with bm25 ranking; rowid is the document id"""
+    table = 'documents_search_index'
+    # bm25 weights for title, registration_number, content, attachments
+    weights = (10.0, 5.0, 1.0, 0.5)
+    snippet_tokens = 16
+
+    def index(self, document):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [document.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, registration_number, content, attachments) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                [document.pk, self.normalize(document.title), document.registration_number,
+                 self.normalize(document.content), self.normalize(attachment_text(document.pk))]
+            )
+
+    def remove(self, document_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [document_id])
+
+    def normalize(self, text):
+        # unicode61 does not fold ё into е; keep lengths so highlights line up
+        return (text or '').replace('ё', 'е').replace('Ё', 'Е')
+
+    def match_expression(self, query):
+        terms = query_terms(query)
+        return ' AND '.join(f'"{term}"*' for term in terms)
+
+    def filter(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [expression]
+        ))
+
+    def search(self, queryset, query, limit=20, offset=0):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        visible_sql, visible_params = queryset.order_by().values('id').query.sql_with_params()
+        sql = (
+            f"SELECT rowid, bm25({self.table}, %s, %s, %s, %s) AS rank, "
+            f"highlight({self.table}, 0, %s, %s), "
+            f"snippet({self.table}, -1, %s, %s, '…', %s) "
+            f"FROM {self.table} "
+            f"WHERE {self.table} MATCH %s AND rowid IN ({visible_sql}) "
+            f"ORDER BY rank LIMIT %s OFFSET %s"
+        )
+        params = [
+            *self.weights, MARK_START, MARK_END, MARK_START, MARK_END, self.snippet_tokens,
+            expression, *visible_params, limit, offset
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        documents = queryset.in_bulk([row[0] for row in rows])
+        return [
+            SearchHit(
+                document=documents[doc_id],
+                rank=rank,
+                title_highlight=render_highlight(title),
+                snippet=render_highlight(snippet),
+            )
+            for doc_id, rank, title, snippet in rows
+            if doc_id in documents
+        ]
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'DOCUMENT_SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == 'sqlite':
+            _backend = SQLiteFTSBackend()
+        else:
+            _backend = DatabaseSearchBackend()
+    return _backend
@@ -1,5 +1,8 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import Department, DocumentType, Document, DocumentAssignment, DocumentVersion
+from .models import Department, DocumentType, Document, DocumentAssignment, DocumentVersion, UploadSession
+from .department_tree import would_create_cycle
+from .serving import download_url
 from users.serializers import UserListSerializer
 
 class DepartmentSerializer(serializers.ModelSerializer):
@@ -9,6 +12,11 @@ class DepartmentSerializer(serializers.ModelSerializer):
         model = Department
         fields = ['id', 'name', 'parent', 'head', 'head_name']
 
+    def validate_parent(self, parent):
+        if parent is not None and self.instance is not None and would_create_cycle(self.instance, parent.id):
+            raise serializers.ValidationError('Подразделение не может входить само в себя')
+        return parent
+
 
 class DocumentTypeSerializer(serializers.ModelSerializer):
     class Meta:
@@ -18,10 +26,23 @@ class DocumentTypeSerializer(serializers.ModelSerializer):
 
 class DocumentVersionSerializer(serializers.ModelSerializer):
     creator_name = serializers.CharField(source='creator.get_full_name', read_only=True, allow_null=True)
+    file_url = serializers.SerializerMethodField()
 
     class Meta:
         model = DocumentVersion
-        fields = ['id', 'document', 'file', 'version_number', 'created_at', 'creator', 'creator_name']
+        fields = ['id', 'document', 'file', 'file_url', 'version_number', 'created_at', 'creator', 'creator_name']
+
+    def get_file_url(self, obj):
+        return download_url(self.context.get('request'), 'version', obj)
+
+
+class DocumentVersionListSerializer(DocumentVersionSerializer):
+    """Versions from versions.version_list(), with size and hash annotated"""
+    size = serializers.IntegerField(read_only=True, allow_null=True)
+    sha256 = serializers.CharField(read_only=True, allow_null=True)
+
+    class Meta(DocumentVersionSerializer.Meta):
+        fields = DocumentVersionSerializer.Meta.fields + ['size', 'sha256']
 
 
 class DocumentAssignmentSerializer(serializers.ModelSerializer):
@@ -41,6 +62,13 @@ class DocumentAssignmentSerializer(serializers.ModelSerializer):
         read_only_fields = ['assigned_by', 'signature', 'signed_at', 'created_at', 'updated_at']
 
 
+def pending_approvers(document):
+    """Users who still have to sign the current (possibly parallel) stage"""
+    return document.stage_approvals.filter(
+        step=document.current_step, approved_at__isnull=True, approver__isnull=False
+    ).values_list('approver_id', flat=True)
+
+
 class DocumentSerializer(serializers.ModelSerializer):
     creator_name = serializers.CharField(source='creator.get_full_name', read_only=True)
     type_name = serializers.CharField(source='document_type.name', read_only=True)
@@ -49,18 +77,33 @@ class DocumentSerializer(serializers.ModelSerializer):
     current_approver_name = serializers.CharField(source='current_approver.get_full_name', read_only=True, allow_null=True)
     assignments = DocumentAssignmentSerializer(many=True, read_only=True)
     versions = DocumentVersionSerializer(many=True, read_only=True)
+    pending_approvers = serializers.SerializerMethodField()
+    file_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Document
         fields = [
             'id', 'title', 'content', 'document_type', 'type_name',
             'registration_number', 'creator', 'creator_name',
-            'current_approver', 'current_approver_name',
+            'current_approver', 'current_approver_name', 'current_step', 'pending_approvers',
             'status', 'status_display', 'priority', 'priority_display',
-            'file', 'deadline', 'created_at', 'updated_at',
+            'file', 'file_url', 'deadline', 'created_at', 'updated_at',
             'assignments', 'versions'
         ]
-        read_only_fields = ['creator', 'registration_number', 'created_at', 'updated_at', 'status', 'current_approver']
+        read_only_fields = [
+            'creator', 'registration_number', 'created_at', 'updated_at', 'status', 'current_approver', 'current_step'
+        ]
+
+    def get_file_url(self, obj):
+        return download_url(self.context.get('request'), 'document', obj)
+
+    def get_pending_approvers(self, obj):
+        if obj.status != 'pending':
+            return []
+        if hasattr(obj, 'pending_approver_ids'):
+            # Loaded up front by the async detail view, which cannot query here
+            return obj.pending_approver_ids
+        return list(pending_approvers(obj))
 
     def create(self, validated_data):
         user = self.context['request'].user
@@ -74,7 +117,8 @@ class DocumentListSerializer(serializers.ModelSerializer):
     type_name = serializers.CharField(source='document_type.name', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     priority_display = serializers.CharField(source='get_priority_display', read_only=True)
-    assignment_count = serializers.IntegerField(source='assignments.count', read_only=True)
+    # Annotated by DocumentViewSet.get_queryset
+    assignment_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Document
@@ -83,3 +127,15 @@ class DocumentListSerializer(serializers.ModelSerializer):
             'creator', 'creator_name', 'status', 'status_display',
             'priority', 'priority_display', 'deadline', 'created_at', 'assignment_count'
         ]
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'received', 'created_at']
+        read_only_fields = ['received']
+
+    def validate_size(self, size):
+        if size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError('Файл превышает максимально допустимый размер')
+        return size
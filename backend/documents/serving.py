@@ -0,0 +1,214 @@
+"""
+Permission-checked file downloads.
+
+download() serves the file of a Document, DocumentVersion or ActionLog
+after checking that the requesting user may see the document. Requests
+come either with the usual JWT header or, for plain links and <embed>
+viewers that cannot send one, with a signed token from download_url()
+that names the user and the object.
+
+Once access is settled the transfer goes to the front server when
+FILE_SERVING_BACKEND says so (nginx X-Accel-Redirect or X-Sendfile);
+otherwise Django answers itself: If-None-Match/If-Modified-Since give
+304, a single byte range gives 206, and full files go out through
+FileResponse, which uses the server's wsgi.file_wrapper (sendfile).
+Under ASGI the body is an async iterator whose blocks are read in the
+thread pool, so a slow client does not hold a thread while it waits.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from rest_framework.exceptions import NotAuthenticated
+
+from .access import visible_documents
+from .export import COPY_BLOCK
+from .storage import blob_sha256
+
+TOKEN_SALT = 'documents.download'
+
+# kind -> (model, path from the model to the document ID, URL name)
+DOWNLOAD_KINDS = {
+    'document': ('documents.Document', 'id', 'document-download'),
+    'version': ('documents.DocumentVersion', 'document_id', 'document-version-download'),
+    'log': ('workflow.ActionLog', 'document_id', 'actionlog-download'),
+}
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def download_url(request, kind, obj):
+    """Absolute download link for obj's file, signed for the requesting user"""
+    if not obj.file or request is None or not request.user.is_authenticated:
+        return None
+    url_name = DOWNLOAD_KINDS[kind][2]
+    if kind == 'version':
+        url = reverse(url_name, kwargs={'pk': obj.document_id, 'version_id': obj.pk})
+    else:
+        url = reverse(url_name, kwargs={'pk': obj.pk})
+    token = signing.dumps([request.user.pk, kind, obj.pk], salt=TOKEN_SALT)
+    return request.build_absolute_uri(f'{url}?token={token}')
+
+
+def token_users(request, kind, object_id):
+    """Active users matching the request's signed token for this object (none if it is invalid)"""
+    users = get_user_model().objects.filter(is_active=True)
+    token = request.query_params.get('token')
+    if token:
+        try:
+            user_id, token_kind, token_object = signing.loads(
+                token, salt=TOKEN_SALT, max_age=settings.DOWNLOAD_TOKEN_MAX_AGE
+            )
+        except signing.BadSignature:
+            return users.none()
+        if token_kind == kind and str(token_object) == str(object_id):
+            return users.filter(pk=user_id)
+    return users.none()
+
+
+def download_user(request, kind, object_id):
+    """The authenticated user, or the one a valid token was issued to for this object"""
+    if request.user.is_authenticated:
+        return request.user
+    return token_users(request, kind, object_id).first()
+
+
+def download_objects(user, kind, object_id, **filters):
+    label, document_path, _ = DOWNLOAD_KINDS[kind]
+    return apps.get_model(label).objects.filter(
+        pk=object_id, **{f'{document_path}__in': visible_documents(user).order_by().values('id')}, **filters
+    )
+
+
+def download(request, kind, object_id, **filters):
+    """Serve the file of a Document, DocumentVersion or ActionLog the user may see"""
+    user = download_user(request, kind, object_id)
+    if user is None:
+        raise NotAuthenticated()
+    obj = download_objects(user, kind, object_id, **filters).first()
+    if obj is None or not obj.file:
+        raise Http404
+    return serve_file(request, obj.file.name)
+
+
+def file_etag(name, size, modified):
+    sha256 = blob_sha256(name)
+    if sha256 is None:
+        from .models import FileDigest
+        sha256 = FileDigest.objects.filter(name=name, size=size).values_list('sha256', flat=True).first()
+    return f'"{sha256 or f"{size:x}-{int(modified.timestamp()):x}"}"'
+
+
+def requested_range(request, size, etag, modified):
+    """(start, end) of a satisfiable single Range, None for the whole file, False if unsatisfiable"""
+    header = request.headers.get('Range')
+    if not header:
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != int(modified.timestamp()):
+        return None
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        # Multiple ranges and other units are answered with the whole file
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def read_range(name, start, length):
+    with default_storage.open(name, 'rb') as fileobj:
+        fileobj.seek(start)
+        while length > 0:
+            block = fileobj.read(min(COPY_BLOCK, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+async def aread_range(name, start, length):
+    """read_range() for ASGI: blocks are read in the thread pool, the event loop only waits"""
+    blocks = read_range(name, start, length)
+    read = sync_to_async(next, thread_sensitive=False)
+    try:
+        while (block := await read(blocks, None)) is not None:
+            yield block
+    finally:
+        await sync_to_async(blocks.close, thread_sensitive=False)()
+
+
+def is_asgi(request):
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def transfer(request, name, size, etag, modified, content_type):
+    # Delta-encoded versions exist only once rebuilt, so Django sends those
+    backend = 'django' if default_storage.is_delta(name) else settings.FILE_SERVING_BACKEND
+    if backend == 'x-accel':
+        # nginx serves the file from an internal location, ranges included
+        relative = os.path.relpath(default_storage.path(name), default_storage.location)
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(settings.FILE_SERVING_ACCEL_PREFIX + relative.replace(os.sep, '/'))
+        return response
+    if backend == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = default_storage.path(name)
+        return response
+
+    byte_range = requested_range(request, size, etag, modified)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if is_asgi(request):
+        reader = aread_range
+    elif byte_range is None:
+        return FileResponse(default_storage.open(name, 'rb'), content_type=content_type)
+    else:
+        reader = read_range
+    start, end = byte_range or (0, size - 1)
+    response = StreamingHttpResponse(
+        reader(name, start, end - start + 1), status=206 if byte_range else 200, content_type=content_type
+    )
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(end - start + 1)
+    return response
+
+
+def serve_file(request, name):
+    try:
+        size = default_storage.size(name)
+        modified = default_storage.get_modified_time(name)
+    except OSError:
+        raise Http404
+    etag = file_etag(name, size, modified)
+    response = get_conditional_response(request, etag=etag, last_modified=int(modified.timestamp()))
+    if response is None:
+        filename = os.path.basename(name)
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = transfer(request, name, size, etag, modified, content_type)
+        response['Content-Disposition'] = content_disposition_header(False, filename)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified.timestamp())
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,160 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from users import hierarchy
+
+from . import access, department_tree, extraction, search, storage
+from .models import Department, Document, DocumentAssignment, DocumentVersion, FileDigest
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Document)
+def document_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    access.rebuild_for_documents([instance.pk])
+    search.get_backend().index(instance)
+    schedule_extraction(instance, instance.pk)
+
+
+@receiver(post_delete, sender=Document)
+def document_deleted(sender, instance, **kwargs):
+    search.get_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=DocumentAssignment)
+@receiver(post_delete, sender=DocumentAssignment)
+def assignment_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if Document.objects.filter(pk=instance.document_id).exists():
+        access.rebuild_for_documents([instance.document_id])
+
+
+@receiver(pre_save, sender=User)
+def remember_user_scope(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        instance._access_scope = None
+        return
+    instance._access_scope = User.objects.filter(pk=instance.pk).values_list(
+        'role', 'department_id', 'supervisor_id'
+    ).first()
+
+
+def chain_documents(user):
+    """Documents of the user and of everyone below them in the supervisor chain"""
+    return Document.objects.filter(
+        creator_id__in=hierarchy.subordinate_ids(user) | {user.pk}
+    ).values_list('id', flat=True)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_access_scope', None)
+    if created and instance.role not in access.SCOPED_MANAGER_ROLES:
+        # A new user has no documents yet; only managers see existing ones
+        return
+    if not created and previous == (instance.role, instance.department_id, instance.supervisor_id):
+        return
+    if created or previous is None or previous[:2] != (instance.role, instance.department_id):
+        access.rebuild_for_user(instance)
+    if created:
+        return
+    if previous is None or previous[2] != instance.supervisor_id:
+        # Managers above the old and new supervisor see a different chain now
+        access.rebuild_for_documents(chain_documents(instance))
+    elif previous[1] != instance.department_id:
+        # Department managers' view of this user's documents changed as well
+        access.rebuild_for_documents(
+            Document.objects.filter(creator=instance).values_list('id', flat=True)
+        )
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # Subordinates lose their supervisor through a plain UPDATE
+    instance._chain_documents = list(chain_documents(instance))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    access.rebuild_for_documents(getattr(instance, '_chain_documents', []))
+
+
+def schedule_extraction(instance, document_id):
+    """Queue text extraction for a newly stored file"""
+    if instance.file and not FileDigest.objects.filter(name=instance.file.name).exists():
+        extraction.schedule_document(document_id)
+
+
+@receiver(post_save, sender=DocumentVersion)
+@receiver(post_save, sender='workflow.ActionLog')
+def attachment_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_extraction(instance, instance.document_id)
+
+
+@receiver(post_init, sender=Document)
+@receiver(post_init, sender=DocumentVersion)
+@receiver(post_init, sender='workflow.ActionLog')
+def remember_file(sender, instance, **kwargs):
+    # A str here is the name loaded from the database; new files arrive as File objects
+    value = instance.__dict__.get('file')
+    instance._stored_file = value if isinstance(value, str) else None
+
+
+@receiver(post_save, sender=Document)
+@receiver(post_save, sender=DocumentVersion)
+@receiver(post_save, sender='workflow.ActionLog')
+def release_replaced_file(sender, instance, raw=False, **kwargs):
+    name = instance.file.name or ''
+    if not raw and instance._stored_file and instance._stored_file != name:
+        storage.release(instance._stored_file)
+    instance._stored_file = name
+
+
+@receiver(post_delete, sender=Document)
+@receiver(post_delete, sender=DocumentVersion)
+@receiver(post_delete, sender='workflow.ActionLog')
+def release_deleted_file(sender, instance, **kwargs):
+    storage.release(instance.file.name)
+
+
+@receiver(post_init, sender=Department)
+def remember_parent(sender, instance, **kwargs):
+    instance._tree_parent = instance.__dict__.get('parent_id')
+
+
+def branch_documents(department_id):
+    return Document.objects.filter(
+        department_tree.subtree_q('creator__department', department_id)
+    ).values_list('id', flat=True)
+
+
+@receiver(post_save, sender=Department)
+def department_saved(sender, instance, created, raw=False, **kwargs):
+    if created:
+        department_tree.attach(instance.pk, instance.parent_id)
+    elif instance.parent_id != instance._tree_parent:
+        department_tree.move(instance.pk, instance.parent_id)
+        # Managers above the old and new position see a different branch now
+        access.rebuild_for_documents(branch_documents(instance.pk))
+    instance._tree_parent = instance.parent_id
+
+
+@receiver(pre_delete, sender=Department)
+def department_deleting(sender, instance, **kwargs):
+    # Children are re-parented to NULL by a plain UPDATE, so cut them loose here
+    instance._tree_documents = list(branch_documents(instance.pk))
+    for child_id in Department.objects.filter(parent=instance).values_list('id', flat=True):
+        department_tree.detach(child_id)
+
+
+@receiver(post_delete, sender=Department)
+def department_deleted(sender, instance, **kwargs):
+    access.rebuild_for_documents(getattr(instance, '_tree_documents', []))
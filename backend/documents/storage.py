@@ -0,0 +1,257 @@
+"""
+Content-addressed file storage.
+
+Every file is stored once, under its SHA-256, in a sharded layout:
+
+    MEDIA_ROOT/blobs/3f/a2/3fa2...e1
+
+The name saved in a FileField is blobs/3f/a2/<sha256>/<original name>,
+so downloads keep the uploaded file name while identical content shares
+one blob. StoredBlob counts the names handed out per blob; deleting a
+name releases a reference and the blob goes with the last one (see the
+release_file signal handlers). Names saved before this storage existed
+are served from their old paths unchanged; `manage.py dedupe_media` moves
+them into blobs.
+
+A blob may instead be kept as a binary delta against another blob, in
+blobs/3f/a2/3fa2...e1.delta (see documents.deltas). Opening such a name
+returns the rebuilt content, so readers do not need to know; path() still
+points at the whole file, which then does not exist.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+
+BLOB_DIR = 'blobs'
+DELTA_SUFFIX = '.delta'
+BLOB_NAME = re.compile(r'^blobs/([0-9a-f]{2})/([0-9a-f]{2})/(?P<sha256>\1\2[0-9a-f]{60})/[^/]+$')
+
+
+def blob_sha256(name):
+    """The SHA-256 a stored name refers to, None for names outside the blob store"""
+    match = BLOB_NAME.match(name or '')
+    return match.group('sha256') if match else None
+
+
+def blob_path(sha256):
+    return f'{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def path(self, name):
+        sha256 = blob_sha256(name)
+        return super().path(blob_path(sha256) if sha256 else name)
+
+    def delta_path(self, sha256):
+        return super().path(blob_path(sha256) + DELTA_SUFFIX)
+
+    def is_delta(self, name):
+        """Whether the name's blob is currently kept as a delta only"""
+        sha256 = blob_sha256(name)
+        return bool(sha256) and not os.path.exists(self.path(name)) and os.path.exists(self.delta_path(sha256))
+
+    def _open(self, name, mode='rb'):
+        try:
+            return super()._open(name, mode)
+        except FileNotFoundError:
+            if not self.is_delta(name):
+                raise
+        from . import deltas
+        return ContentFile(deltas.read_blob(blob_sha256(name)), name=name)
+
+    def exists(self, name):
+        return super().exists(name) or self.is_delta(name)
+
+    def size(self, name):
+        if self.is_delta(name):
+            from . import deltas
+            return deltas.delta_size(self.delta_path(blob_sha256(name)))
+        return super().size(name)
+
+    def get_modified_time(self, name):
+        if self.is_delta(name):
+            return self._datetime_from_timestamp(os.path.getmtime(self.delta_path(blob_sha256(name))))
+        return super().get_modified_time(name)
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from content in _save(), nothing to make unique
+        return name
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        sha256 = self.store(content)
+        return self.reference_name(sha256, os.path.basename(name), max_length)
+
+    def reference_name(self, sha256, filename, max_length=None):
+        prefix = f'{blob_path(sha256)}/'
+        if max_length and len(prefix) + len(filename) > max_length:
+            root, ext = os.path.splitext(filename)
+            filename = root[:max(max_length - len(prefix) - len(ext), 1)] + ext
+        return prefix + filename
+
+    def store(self, content):
+        """Write content to a blob unless one with the same hash exists; returns the hash"""
+        tmp_dir = super().path(f'{BLOB_DIR}/tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        hasher, size = hashlib.sha256(), 0
+        with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as tmp:
+            if hasattr(content, 'seek'):
+                content.seek(0)
+            for chunk in content.chunks():
+                tmp.write(chunk)
+                hasher.update(chunk)
+                size += len(chunk)
+        sha256 = hasher.hexdigest()
+
+        from .models import StoredBlob
+        target = super().path(blob_path(sha256))
+        try:
+            with transaction.atomic():
+                StoredBlob.acquire(sha256, size)
+                if os.path.exists(target) or os.path.exists(target + DELTA_SUFFIX):
+                    os.remove(tmp.name)
+                else:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.replace(tmp.name, target)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(target, self.file_permissions_mode)
+        finally:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+        return sha256
+
+    def delete(self, name):
+        """Release one reference to a blob, or delete a file stored under its own name"""
+        sha256 = blob_sha256(name)
+        if sha256 is None:
+            return super().delete(name)
+        from .models import StoredBlob
+        with transaction.atomic():
+            base = self.delta_base(sha256)
+            if not StoredBlob.release(sha256):
+                return
+            self.remove_blob(sha256)
+            # A base kept only for its deltas goes with the last of them
+            while base:
+                sha256, base = base, self.delta_base(base)
+                if not StoredBlob.collect(sha256):
+                    break
+                self.remove_blob(sha256)
+
+    def delta_base(self, sha256):
+        from .models import StoredBlob
+        return StoredBlob.objects.filter(sha256=sha256).values_list('delta_base', flat=True).first()
+
+    def remove_blob(self, sha256):
+        super().delete(blob_path(sha256))
+        super().delete(blob_path(sha256) + DELTA_SUFFIX)
+
+
+def release(name):
+    """Give back a blob reference once the current transaction commits"""
+    if blob_sha256(name) is not None:
+        transaction.on_commit(lambda: default_storage.delete(name))
+
+
+def file_models():
+    from django.apps import apps
+    return [apps.get_model(label) for label in ('documents.Document', 'documents.DocumentVersion', 'workflow.ActionLog')]
+
+
+def adopt_legacy_files():
+    """Move files stored under their own names into blobs; returns the number of rows updated"""
+    from .models import FileDigest
+    moved, legacy = 0, set()
+    for model in file_models():
+        max_length = model._meta.get_field('file').max_length
+        rows = list(model.objects.exclude(file='').exclude(file__isnull=True).exclude(
+            file__startswith=f'{BLOB_DIR}/'
+        ).values_list('pk', 'file'))
+        for pk, name in rows:
+            if not default_storage.exists(name):
+                continue
+            with default_storage.open(name, 'rb') as fileobj:
+                new_name = default_storage.save(name, fileobj, max_length=max_length)
+            model.objects.filter(pk=pk).update(file=new_name)
+            FileDigest.objects.update_or_create(
+                name=new_name, defaults={'sha256': blob_sha256(new_name), 'size': default_storage.size(new_name)}
+            )
+            legacy.add(name)
+            moved += 1
+    # Several rows may share a legacy file, so it goes only after all of them moved
+    for name in legacy:
+        default_storage.delete(name)
+    FileDigest.objects.filter(name__in=legacy).delete()
+    return moved
+
+
+def rebuild_references():
+    """
+    Recount StoredBlob.references from the file fields and delete blobs
+    nothing refers to; returns (kept, removed). Run it while no uploads
+    are in progress, since their temporary files are removed as well.
+    """
+    from . import deltas
+    from .models import StoredBlob
+    counts = {}
+    for model in file_models():
+        names = model.objects.filter(file__startswith=f'{BLOB_DIR}/').values_list('file', flat=True)
+        for name in names.iterator():
+            sha256 = blob_sha256(name)
+            if sha256:
+                counts[sha256] = counts.get(sha256, 0) + 1
+
+    root = default_storage.path(BLOB_DIR)
+    on_disk = {}
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            on_disk[filename] = os.path.join(directory, filename)
+
+    # Delta files name their base and the size they rebuild, so a delta
+    # whose row is lost is still recounted and keeps its base
+    headers = {}
+    for filename, path in on_disk.items():
+        if filename.endswith(DELTA_SUFFIX):
+            with open(path, 'rb') as fileobj:
+                try:
+                    headers[filename.removesuffix(DELTA_SUFFIX)] = deltas.read_header(fileobj.read(deltas.HEADER.size))
+                except deltas.DeltaError:
+                    continue
+
+    # Blobs that deltas of referenced blobs are based on stay as well
+    bases = dict(StoredBlob.objects.exclude(delta_base='').values_list('sha256', 'delta_base'))
+    bases.update((sha256, base) for sha256, (base, _) in headers.items())
+    for sha256 in list(counts):
+        while sha256 in bases and bases[sha256] not in counts:
+            sha256 = bases[sha256]
+            counts[sha256] = 0
+
+    removed = 0
+    with transaction.atomic():
+        StoredBlob.objects.exclude(sha256__in=counts).delete()
+        existing = set(StoredBlob.objects.values_list('sha256', flat=True))
+        for sha256, references in counts.items():
+            fields = {'references': references}
+            if sha256 not in on_disk and sha256 in headers:
+                fields['delta_base'], fields['size'] = headers[sha256]
+            elif sha256 in on_disk:
+                fields['size'] = os.path.getsize(on_disk[sha256])
+            if sha256 in existing:
+                StoredBlob.objects.filter(sha256=sha256).update(**fields)
+            elif 'size' in fields:
+                StoredBlob.objects.create(sha256=sha256, **fields)
+        for filename, path in on_disk.items():
+            # Unreferenced blobs and temporary files left by interrupted saves
+            if filename.removesuffix(DELTA_SUFFIX) not in counts:
+                os.remove(path)
+                removed += 1
+    return len(counts), removed
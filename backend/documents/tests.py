@@ -1,3 +1,1186 @@
-from django.test import TestCase
+import csv
+import hashlib
+import importlib
+import io
+import os
+import random
+import shutil
+import tempfile
+import uuid
+import zipfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import deltas, department_tree, previews, storage, uploads
+from .access import visible_documents
+from .search import get_backend as get_search_backend
+from .storage import blob_sha256
+from .transitions import TransitionConflict, apply_reject, save_transition
+from workflow.models import ActionLog, ApprovalRoute, StageApproval
+from workflow.rollups import reconcile, statistics_snapshot
+from .models import (
+    Department, DepartmentClosure, Document, DocumentAccess, DocumentAssignment, DocumentType, DocumentVersion,
+    ExtractedText, FileDigest, RegistrationSequence, StoredBlob, UploadSession,
+)
+
+User = get_user_model()
+
+# cache.clear() must not reach the shared cache
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def media_settings(media_root, **overrides):
+    """Stored files and the previews generated from them, both in a temporary directory"""
+    return override_settings(MEDIA_ROOT=media_root, PREVIEW_CACHE_DIR=os.path.join(media_root, 'previews'), **overrides)
+
+
+def authenticate(client, user):
+    """Send a real bearer token; the async read views ignore force_authenticate()"""
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+
+class DocumentListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='secretary', password='password', role='secretary')
+        self.doc_type = DocumentType.objects.create(name='Приказ')
+        for i in range(7):
+            Document.objects.create(
+                title=f'Документ {i}',
+                document_type=self.doc_type,
+                creator=self.user,
+                priority='high' if i % 2 else 'low',
+            )
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def test_cursor_pagination_walks_all_documents(self):
+        """Following `next` links returns every document exactly once"""
+        seen = []
+        url = '/api/documents/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(doc['id'] for doc in response.data['results'])
+            url = response.data['next']
+        expected = list(Document.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_server_side_filters(self):
+        response = self.client.get('/api/documents/', {'q': 'документ 3'})
+        self.assertEqual([doc['title'] for doc in response.data['results']], ['Документ 3'])
+
+        response = self.client.get('/api/documents/', {'priority': 'high'})
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/documents/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_list_query_count_is_constant(self):
+        """Adding rows with assignments must not add queries to list endpoints"""
+        def count_queries(url):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(url)
+            return len(ctx.captured_queries)
+
+        urls = ['/api/documents/', '/api/assignments/', '/api/workflow/logs/']
+        before = [count_queries(url) for url in urls]
+
+        assignee = User.objects.create_user(username='assignee', password='password')
+        for doc in Document.objects.all():
+            DocumentAssignment.objects.create(document=doc, assignee=assignee, assigned_by=self.user)
+            self.client.post(f'/api/documents/{doc.id}/assign/', {'assignee': assignee.id})
+
+        self.assertEqual([count_queries(url) for url in urls], before)
+        response = self.client.get('/api/documents/')
+        self.assertEqual(response.data['results'][0]['assignment_count'], 2)
+
+
+class DocumentAccessTests(TestCase):
+    def setUp(self):
+        self.department = Department.objects.create(name='Бухгалтерия')
+        self.head = User.objects.create_user(username='head', password='password', role='dept_head', department=self.department)
+        self.author = User.objects.create_user(username='author', password='password', department=self.department)
+        self.outsider = User.objects.create_user(username='outsider', password='password')
+        self.doc_type = DocumentType.objects.create(name='Служебная записка')
+        self.doc = Document.objects.create(title='Записка', document_type=self.doc_type, creator=self.author)
+
+    def visible_ids(self, user):
+        return set(visible_documents(user).values_list('id', flat=True))
+
+    def test_rules_are_materialized(self):
+        self.assertEqual(self.visible_ids(self.author), {self.doc.id})
+        self.assertEqual(self.visible_ids(self.head), {self.doc.id})
+        self.assertEqual(self.visible_ids(self.outsider), set())
+
+        DocumentAssignment.objects.create(document=self.doc, assignee=self.outsider, assigned_by=self.head)
+        self.assertEqual(self.visible_ids(self.outsider), {self.doc.id})
+
+    def test_user_changes_refresh_access(self):
+        self.head.department = None
+        self.head.save()
+        self.assertEqual(self.visible_ids(self.head), set())
+
+        self.outsider.role = 'dept_head'
+        self.outsider.department = self.department
+        self.outsider.save()
+        self.assertEqual(self.visible_ids(self.outsider), {self.doc.id})
+
+    def test_new_manager_sees_existing_documents(self):
+        head = User.objects.create_user(username='new_head', password='password', role='dept_head',
+                                        department=self.department)
+        self.assertEqual(self.visible_ids(head), {self.doc.id})
+
+    def test_managers_see_the_whole_supervisor_chain(self):
+        prorector = User.objects.create_user(username='prorector', password='password', role='prorector')
+        middle = User.objects.create_user(username='middle', password='password', supervisor=prorector)
+        self.outsider.supervisor = middle
+        self.outsider.save()
+        doc = Document.objects.create(title='Отчёт', document_type=self.doc_type, creator=self.outsider)
+        self.assertEqual(self.visible_ids(prorector), {doc.id})
+
+        # Moving a link of the chain and removing it both reach the manager at the top
+        self.outsider.supervisor = None
+        self.outsider.save()
+        self.assertEqual(self.visible_ids(prorector), set())
+        self.outsider.supervisor = middle
+        self.outsider.save()
+        self.assertEqual(self.visible_ids(prorector), {doc.id})
+        middle.role = 'dept_head'
+        middle.save()
+        self.assertEqual(self.visible_ids(middle), {doc.id})
+        middle.delete()
+        self.assertEqual(self.visible_ids(prorector), set())
+
+        call_command('rebuild_document_access', stdout=StringIO())
+        self.assertEqual(self.visible_ids(prorector), set())
+        self.outsider.supervisor = prorector
+        self.outsider.save()
+        DocumentAccess.objects.all().delete()
+        call_command('rebuild_document_access', stdout=StringIO())
+        self.assertEqual(self.visible_ids(prorector), {doc.id})
+
+    def test_rebuild_command_recovers_table(self):
+        DocumentAccess.objects.all().delete()
+        call_command('rebuild_document_access', stdout=StringIO())
+        self.assertEqual(self.visible_ids(self.head), {self.doc.id})
+
+
+class DocumentSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = User.objects.create_user(username='author', password='password')
+        self.other = User.objects.create_user(username='other', password='password')
+        doc_type = DocumentType.objects.create(name='Договор')
+        self.contract = Document.objects.create(
+            title='Договор поставки оборудования', document_type=doc_type, creator=self.author,
+            content='Поставщик обязуется передать оборудование в срок.'
+        )
+        self.hidden = Document.objects.create(
+            title='Договоры аренды', document_type=doc_type, creator=self.other
+        )
+        refresh = RefreshToken.for_user(self.author)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def test_word_forms_and_visibility(self):
+        response = self.client.get('/api/documents/search/', {'q': 'договоров'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([hit['id'] for hit in response.data['results']], [self.contract.id])
+        self.assertIn('<mark>Договор</mark>', response.data['results'][0]['title_highlight'])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.contract.content = 'Арендатор вносит плату ежемесячно.'
+        self.contract.save()
+        response = self.client.get('/api/documents/search/', {'q': 'арендатора'})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIn('<mark>', response.data['results'][0]['snippet'])
+
+        self.contract.delete()
+        response = self.client.get('/api/documents/search/', {'q': 'арендатора'})
+        self.assertEqual(response.data['results'], [])
+
+
+def make_docx(text):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('word/document.xml', (
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body><w:p><w:r><w:t>{text}</w:t></w:r></w:p></w:body></w:document>'
+        ))
+    return buffer.getvalue()
+
+
+@override_settings(TEXT_EXTRACTION_ASYNC=False)
+class TextExtractionTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = media_settings(self.media_root)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='author', password='password')
+        self.doc_type = DocumentType.objects.create(name='Акт')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def create_document(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Document.objects.create(
+                title='Акт', document_type=self.doc_type, creator=self.user,
+                file=SimpleUploadedFile('act.docx', content)
+            )
+
+    def test_uploaded_docx_is_searchable(self):
+        doc = self.create_document(make_docx('Выполнены работы по ремонту кровли'))
+        hits = get_search_backend().search(Document.objects.all(), 'ремонта кровли')
+        self.assertEqual([hit.document.id for hit in hits], [doc.id])
+
+    def test_identical_files_are_extracted_once(self):
+        content = make_docx('Одинаковое содержимое')
+        self.create_document(content)
+        self.create_document(content)
+        self.assertEqual(ExtractedText.objects.count(), 1)
+
+    def test_command_reextracts_stored_blobs(self):
+        doc = self.create_document(make_docx('Протокол заседания кафедры'))
+        ExtractedText.objects.all().delete()
+        FileDigest.objects.all().delete()
+        out = StringIO()
+        call_command('extract_texts', workers=1, stdout=out)
+        self.assertIn('Обработано файлов: 1', out.getvalue())
+        self.assertIn('заседания', ExtractedText.objects.get().text)
+        self.assertTrue(FileDigest.objects.filter(name=doc.file.name).exists())
+
+
+class RegistrationNumberTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='password')
+        self.order = DocumentType.objects.create(name='Приказ')
+        self.memo = DocumentType.objects.create(name='Служебная записка')
+
+    def test_numbers_are_sequential_per_type(self):
+        docs = [
+            Document.objects.create(title=str(i), document_type=doc_type, creator=self.user, status='pending')
+            for i, doc_type in enumerate([self.order, self.order, self.memo])
+        ]
+        year = docs[0].created_at.year
+        self.assertEqual([doc.registration_number for doc in docs], [
+            f'{year}-{self.order.id}-00001',
+            f'{year}-{self.order.id}-00002',
+            f'{year}-{self.memo.id}-00001',
+        ])
+
+    def test_block_reservation_and_year_reset(self):
+        self.assertEqual(list(RegistrationSequence.reserve(self.order.id, count=3, year=2025)), [1, 2, 3])
+        self.assertEqual(list(RegistrationSequence.reserve(self.order.id, count=2, year=2025)), [4, 5])
+        self.assertEqual(list(RegistrationSequence.reserve(self.order.id, year=2026)), [1])
+
+
+class BulkActionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.rector = User.objects.create_user(username='rector', password='password', role='rector')
+        self.executor = User.objects.create_user(username='executor', password='password', first_name='Иван')
+        self.doc_type = DocumentType.objects.create(name='Приказ')
+        ApprovalRoute.objects.create(document_type=self.doc_type, step_order=1, approver_role='rector')
+        self.pending = [
+            Document.objects.create(title=f'Приказ {i}', document_type=self.doc_type, creator=self.rector,
+                                    status='pending', current_approver=self.rector)
+            for i in range(3)
+        ]
+        self.draft = Document.objects.create(title='Черновик', document_type=self.doc_type, creator=self.rector)
+        refresh = RefreshToken.for_user(self.rector)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def test_bulk_approve_then_assign(self):
+        ids = [doc.id for doc in self.pending]
+        response = self.client.post('/api/documents/bulk/', {
+            'action': 'approve', 'ids': ids + [self.draft.id, 999999],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([r['success'] for r in results], [True, True, True, False, False])
+        self.assertEqual(results[3]['error'], 'Документ не на согласовании')
+        self.assertEqual(results[4]['error'], 'Документ не найден')
+        self.assertEqual(set(Document.objects.filter(id__in=ids).values_list('status', flat=True)), {'approved'})
+        self.assertEqual(ActionLog.objects.filter(action='approved').count(), 3)
+
+        response = self.client.post('/api/documents/bulk/', {
+            'action': 'assign', 'ids': ids, 'assignee': self.executor.id, 'instruction': 'Исполнить',
+        }, format='json')
+        self.assertTrue(all(r['success'] for r in response.data['results']))
+        self.assertEqual(set(Document.objects.filter(id__in=ids).values_list('status', flat=True)), {'in_progress'})
+        self.assertEqual(DocumentAccess.objects.filter(user=self.executor).count(), 3)
+
+        incremental = statistics_snapshot()
+        reconcile()
+        self.assertEqual(statistics_snapshot(), incremental)
+
+    def test_unknown_assignee_rolls_back(self):
+        response = self.client.post('/api/documents/bulk/', {
+            'action': 'assign', 'ids': [self.pending[0].id], 'assignee': 999999,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(DocumentAssignment.objects.exists())
+
+    def test_ids_must_be_a_list(self):
+        pk = self.pending[0].id
+        response = self.client.post('/api/documents/bulk/', {'action': 'approve', 'ids': str(pk)}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Document.objects.get(pk=pk).status, 'pending')
+
+        # A form repeats the key; every value counts, not just the last one
+        response = self.client.post('/api/documents/bulk/', {'action': 'approve', 'ids': [pk, self.pending[1].id]})
+        self.assertEqual([r['id'] for r in response.data['results']], [pk, self.pending[1].id])
+
+
+class AssignmentFanOutTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.rector = User.objects.create_user(username='rector', password='password', role='rector')
+        self.university = Department.objects.create(name='Университет')
+        self.faculty = Department.objects.create(name='Факультет', parent=self.university)
+        self.chair = Department.objects.create(name='Кафедра', parent=self.faculty)
+        self.heads = []
+        for i, department in enumerate([self.university, self.faculty, self.chair]):
+            head = User.objects.create_user(username=f'head{i}', password='password', role='dept_head',
+                                            department=department)
+            department.head = head
+            department.save()
+            self.heads.append(head)
+        self.document = Document.objects.create(title='Приказ', document_type=DocumentType.objects.create(name='Приказ'),
+                                                creator=self.rector, status='approved')
+        refresh = RefreshToken.for_user(self.rector)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def assign(self, **data):
+        return self.client.post(f'/api/documents/{self.document.id}/assign/', data, format='json')
+
+    def test_department_fan_out_with_subdepartments(self):
+        response = self.assign(department=self.faculty.id, include_subdepartments=True, heads_only=True)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual({a['assignee'] for a in response.data}, {self.heads[1].id, self.heads[2].id})
+        self.assertEqual(ActionLog.objects.filter(action='assigned').count(), 2)
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, 'in_progress')
+        self.assertTrue(DocumentAccess.objects.filter(user=self.heads[2], document=self.document).exists())
+
+    def test_role_and_list_are_merged_without_duplicates(self):
+        response = self.assign(role='dept_head', assignees=[self.heads[0].id, self.rector.id])
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(DocumentAssignment.objects.filter(document=self.document).count(), 4)
+
+    def test_single_assignee_keeps_response_shape(self):
+        response = self.assign(assignee=self.heads[0].id, instruction='Исполнить')
+        self.assertEqual(response.data['assignee'], self.heads[0].id)
+        self.assertEqual(self.assign(assignee=999999).status_code, 400)
+
+    def test_concurrent_start_is_a_conflict(self):
+        conflict = TransitionConflict('Документ уже обработан другим пользователем')
+        with mock.patch('documents.bulk.save_transition', side_effect=conflict):
+            response = self.assign(assignee=self.heads[0].id)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(DocumentAssignment.objects.filter(document=self.document).exists())
+
+
+class WorkflowTransitionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = User.objects.create_user(username='author', password='password')
+        self.head = User.objects.create_user(username='head', password='password', role='dept_head')
+        self.rector = User.objects.create_user(username='rector', password='password', role='rector')
+        self.doc_type = DocumentType.objects.create(name='Служебная записка')
+        for order, role in enumerate(['dept_head', 'rector', 'dept_head'], start=1):
+            ApprovalRoute.objects.create(document_type=self.doc_type, step_order=order, approver_role=role)
+        self.document = Document.objects.create(title='Записка', document_type=self.doc_type, creator=self.author)
+
+    def post(self, user, action):
+        refresh = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        return self.client.post(f'/api/documents/{self.document.id}/{action}/')
+
+    def test_repeated_role_follows_step_pointer(self):
+        self.post(self.author, 'submit')
+        for approver, step in [(self.head, 1), (self.rector, 2)]:
+            self.post(approver, 'approve')
+            self.document.refresh_from_db()
+            self.assertEqual((self.document.status, self.document.current_step), ('pending', step))
+        self.assertEqual(self.document.current_approver, self.head)
+        self.assertTrue(self.document.registration_number)
+
+        self.post(self.head, 'approve')
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, 'approved')
+
+    def test_stale_transition_is_rejected(self):
+        self.post(self.author, 'submit')
+        stale = Document.objects.get(pk=self.document.pk)
+        self.post(self.head, 'approve')
+        apply_reject(stale)
+        with self.assertRaises(TransitionConflict):
+            save_transition(stale)
+        self.assertEqual(Document.objects.get(pk=self.document.pk).current_step, 1)
+
+    def test_lost_reject_keeps_stage_slots(self):
+        self.post(self.author, 'submit')
+        slots = list(StageApproval.objects.values_list('id', 'approver_id'))
+        conflict = TransitionConflict('Документ уже обработан другим пользователем')
+        with mock.patch('documents.views.save_transition', side_effect=conflict):
+            self.assertEqual(self.post(self.head, 'reject').status_code, 409)
+        self.assertEqual(list(StageApproval.objects.values_list('id', 'approver_id')), slots)
+
+    def test_migration_replays_action_log(self):
+        migration = importlib.import_module('documents.migrations.0009_document_current_step')
+        Document.objects.filter(pk=self.document.pk).update(status='pending')
+        for action in ['submitted', 'approved', 'rejected', 'submitted', 'approved', 'approved']:
+            ActionLog.objects.create(user=self.author, document=self.document, action=action)
+        migration.replay_action_logs(django_apps, None)
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.current_step, 2)
+
+    def test_migration_gives_pending_documents_their_slots(self):
+        migration = importlib.import_module('workflow.migrations.0008_pending_stage_slots')
+        # Pending at the rector's stage from before stage slots existed
+        Document.objects.filter(pk=self.document.pk).update(status='pending', current_step=1,
+                                                             current_approver=self.rector)
+        migration.create_pending_slots(django_apps, None)
+        self.assertEqual(list(StageApproval.objects.values_list('step', 'approver_role', 'approver_id')),
+                         [(1, 'rector', self.rector.id)])
+
+        self.assertEqual(self.post(self.rector, 'approve').status_code, 200)
+        self.document.refresh_from_db()
+        self.assertEqual((self.document.current_step, self.document.current_approver), (2, self.head))
+
+
+class ParallelStageTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = User.objects.create_user(username='author', password='password')
+        self.head = User.objects.create_user(username='head', password='password', role='dept_head')
+        self.prorector = User.objects.create_user(username='prorector', password='password', role='prorector')
+        self.council = User.objects.create_user(username='council', password='password', role='council_member')
+        self.rector = User.objects.create_user(username='rector', password='password', role='rector')
+        self.doc_type = DocumentType.objects.create(name='Договор')
+        for role in ['dept_head', 'prorector', 'council_member']:
+            ApprovalRoute.objects.create(document_type=self.doc_type, step_order=1, approver_role=role, quorum=2)
+        ApprovalRoute.objects.create(document_type=self.doc_type, step_order=2, approver_role='rector')
+        self.document = Document.objects.create(title='Договор', document_type=self.doc_type, creator=self.author)
+
+    def post(self, user, action):
+        refresh = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        return self.client.post(f'/api/documents/{self.document.id}/{action}/')
+
+    def test_stage_advances_on_quorum(self):
+        self.post(self.author, 'submit')
+        response = self.client.get(f'/api/documents/{self.document.id}/')
+        self.assertEqual(set(response.data['pending_approvers']), {self.head.id, self.prorector.id, self.council.id})
+        self.assertTrue(DocumentAccess.objects.filter(user=self.council, document=self.document).exists())
+
+        self.post(self.prorector, 'approve')
+        self.assertEqual(self.post(self.prorector, 'approve').data['error'], 'Вы уже согласовали этот этап')
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.current_step, 0)
+
+        self.post(self.head, 'approve')
+        self.document.refresh_from_db()
+        self.assertEqual((self.document.current_step, self.document.current_approver), (1, self.rector))
+
+        # The stage closed without the council member, who no longer sees the document
+        self.assertEqual(self.post(self.council, 'approve').status_code, 404)
+        self.post(self.rector, 'approve')
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, 'approved')
+
+
+    def test_same_role_approvers_sign_their_own_slots(self):
+        other_head = User.objects.create_user(username='head2', password='password', role='dept_head')
+        doc_type = DocumentType.objects.create(name='Положение')
+        for _ in range(2):
+            ApprovalRoute.objects.create(document_type=doc_type, step_order=1, approver_role='dept_head')
+        ApprovalRoute.objects.create(document_type=doc_type, step_order=2, approver_role='rector')
+        self.document = Document.objects.create(title='Положение', document_type=doc_type, creator=self.author)
+        self.post(self.author, 'submit')
+        self.assertEqual(set(StageApproval.objects.filter(document=self.document).values_list('approver_id', flat=True)),
+                         {self.head.id, other_head.id})
+
+        self.post(self.head, 'approve')
+        self.assertEqual(self.post(self.head, 'approve').data['error'], 'Вы уже согласовали этот этап')
+        self.document.refresh_from_db()
+        self.assertEqual((self.document.current_step, self.document.current_approver), (0, other_head))
+
+        self.post(other_head, 'approve')
+        self.document.refresh_from_db()
+        self.assertEqual((self.document.current_step, self.document.current_approver), (1, self.rector))
+        self.assertEqual(set(StageApproval.objects.filter(document=self.document, step=0).values_list(
+            'approver_id', flat=True)), {self.head.id, other_head.id})
+
+
+class DepartmentTreeTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.rectorat = Department.objects.create(name='Ректорат')
+        self.prorectorat = Department.objects.create(name='Проректор по науке', parent=self.rectorat)
+        self.center = Department.objects.create(name='Научный центр', parent=self.prorectorat)
+        self.lab = Department.objects.create(name='Лаборатория', parent=self.center)
+        self.prorector = User.objects.create_user(username='prorector', password='password', role='prorector',
+                                                  department=self.prorectorat)
+        self.researcher = User.objects.create_user(username='researcher', password='password', department=self.lab)
+        self.doc_type = DocumentType.objects.create(name='Отчет')
+        self.report = Document.objects.create(title='Отчет', document_type=self.doc_type, creator=self.researcher)
+        refresh = RefreshToken.for_user(self.prorector)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def closure(self):
+        return set(DepartmentClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def test_signals_match_rebuild(self):
+        other = Department.objects.create(name='Учебный отдел', parent=self.rectorat)
+        self.center.parent = other
+        self.center.save()
+        self.prorectorat.delete()
+        maintained = self.closure()
+        department_tree.rebuild()
+        self.assertEqual(self.closure(), maintained)
+        self.assertEqual(set(other.subtree_ids()), {other.id, self.center.id, self.lab.id})
+
+    def test_subtree_endpoint_and_branch_visibility(self):
+        response = self.client.get(f'/api/departments/{self.prorectorat.id}/subtree/')
+        self.assertEqual([(d['name'], d['depth']) for d in response.data],
+                         [('Проректор по науке', 0), ('Научный центр', 1), ('Лаборатория', 2)])
+
+        response = self.client.get('/api/documents/', {'subtree': self.center.id})
+        self.assertEqual([doc['id'] for doc in response.data['results']], [self.report.id])
+        for url in ('/api/documents/', '/api/assignments/', '/api/documents/export/csv/'):
+            response = self.client.get(url, {'subtree': 'abc'})
+            self.assertEqual((url, response.status_code), (url, 400))
+
+        self.center.parent = self.rectorat
+        self.center.save()
+        self.assertFalse(visible_documents(self.prorector).exists())
+
+    def test_cycle_is_rejected(self):
+        refresh = RefreshToken.for_user(User.objects.create_user(username='admin', password='p', role='admin'))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        response = self.client.patch(f'/api/departments/{self.rectorat.id}/', {'parent': self.lab.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.department = Department.objects.create(name='Бухгалтерия')
+        self.author = User.objects.create_user(username='author', password='password', first_name='Анна',
+                                               last_name='Петрова', department=self.department)
+        self.outsider = User.objects.create_user(username='outsider', password='password')
+        self.doc_type = DocumentType.objects.create(name='Служебная записка')
+        for i in range(3):
+            doc = Document.objects.create(title=f'Записка "{i}"', document_type=self.doc_type, creator=self.author,
+                                          priority='high' if i else 'low')
+            ActionLog.objects.create(user=self.author, document=doc, action='created')
+        Document.objects.create(title='Чужой', document_type=self.doc_type, creator=self.outsider)
+        self.client = APIClient()
+        authenticate(self.client, self.author)
+
+    def download(self, url, params=None):
+        response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv_honors_filters_and_visibility(self):
+        content = self.download('/api/documents/export/csv/', {'priority': 'high'}).decode('utf-8')
+        self.assertTrue(content.startswith('\ufeffID,'))
+        rows = list(csv.reader(io.StringIO(content.lstrip('\ufeff'))))
+        self.assertEqual([row[2] for row in rows[1:]], ['Записка "2"', 'Записка "1"'])
+        self.assertEqual(rows[1][4:7], ['Черновик', 'Высокий', 'Петрова Анна'])
+
+        content = self.download('/api/workflow/logs/export/csv/').decode('utf-8')
+        self.assertEqual(len(content.splitlines()), 4)
+        authenticate(self.client, self.outsider)
+        content = self.download('/api/workflow/logs/export/csv/').decode('utf-8')
+        self.assertEqual(len(content.splitlines()), 1)
+
+    def test_xlsx_is_a_workbook(self):
+        content = self.download('/api/documents/export/xlsx/')
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertIn('xl/workbook.xml', archive.namelist())
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertEqual(sheet.count('<row>'), 4)
+        self.assertIn('<t xml:space="preserve">Записка "0"</t>', sheet)
+
+    def test_assignment_export_is_scoped(self):
+        doc = Document.objects.filter(creator=self.author).first()
+        DocumentAssignment.objects.create(document=doc, assignee=self.outsider, assigned_by=self.author)
+        DocumentAssignment.objects.create(document=doc, assignee=self.author, assigned_by=self.author)
+        authenticate(self.client, self.outsider)
+        content = self.download('/api/assignments/export/csv/').decode('utf-8')
+        self.assertEqual(len(content.splitlines()), 2)
+
+    def test_archive_streams_visible_files_with_manifest(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with media_settings(media_root):
+            doc = Document.objects.filter(creator=self.author).first()
+            doc.file = SimpleUploadedFile('report.txt', b'main')
+            doc.save()
+            DocumentVersion.objects.create(document=doc, version_number=1, creator=self.author,
+                                           file=SimpleUploadedFile('report.txt', b'v1'))
+            hidden = Document.objects.get(title='Чужой')
+            hidden.file = SimpleUploadedFile('secret.txt', b'secret')
+            hidden.save()
+
+            content = self.download('/api/documents/archive/', {'created_from': '2000-01-01'})
+
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            names = archive.namelist()
+            self.assertEqual(sorted(names), sorted([
+                f'{doc.id}/report.txt', f'{doc.id}/versions/v1_report.txt', 'manifest.csv'
+            ]))
+            self.assertEqual(archive.read(f'{doc.id}/versions/v1_report.txt'), b'v1')
+            manifest = archive.read('manifest.csv').decode('utf-8-sig').splitlines()
+        self.assertEqual(len(manifest), 3)
+
+
+class ResumableUploadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = media_settings(
+            self.media_root, CHUNKED_UPLOAD_DIR=os.path.join(self.media_root, 'partial')
+        )
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='author', password='password')
+        self.doc_type = DocumentType.objects.create(name='Договор')
+        self.doc = Document.objects.create(title='Договор', document_type=self.doc_type, creator=self.user)
+        self.client = APIClient()
+        authenticate(self.client, self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def put_chunk(self, session_id, data, offset, total):
+        return self.client.generic(
+            'PUT', f'/api/uploads/{session_id}/', data, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {offset}-{offset + len(data) - 1}/{total}'
+        )
+
+    def upload(self, content, chunk=4):
+        session = self.client.post('/api/uploads/', {'filename': 'scan.pdf', 'size': len(content)}, format='json').data
+        for offset in range(0, len(content), chunk):
+            response = self.put_chunk(session['id'], content[offset:offset + chunk], offset, len(content))
+            self.assertEqual(response.status_code, 200)
+        return session['id']
+
+    def test_chunks_are_assembled_and_hashed(self):
+        content = b'%PDF-1.4 contract body'
+        session_id = self.upload(content)
+        response = self.client.post(f'/api/uploads/{session_id}/finalize/',
+                                    {'target': 'version', 'document': self.doc.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['sha256'], hashlib.sha256(content).hexdigest())
+        version = DocumentVersion.objects.get(document=self.doc)
+        self.assertEqual((version.version_number, version.file.read()), (1, content))
+        self.assertTrue(FileDigest.objects.filter(name=version.file.name, sha256=response.data['sha256']).exists())
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_resume_after_out_of_order_chunk(self):
+        content = b'0123456789'
+        session = self.client.post('/api/uploads/', {'filename': 'a.txt', 'size': 10}, format='json').data
+        self.put_chunk(session['id'], content[:4], 0, 10)
+        response = self.put_chunk(session['id'], content[6:], 6, 10)
+        self.assertEqual((response.status_code, response.data['received']), (409, 4))
+
+        # Another worker has no hash state; finalization rehashes the partial file
+        uploads._hashers.clear()
+        self.put_chunk(session['id'], content[4:], 4, 10)
+        response = self.client.post(f'/api/uploads/{session["id"]}/finalize/',
+                                    {'target': 'document', 'document': self.doc.id}, format='json')
+        self.assertEqual(response.data['sha256'], hashlib.sha256(content).hexdigest())
+        self.doc.refresh_from_db()
+        self.assertEqual(self.doc.file.read(), content)
+
+    def test_incomplete_or_foreign_upload_is_refused(self):
+        session = self.client.post('/api/uploads/', {'filename': 'a.txt', 'size': 10}, format='json').data
+        self.put_chunk(session['id'], b'0123', 0, 10)
+        response = self.client.post(f'/api/uploads/{session["id"]}/finalize/',
+                                    {'target': 'document', 'document': self.doc.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        authenticate(self.client, User.objects.create_user(username='other', password='password'))
+        self.assertEqual(self.client.get(f'/api/uploads/{session["id"]}/').status_code, 404)
+
+    def test_replayed_chunk_leaves_the_partial_file_alone(self):
+        session = self.client.post('/api/uploads/', {'filename': 'a.txt', 'size': 10}, format='json').data
+        stale = UploadSession.objects.get(pk=session['id'])
+        self.put_chunk(session['id'], b'0123', 0, 10)
+        # A retry of the same chunk that read the session before the first one landed
+        with self.assertRaises(uploads.UploadConflict):
+            uploads.write_chunk(stale, 0, io.BytesIO(b'XXXXXXXX'), 8)
+        with open(uploads.partial_path(stale), 'rb') as partial:
+            self.assertEqual(partial.read(), b'0123')
+
+    def test_abandoned_uploads_are_cleared(self):
+        old = self.client.post('/api/uploads/', {'filename': 'a.txt', 'size': 10}, format='json').data
+        fresh = self.client.post('/api/uploads/', {'filename': 'b.txt', 'size': 10}, format='json').data
+        UploadSession.objects.filter(pk=old['id']).update(updated_at=timezone.now() - timedelta(days=2))
+        orphan = os.path.join(settings.CHUNKED_UPLOAD_DIR, 'lost.part')
+        open(orphan, 'wb').close()
+        os.utime(orphan, (0, 0))
+
+        call_command('clear_uploads', stdout=StringIO())
+        self.assertEqual(list(UploadSession.objects.values_list('pk', flat=True)), [uuid.UUID(fresh['id'])])
+        self.assertEqual(os.listdir(settings.CHUNKED_UPLOAD_DIR), [f'{fresh["id"]}.part'])
+
+
+@override_settings(TEXT_EXTRACTION_ASYNC=False)
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = media_settings(self.media_root)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='author', password='password')
+        self.doc_type = DocumentType.objects.create(name='Акт')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def create_document(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Document.objects.create(title=name, document_type=self.doc_type, creator=self.user,
+                                           file=SimpleUploadedFile(name, content))
+
+    def blob_files(self):
+        return [name for _, _, names in os.walk(os.path.join(self.media_root, 'blobs')) for name in names]
+
+    def test_identical_content_is_stored_once(self):
+        first = self.create_document('Акт выполненных работ.doc', b'same bytes')
+        second = self.create_document('copy.doc', b'same bytes')
+        self.assertNotEqual(first.file.name, second.file.name)
+        self.assertTrue(second.file.name.endswith('/copy.doc'))
+        self.assertEqual(len(self.blob_files()), 1)
+        self.assertEqual(StoredBlob.objects.get().references, 2)
+        with second.file.open('rb') as fileobj:
+            self.assertEqual(fileobj.read(), b'same bytes')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(len(self.blob_files()), 1)
+
+        # Replacing the file releases the old blob
+        with self.captureOnCommitCallbacks(execute=True):
+            second.file = SimpleUploadedFile('copy.doc', b'new bytes')
+            second.save()
+        self.assertEqual(StoredBlob.objects.get().references, 1)
+        self.assertEqual(len(self.blob_files()), 1)
+
+    def test_dedupe_command_adopts_legacy_files(self):
+        for name in ('documents/2025/12/test.txt', 'documents/2025/12/test_Wxy8gcz.txt'):
+            os.makedirs(os.path.dirname(os.path.join(self.media_root, name)), exist_ok=True)
+            with open(os.path.join(self.media_root, name), 'wb') as fileobj:
+                fileobj.write(b'duplicate')
+            Document.objects.create(title=name, document_type=self.doc_type, creator=self.user, file=name)
+
+        call_command('dedupe_media', stdout=StringIO())
+        self.assertEqual(len(self.blob_files()), 1)
+        self.assertEqual(StoredBlob.objects.get().references, 2)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'documents/2025/12/test.txt')))
+        for doc in Document.objects.all():
+            with doc.file.open('rb') as fileobj:
+                self.assertEqual(fileobj.read(), b'duplicate')
+
+
+@override_settings(TEXT_EXTRACTION_ASYNC=False)
+class VersionDeltaTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = media_settings(self.media_root)
+        self.settings_override.enable()
+        deltas.clear_cache()
+        self.user = User.objects.create_user(username='author', password='password')
+        self.doc = Document.objects.create(title='Акт', document_type=DocumentType.objects.create(name='Акт'),
+                                           creator=self.user)
+        rng = random.Random(0)
+        self.paragraphs = [' '.join(f'{rng.getrandbits(64):x}' for _ in range(60)) for _ in range(200)]
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def add_version(self, number):
+        self.paragraphs[number * 7 % len(self.paragraphs)] = f'Редакция {number}: пункт изменён.'
+        content = '\n'.join(self.paragraphs).encode('utf-8')
+        with self.captureOnCommitCallbacks(execute=True):
+            DocumentVersion.objects.create(document=self.doc, version_number=number, creator=self.user,
+                                           file=SimpleUploadedFile(f'act_v{number}.txt', content))
+        return content
+
+    def blob_bytes(self):
+        return sum(os.path.getsize(os.path.join(directory, name))
+                   for directory, _, names in os.walk(os.path.join(self.media_root, 'blobs')) for name in names)
+
+    def test_older_versions_are_deltas_and_read_back_whole(self):
+        contents = {number: self.add_version(number) for number in range(1, 11)}
+        # Saving stores whole files; encoding is left to the command
+        self.assertFalse(any(default_storage.is_delta(v.file.name) for v in DocumentVersion.objects.all()))
+        call_command('compact_versions', stdout=StringIO())
+        self.assertLess(self.blob_bytes() * 8, sum(len(c) for c in contents.values()))
+
+        latest = DocumentVersion.objects.get(version_number=10)
+        self.assertFalse(default_storage.is_delta(latest.file.name))
+        deltas.clear_cache()
+        for version in DocumentVersion.objects.all():
+            self.assertEqual(version.file.size, len(contents[version.version_number]))
+            with version.file.open('rb') as fileobj:
+                self.assertEqual(fileobj.read(), contents[version.version_number])
+
+        # The base of a delta outlives its own version until nothing needs it
+        with self.captureOnCommitCallbacks(execute=True):
+            latest.delete()
+        with DocumentVersion.objects.get(version_number=1).file.open('rb') as fileobj:
+            self.assertEqual(fileobj.read(), contents[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            for version in DocumentVersion.objects.all():
+                version.delete()
+        self.assertEqual(self.blob_bytes(), 0)
+        self.assertFalse(StoredBlob.objects.exists())
+
+    @override_settings(VERSION_DELTA_MAX_CHAIN=3)
+    def test_compaction_rebases_long_chains(self):
+        contents = {number: self.add_version(number) for number in range(1, 9)}
+        with override_settings(VERSION_DELTA_MAX_CHAIN=100):
+            call_command('compact_versions', stdout=StringIO())
+        oldest = DocumentVersion.objects.get(version_number=1).file.name
+        self.assertEqual(len(deltas.chain_of(blob_sha256(oldest))), 8)
+
+        call_command('compact_versions', stdout=StringIO())
+        for version in DocumentVersion.objects.all():
+            self.assertLessEqual(len(deltas.chain_of(blob_sha256(version.file.name))), 4)
+        deltas.clear_cache()
+        for version in DocumentVersion.objects.all():
+            with version.file.open('rb') as fileobj:
+                self.assertEqual(fileobj.read(), contents[version.version_number])
+
+    def test_recount_restores_delta_rows_from_headers(self):
+        contents = {number: self.add_version(number) for number in range(1, 4)}
+        call_command('compact_versions', stdout=StringIO())
+        expected = set(StoredBlob.objects.values_list('sha256', 'size', 'delta_base'))
+        StoredBlob.objects.all().delete()
+
+        call_command('dedupe_media', stdout=StringIO())
+        self.assertEqual(set(StoredBlob.objects.values_list('sha256', 'size', 'delta_base')), expected)
+        # The whole file the deltas are built on survives its own version
+        with self.captureOnCommitCallbacks(execute=True):
+            DocumentVersion.objects.get(version_number=3).delete()
+        deltas.clear_cache()
+        for version in DocumentVersion.objects.all():
+            with version.file.open('rb') as fileobj:
+                self.assertEqual(fileobj.read(), contents[version.version_number])
+
+    def test_delta_round_trip(self):
+        base = b'header ' + bytes(range(256)) * 20 + b' footer'
+        target = b'new header ' + bytes(range(256)) * 10 + b'inserted' + bytes(range(256)) * 10
+        self.assertEqual(deltas.patch(base, deltas.diff(base, target)), target)
+        self.assertEqual(deltas.patch(base, deltas.diff(base, b'')), b'')
+        self.assertEqual(deltas.patch(b'', deltas.diff(b'', target)), target)
+
+
+@override_settings(TEXT_EXTRACTION_ASYNC=False)
+class VersionApiTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = media_settings(self.media_root)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='author', password='password')
+        self.doc = Document.objects.create(title='Договор', document_type=DocumentType.objects.create(name='Договор'),
+                                           creator=self.user)
+        self.url = f'/api/documents/{self.doc.id}/versions/'
+        self.client = APIClient()
+        authenticate(self.client, self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def upload(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, {'file': SimpleUploadedFile('contract.txt', content)},
+                                    format='multipart')
+
+    def test_versions_are_numbered_and_unchanged_uploads_skipped(self):
+        first = self.upload(b'first draft')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(first.data['version_number'], 1)
+        self.assertEqual(self.upload(b'second draft').data['version_number'], 2)
+
+        stored = StoredBlob.objects.count()
+        same = self.upload(b'second draft')
+        self.assertEqual(same.status_code, 200)
+        self.assertEqual(same.data['version_number'], 2)
+        self.assertEqual(StoredBlob.objects.count(), stored)
+        # Only the current version counts; going back to older content is a new version
+        self.assertEqual(self.upload(b'first draft').data['version_number'], 3)
+
+        listing = self.client.get(self.url)
+        self.assertEqual([v['version_number'] for v in listing.data], [3, 2, 1])
+        self.assertEqual(listing.data[0]['size'], len(b'first draft'))
+        self.assertEqual(listing.data[0]['sha256'], hashlib.sha256(b'first draft').hexdigest())
+
+    def test_missing_file_and_foreign_document(self):
+        self.assertEqual(self.client.post(self.url, {}, format='multipart').status_code, 400)
+        authenticate(self.client, User.objects.create_user(username='other', password='password'))
+        self.assertEqual(self.upload(b'data').status_code, 404)
+        self.assertFalse(DocumentVersion.objects.exists())
+
+
+@override_settings(TEXT_EXTRACTION_ASYNC=False)
+class FileDownloadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = media_settings(self.media_root)
+        self.settings_override.enable()
+        self.author = User.objects.create_user(username='author', password='password')
+        self.outsider = User.objects.create_user(username='outsider', password='password')
+        doc_type = DocumentType.objects.create(name='Скан')
+        self.content = bytes(range(256)) * 40
+        self.doc = Document.objects.create(title='Скан', document_type=doc_type, creator=self.author,
+                                           file=SimpleUploadedFile('scan.pdf', self.content))
+        self.url = f'/api/documents/{self.doc.id}/download/'
+        self.client = APIClient()
+        authenticate(self.client, self.author)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_full_range_and_conditional_requests(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('scan.pdf', response['Content-Disposition'])
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=99999-').status_code, 416)
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # A stale If-Range gets the whole file instead of a piece of a different one
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_visibility_and_signed_links(self):
+        authenticate(self.client, self.outsider)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+        authenticate(self.client, self.author)
+        file_url = self.client.get(f'/api/documents/{self.doc.id}/').data['file_url']
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get(self.url).status_code, 401)
+        response = anonymous.get(file_url)
+        self.assertEqual(response.status_code, 200)
+        # A token is bound to its object
+        token = file_url.split('token=')[1]
+        other = Document.objects.create(title='Другой', document_type=self.doc.document_type, creator=self.author,
+                                        file=SimpleUploadedFile('other.pdf', b'other'))
+        self.assertEqual(anonymous.get(f'/api/documents/{other.id}/download/', {'token': token}).status_code, 401)
+
+    @override_settings(FILE_SERVING_BACKEND='x-accel')
+    def test_transfer_is_offloaded_to_nginx(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + storage.blob_path(
+            storage.blob_sha256(self.doc.file.name)
+        ))
+        self.assertEqual(response.content, b'')
+
+@override_settings(TEXT_EXTRACTION_ASYNC=False)
+class PreviewTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = media_settings(self.media_root)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='author', password='password')
+        self.doc_type = DocumentType.objects.create(name='Акт')
+        self.client = APIClient()
+        authenticate(self.client, self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def create_document(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Document.objects.create(title=name, document_type=self.doc_type, creator=self.user,
+                                           file=SimpleUploadedFile(name, content))
+
+    def test_text_preview_is_generated_once_and_cached(self):
+        doc = self.create_document('act.txt', ('Первый абзац акта.\n' * 300).encode('utf-8'))
+        response = self.client.get(f'/api/documents/{doc.id}/preview/')
+        self.assertEqual(response.status_code, 200)
+        text = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(text.startswith('Первый абзац акта.'))
+        self.assertLessEqual(len(text), previews.TEXT_PREVIEW_CHARS + 2)
+
+        response = self.client.get(f'/api/documents/{doc.id}/preview/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        unsupported = self.create_document('scan.pdf', b'%PDF')
+        self.assertEqual(self.client.get(f'/api/documents/{unsupported.id}/preview/').status_code, 404)
+
+    def test_evicted_preview_is_regenerated_and_cache_stays_bounded(self):
+        first = self.create_document('a.txt', b'a' * 600)
+        old = previews.preview_path(previews.known_sha256(first.file.name), 'text')
+        os.utime(old, (0, 0))
+        with override_settings(PREVIEW_CACHE_MAX_BYTES=1000):
+            second = self.create_document('b.txt', b'b' * 600)
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(previews.preview_path(previews.known_sha256(second.file.name), 'text')))
+
+        # Generated again on request; synchronously here, so served right away
+        self.assertEqual(self.client.get(f'/api/documents/{first.id}/preview/').status_code, 200)
+        self.assertTrue(os.path.exists(old))
+
+        # While a worker is still generating it the client is asked to come back
+        os.remove(old)
+        previews._pending.add(first.file.name)
+        self.addCleanup(previews._pending.discard, first.file.name)
+        self.assertEqual(self.client.get(f'/api/documents/{first.id}/preview/').status_code, 202)
+
+    def test_failed_preview_is_not_retried(self):
+        doc = self.create_document('broken.txt', b'text')
+        url = f'/api/documents/{doc.id}/preview/'
+        path = previews.preview_path(previews.known_sha256(doc.file.name), 'text')
+        os.remove(path)
+        with mock.patch('documents.previews.render_text', side_effect=ValueError('damaged')) as render:
+            self.assertEqual(self.client.get(url).status_code, 404)
+            self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(render.call_count, 1)
+        self.assertTrue(os.path.exists(path + previews.FAILED_SUFFIX))
+
+    def test_malformed_version_is_rejected(self):
+        doc = self.create_document('act.txt', b'text')
+        self.assertEqual(self.client.get(f'/api/documents/{doc.id}/preview/', {'version': 'abc'}).status_code, 400)
+
+    @skipUnless(previews.Image, 'Pillow is not installed')
+    def test_image_thumbnail(self):
+        buffer = io.BytesIO()
+        previews.Image.new('RGB', (2000, 1000), 'red').save(buffer, 'JPEG')
+        doc = self.create_document('photo.jpg', buffer.getvalue())
+        response = self.client.get(f'/api/documents/{doc.id}/preview/')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        with previews.Image.open(io.BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (320, 160))
+
+
+@override_settings(TEXT_EXTRACTION_ASYNC=False, CACHES=LOCAL_CACHE)
+class AsyncReadTests(TestCase):
+    """GET endpoints answered by the async views, exercised through the ASGI handler"""
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = media_settings(self.media_root)
+        self.settings_override.enable()
+        cache.clear()
+        self.user = User.objects.create_user(username='rector', password='password', role='rector')
+        self.doc = Document.objects.create(
+            title='Приказ', document_type=DocumentType.objects.create(name='Приказ'), creator=self.user,
+            status='pending', file=SimpleUploadedFile('order.txt', b'0123456789' * 100),
+        )
+        StageApproval.objects.create(document=self.doc, step=0, approver_role='rector', approver=self.user)
+        DocumentAssignment.objects.create(document=self.doc, assignee=self.user, assigned_by=self.user)
+        ActionLog.objects.create(user=self.user, document=self.doc, action='created')
+        self.headers = {'authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    async def test_read_endpoints(self):
+        response = await self.async_client.get('/api/documents/', headers=self.headers)
+        self.assertEqual([doc['id'] for doc in response.json()['results']], [self.doc.id])
+
+        response = await self.async_client.get(f'/api/documents/{self.doc.id}/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['pending_approvers'], [self.user.id])
+        self.assertEqual(len(response.json()['assignments']), 1)
+
+        for url in ('/api/assignments/', '/api/workflow/logs/', '/api/users/list/'):
+            response = await self.async_client.get(url, headers=self.headers)
+            self.assertEqual((url, response.status_code, len(response.json())), (url, 200, 1))
+        response = await self.async_client.get('/api/users/me/', headers=self.headers)
+        self.assertEqual(response.json()['username'], 'rector')
+        response = await self.async_client.get('/api/workflow/statistics/', headers=self.headers)
+        self.assertIn('generated_at', response.json())
+
+        self.assertEqual((await self.async_client.get('/api/documents/')).status_code, 401)
+        response = await self.async_client.get('/api/documents/999/', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_download_is_streamed_asynchronously(self):
+        response = await self.async_client.get(f'/api/documents/{self.doc.id}/download/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([block async for block in response.streaming_content]), b'0123456789' * 100)
+
+        response = await self.async_client.get(f'/api/documents/{self.doc.id}/download/',
+                                               headers={**self.headers, 'range': 'bytes=10-19'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join([block async for block in response.streaming_content]), b'0123456789')
+        self.assertEqual((await self.async_client.get(f'/api/documents/{self.doc.id}/download/')).status_code, 401)
+
+    async def test_employee_sees_only_own_documents(self):
+        employee = await User.objects.acreate(username='employee', role='employee')
+        own = await Document.objects.acreate(title='Заявление', document_type_id=self.doc.document_type_id,
+                                             creator=employee)
+        headers = {'authorization': f'Bearer {RefreshToken.for_user(employee).access_token}'}
+        response = await self.async_client.get('/api/documents/', headers=headers)
+        self.assertEqual([doc['id'] for doc in response.json()['results']], [own.id])
+        response = await self.async_client.get(f'/api/documents/{self.doc.id}/', headers=headers)
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get('/api/users/me/', headers=headers)
+        self.assertEqual(response.json()['role'], 'employee')
+
+        # A deactivated user's token stops working, as in the sync views
+        await User.objects.filter(pk=employee.pk).aupdate(is_active=False)
+        self.assertEqual((await self.async_client.get('/api/documents/', headers=headers)).status_code, 401)
+
+    async def test_exports_stream_under_asgi(self):
+        response = await self.async_client.get('/api/documents/export/csv/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        # An async iterator: Django would otherwise build the whole body before sending it
+        self.assertTrue(response.is_async)
+        rows = b''.join([chunk async for chunk in response.streaming_content]).decode('utf-8-sig').splitlines()
+        self.assertEqual((len(rows), rows[1].split(',')[2]), (2, 'Приказ'))
+
+        response = await self.async_client.get('/api/documents/archive/', headers=self.headers)
+        self.assertTrue(response.is_async)
+        with zipfile.ZipFile(io.BytesIO(b''.join([chunk async for chunk in response.streaming_content]))) as archive:
+            name = next(name for name in archive.namelist() if name.endswith('/order.txt'))
+            self.assertEqual(archive.read(name), b'0123456789' * 100)
+
+    def test_writes_still_reach_the_viewsets(self):
+        client = APIClient()
+        authenticate(client, self.user)
+        response = client.patch(f'/api/documents/{self.doc.id}/', {'title': 'Новый приказ'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.get(f'/api/documents/{self.doc.id}/').data['title'], 'Новый приказ')
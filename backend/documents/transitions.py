@@ -0,0 +1,173 @@
+"""
+Document state machine.
+
+TRANSITIONS maps (current status, event) to the next status. move()
+applies an event to a document in memory; save_transition() persists it
+with a single UPDATE that only matches while the row is still in the
+status and route step the move started from, so two approvers acting at
+once cannot both advance the same step. Document.current_step is the
+index of the route stage awaiting approval while the document is pending;
+each approver of a stage has a StageApproval slot, and the stage advances
+once enough slots are signed.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from workflow import approvers, rollups
+from workflow.models import StageApproval
+
+from . import access, search
+from .models import Document, RegistrationSequence
+
+TRANSITIONS = {
+    ('draft', 'submit'): 'pending',
+    ('draft', 'auto_approve'): 'approved',
+    ('pending', 'sign'): 'pending',
+    ('pending', 'advance'): 'pending',
+    ('pending', 'approve'): 'approved',
+    ('pending', 'accept'): 'in_progress',
+    ('pending', 'reject'): 'rejected',
+    ('approved', 'start'): 'in_progress',
+    ('approved', 'complete'): 'completed',
+    ('in_progress', 'complete'): 'completed',
+}
+
+
+class TransitionError(Exception):
+    """The event is not allowed in the document's current status"""
+
+
+class TransitionConflict(TransitionError):
+    """The document changed since it was loaded"""
+
+
+def move(document, event, step=0, approver_id=None):
+    """Apply an event to the in-memory document"""
+    try:
+        target = TRANSITIONS[document.status, event]
+    except KeyError:
+        raise TransitionError('Недопустимый переход')
+    if not hasattr(document, '_transition_from'):
+        document._transition_from = (document.status, document.current_step)
+    document.status = target
+    document.current_step = step
+    document.current_approver_id = approver_id
+
+
+def save_transition(document):
+    """Persist a move() with one conditional UPDATE, then do what post_save would have done"""
+    status, step = document._transition_from
+    numbered = document.status != 'draft' and not document.registration_number
+    with transaction.atomic():
+        if numbered:
+            document.registration_number = RegistrationSequence.next_number(document.document_type_id)
+        document.updated_at = timezone.now()
+        updated = Document.objects.filter(pk=document.pk, status=status, current_step=step).update(
+            status=document.status,
+            current_step=document.current_step,
+            current_approver_id=document.current_approver_id,
+            registration_number=document.registration_number,
+            updated_at=document.updated_at,
+        )
+        if not updated:
+            raise TransitionConflict('Документ уже обработан другим пользователем')
+        rollups.record_bulk('documents.Document', [(document._rollup_state, document)])
+        access.rebuild_for_documents([document.pk])
+    del document._transition_from
+    document._rollup_state = rollups.capture_state(document, rollups.CONTRIBUTIONS['documents.Document'][1])
+    if numbered:
+        search.get_backend().index(document)
+
+
+def lock(document):
+    """Reload the document with its row locked for the rest of the transaction"""
+    return Document.objects.select_for_update(of=('self',)).select_related('creator').get(pk=document.pk)
+
+
+def open_stage(document, step, route):
+    """Approver slots of a stage, created the first time the document enters it"""
+    slots = list(StageApproval.objects.filter(document=document, step=step).order_by('id'))
+    if not slots:
+        roles = route.stages[step].roles
+        chosen = approvers.select_approvers(route, roles, document.creator.department_id)
+        slots = StageApproval.objects.bulk_create([
+            StageApproval(document=document, step=step, approver_role=role, approver_id=approver_id)
+            for role, approver_id in zip(roles, chosen)
+        ])
+        approvers.adjust_loads(chosen, 1)
+    return slots
+
+
+def close_stage(document, step):
+    """Drop the unsigned slots of a finished or abandoned stage"""
+    unsigned = StageApproval.objects.filter(document=document, step=step, approved_at__isnull=True)
+    approver_ids = list(unsigned.values_list('approver_id', flat=True))
+    if approver_ids:
+        unsigned.delete()
+        approvers.adjust_loads(approver_ids, -1)
+
+
+def pick_slot(slots, user):
+    """
+    The open slot `user` signs: their own, or an unassigned one for their
+    role (any unassigned one for an admin). Slots assigned to someone else
+    are never taken over, and a user signs a stage only once.
+    """
+    if any(slot.approver_id == user.id and slot.approved_at is not None for slot in slots):
+        raise TransitionError('Вы уже согласовали этот этап')
+    open_slots = [slot for slot in slots if slot.approved_at is None]
+    unassigned = [slot for slot in open_slots if slot.approver_id is None]
+    for candidates, matches in (
+        (open_slots, lambda slot: slot.approver_id == user.id),
+        (unassigned, lambda slot: slot.approver_role == user.role),
+        (unassigned, lambda slot: user.role == 'admin'),
+    ):
+        for slot in candidates:
+            if matches(slot):
+                return slot
+    raise TransitionError('Вы не участвуете в текущем этапе согласования')
+
+
+def apply_approve(document, user, direct_flow, is_assignee, route):
+    """
+    Move a pending document past `user`'s approval and return the message.
+
+    direct_flow: the document has assignments, so the assignee approves it
+    is_assignee: `user` is one of the document's assignees
+    route: the document type's workflow.routes.CompiledRoute
+    """
+    if direct_flow:
+        # In direct flow, approval by the assignee finalizes the document
+        by_approver = is_assignee or document.current_approver_id == user.id
+        move(document, 'accept')
+        return 'Документ согласован и принят в работу' if by_approver else 'Документ согласован'
+
+    step = document.current_step
+    if step < len(route.stages):
+        slots = open_stage(document, step, route)
+        slot = pick_slot(slots, user)
+        approvers.adjust_loads([slot.approver_id], -1)
+        slot.approver_id, slot.approved_at = user.id, timezone.now()
+        StageApproval.objects.filter(pk=slot.pk).update(approver_id=slot.approver_id, approved_at=slot.approved_at)
+
+        waiting = [s.approver_id for s in slots if s.approved_at is None]
+        if len(slots) - len(waiting) < route.stages[step].required:
+            move(document, 'sign', step=step, approver_id=waiting[0])
+            return 'Согласование учтено, ожидаются остальные участники этапа'
+        close_stage(document, step)
+
+        next_step = step + 1
+        if next_step < len(route.stages):
+            next_slots = open_stage(document, next_step, route)
+            move(document, 'advance', step=next_step, approver_id=next_slots[0].approver_id)
+            return 'Документ передан на следующий этап согласования'
+
+    # Final approval
+    move(document, 'approve')
+    return 'Документ утвержден'
+
+
+def apply_reject(document):
+    move(document, 'reject')
+    close_stage(document, document._transition_from[1])
+    return 'Документ отклонен'
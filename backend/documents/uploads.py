@@ -0,0 +1,216 @@
+"""
+Resumable chunked uploads.
+
+A client creates an UploadSession with the file name and size, PUTs the
+bytes in any number of chunks (each must start where the previous one
+ended, so after a dropped connection it asks for `received` and carries
+on), then finalizes the session onto a Document, a new DocumentVersion or
+an ActionLog. Chunks go to a partial file under CHUNKED_UPLOAD_DIR and
+are copied into storage in COPY_BLOCK pieces, so no step holds the file
+in memory.
+
+The SHA-256 is computed while chunks arrive. Hash state cannot be stored
+in the database, so each process keeps it for the sessions it has seen;
+if a chunk lands on another worker, the hash is recomputed from the
+partial file at finalization. The result is recorded in FileDigest, so
+text extraction does not hash the file again.
+
+Sessions a client never finishes are removed by `manage.py clear_uploads`
+once they have been idle for CHUNKED_UPLOAD_TTL.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from workflow.models import ActionLog
+
+from .access import visible_documents
+from .export import COPY_BLOCK
+from .models import FileDigest, UploadSession
+from .versions import add_version
+
+UPLOAD_TARGETS = ('document', 'version', 'action_log')
+MAX_HASHERS = 256
+
+_lock = threading.Lock()
+# session id -> (offset hashed so far, hashlib object), least recently used first
+_hashers = OrderedDict()
+
+
+class UploadError(Exception):
+    """The chunk or the finalization request is invalid"""
+
+
+class UploadConflict(UploadError):
+    """The chunk does not start at the session's current offset"""
+
+
+def parse_content_range(value):
+    """(offset, length) from a 'bytes start-end/total' Content-Range header"""
+    try:
+        unit, _, spec = value.partition(' ')
+        span, _, _total = spec.partition('/')
+        start, _, end = span.partition('-')
+        start, end = int(start), int(end)
+    except ValueError:
+        raise UploadError('Некорректный заголовок Content-Range')
+    if unit != 'bytes' or start < 0 or end < start:
+        raise UploadError('Некорректный заголовок Content-Range')
+    return start, end - start + 1
+
+
+def partial_path(session):
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{session.pk}.part')
+
+
+def create_session(user, filename, size):
+    session = UploadSession.objects.create(user=user, filename=os.path.basename(filename), size=size)
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(partial_path(session), 'wb').close()
+    return session
+
+
+def take_hasher(session_id, offset):
+    """The cached hash of the first `offset` bytes, if this process has it"""
+    with _lock:
+        cached = _hashers.pop(session_id, None)
+    if cached and cached[0] == offset:
+        return cached[1]
+    return hashlib.sha256() if offset == 0 else None
+
+
+def keep_hasher(session_id, offset, hasher):
+    with _lock:
+        _hashers[session_id] = (offset, hasher)
+        while len(_hashers) > MAX_HASHERS:
+            _hashers.popitem(last=False)
+
+
+def write_chunk(session, offset, stream, length):
+    """Append `length` bytes read from `stream` at `offset`; returns the new offset"""
+    if offset != session.received:
+        raise UploadConflict('Фрагмент должен начинаться с уже полученного смещения')
+    if offset + length > session.size:
+        raise UploadError('Фрагмент выходит за пределы заявленного размера файла')
+
+    with transaction.atomic():
+        # Claim the offset before touching the file: the UPDATE locks the row
+        # (the database on SQLite), so a retry of the same chunk waits here and
+        # then finds the offset moved on
+        claimed = UploadSession.objects.filter(pk=session.pk, received=offset).update(updated_at=timezone.now())
+        if not claimed:
+            raise UploadConflict('Фрагмент уже получен в другом запросе')
+
+        hasher = take_hasher(session.pk, offset)
+        written = 0
+        with open(partial_path(session), 'r+b') as target:
+            target.seek(offset)
+            while written < length:
+                block = stream.read(min(COPY_BLOCK, length - written))
+                if not block:
+                    break
+                target.write(block)
+                if hasher is not None:
+                    hasher.update(block)
+                written += len(block)
+            target.truncate()
+        UploadSession.objects.filter(pk=session.pk).update(received=offset + written)
+    session.received = offset + written
+    if hasher is not None:
+        keep_hasher(session.pk, session.received, hasher)
+    return session.received
+
+
+def file_hash(session):
+    hasher = take_hasher(session.pk, session.size)
+    if hasher is None:
+        hasher = hashlib.sha256()
+        with open(partial_path(session), 'rb') as source:
+            for block in iter(lambda: source.read(COPY_BLOCK), b''):
+                hasher.update(block)
+    return hasher.hexdigest()
+
+
+def finalize(session, user, target, document_id, action_log_id=None):
+    """Store the uploaded file on the target object and close the session; returns (object, sha256)"""
+    if target not in UPLOAD_TARGETS:
+        raise UploadError('Неизвестный объект для прикрепления файла')
+    if session.received != session.size:
+        raise UploadError('Файл загружен не полностью')
+    document = visible_documents(user).filter(pk=document_id).first()
+    if document is None:
+        raise UploadError('Документ не найден')
+
+    sha256 = file_hash(session)
+    if target == 'version':
+        with transaction.atomic():
+            with open(partial_path(session), 'rb') as source:
+                instance, _ = add_version(document, source, session.filename, user, sha256, session.size)
+            discard(session)
+        return instance, sha256
+
+    with transaction.atomic():
+        if target == 'document':
+            instance, field = document, document.file
+        else:
+            instance = ActionLog.objects.filter(
+                Q(file='') | Q(file__isnull=True), pk=action_log_id, document=document, user=user
+            ).first()
+            if instance is None:
+                raise UploadError('Запись журнала не найдена или уже содержит файл')
+            field = instance.file
+
+        with open(partial_path(session), 'rb') as source:
+            field.save(session.filename, File(source), save=False)
+        if target == 'document':
+            document.updated_at = timezone.now()
+            instance.save(update_fields=['file', 'updated_at'])
+        else:
+            instance.save(update_fields=['file'])
+        # Saved after the model, whose post_save still queues text extraction
+        FileDigest.objects.update_or_create(name=field.name, defaults={'sha256': sha256, 'size': session.size})
+        discard(session)
+    return instance, sha256
+
+
+def discard_stale(max_age):
+    """
+    Delete sessions untouched for `max_age` and partial files no session owns;
+    returns the number of sessions and files removed.
+    """
+    cutoff = timezone.now() - max_age
+    sessions = 0
+    for session in UploadSession.objects.filter(updated_at__lt=cutoff).iterator():
+        discard(session)
+        sessions += 1
+
+    files = 0
+    known = {str(pk) for pk in UploadSession.objects.values_list('pk', flat=True)}
+    directory = settings.CHUNKED_UPLOAD_DIR
+    for filename in os.listdir(directory) if os.path.isdir(directory) else ():
+        path = os.path.join(directory, filename)
+        # A file younger than max_age may belong to a session being created
+        if filename.removesuffix('.part') in known or os.path.getmtime(path) > cutoff.timestamp():
+            continue
+        os.remove(path)
+        files += 1
+    return sessions, files
+
+
+def discard(session):
+    """Delete the session and its partial file"""
+    path = partial_path(session)
+    with _lock:
+        _hashers.pop(session.pk, None)
+    session.delete()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -1,13 +1,27 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import DepartmentViewSet, DocumentTypeViewSet, DocumentViewSet, DocumentAssignmentViewSet
+from .async_views import (
+    assignment_detail, assignment_list, async_read, document_detail, document_list, file_download, routed,
+)
+from .views import DepartmentViewSet, DocumentTypeViewSet, DocumentViewSet, DocumentAssignmentViewSet, UploadSessionViewSet
 
 router = DefaultRouter()
 router.register(r'departments', DepartmentViewSet)
 router.register(r'types', DocumentTypeViewSet)
 router.register(r'documents', DocumentViewSet)
 router.register(r'assignments', DocumentAssignmentViewSet)
+router.register(r'uploads', UploadSessionViewSet)
 
+# Async GET handlers in front of the router for the busiest endpoints;
+# other methods fall through to the routed viewsets
 urlpatterns = [
+    path('documents/', async_read(document_list, routed(router, 'document-list'))),
+    path('documents/<int:pk>/', async_read(document_detail, routed(router, 'document-detail'))),
+    path('documents/<int:pk>/download/',
+         async_read(file_download('document'), routed(router, 'document-download'), anonymous=True)),
+    path('documents/<int:pk>/versions/<int:version_id>/download/',
+         async_read(file_download('version'), routed(router, 'document-version-download'), anonymous=True)),
+    path('assignments/', async_read(assignment_list, routed(router, 'documentassignment-list'))),
+    path('assignments/<int:pk>/', async_read(assignment_detail, routed(router, 'documentassignment-detail'))),
     path('', include(router.urls)),
 ]
@@ -0,0 +1,52 @@
+"""
+Document versions.
+
+add_version() stores a file as the next version of a document. Numbers
+come from DocumentVersion.next_number(), which makes concurrent uploads to
+one document wait for each other. A file whose SHA-256 equals the current
+version's is not written at all: the current version is returned instead.
+"""
+from django.core.files import File
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from . import extraction
+from .models import DocumentVersion, FileDigest
+from .storage import blob_sha256
+
+
+def stored_sha256(name):
+    return blob_sha256(name) or extraction.digest_for(name)[0]
+
+
+def version_list(document_id):
+    """A document's versions with size and hash taken from FileDigest, so listing reads no files"""
+    digest = FileDigest.objects.filter(name=OuterRef('file'))
+    return DocumentVersion.objects.filter(document_id=document_id).select_related('creator').annotate(
+        size=Subquery(digest.values('size')[:1]), sha256=Subquery(digest.values('sha256')[:1])
+    )
+
+
+def add_version(document, content, filename, user, sha256=None, size=None):
+    """Store `content` as the document's next version; returns (version, created)"""
+    if not hasattr(content, 'chunks'):
+        content = File(content, filename)
+    if sha256 is None:
+        content.seek(0)
+        sha256, size = extraction.file_sha256(content)
+
+    with transaction.atomic():
+        number = DocumentVersion.next_number(document.pk)
+        current = DocumentVersion.objects.filter(document=document).select_related('creator').first()
+        if current is not None and current.file and stored_sha256(current.file.name) == sha256:
+            # Nothing to store; also gives the document row and its number back
+            transaction.set_rollback(True)
+            return current, False
+
+        version = DocumentVersion(document=document, version_number=number, creator=user)
+        content.seek(0)
+        version.file.save(filename, content, save=False)
+        version.save()
+        # Saved after the model, whose post_save still queues text extraction
+        FileDigest.objects.update_or_create(name=version.file.name, defaults={'sha256': sha256, 'size': size})
+    return version, True
@@ -1,17 +1,42 @@
 from rest_framework import viewsets, permissions, parsers, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404
+from django.utils.cache import get_conditional_response
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 import hashlib
+import os
 
-from .models import Department, DocumentType, Document, DocumentAssignment, DocumentVersion
+from .models import Department, DocumentType, Document, DocumentAssignment, DocumentVersion, UploadSession
 from .serializers import (
     DepartmentSerializer, DocumentTypeSerializer, 
-    DocumentSerializer, DocumentListSerializer, DocumentAssignmentSerializer
+    DocumentSerializer, DocumentListSerializer, DocumentAssignmentSerializer, DocumentVersionListSerializer,
+    UploadSessionSerializer,
 )
-from workflow.models import ApprovalRoute, ActionLog
+from .access import visible_documents
+from .department_tree import subtree_q
+from .export import ASSIGNMENT_COLUMNS, DOCUMENT_COLUMNS, stream_archive, stream_export
+from .search import get_backend as get_search_backend
+from .pagination import KeysetPagination
+from .transitions import (
+    TransitionConflict, TransitionError, apply_approve, apply_reject, lock, move, open_stage, save_transition
+)
+from .bulk import (
+    BULK_ACTIONS, MAX_BULK_DOCUMENTS, BulkActionError, fan_out_assignment, resolve_assignees, run_bulk_action
+)
+from . import previews, serving, uploads
+from .versions import add_version, version_list
+from .uploads import UploadConflict, UploadError
+from users.hierarchy import subordinate_ids
+from workflow.models import ActionLog
+from workflow.routes import get_route
 
 User = get_user_model()
 
@@ -22,11 +47,49 @@ def generate_signature(user, document, action_type):
     return hashlib.sha256(data.encode()).hexdigest()[:32]
 
 
+def media_file(request, path):
+    """Development media view; names are resolved by the storage, not as paths under MEDIA_ROOT"""
+    try:
+        return FileResponse(default_storage.open(path, 'rb'), filename=os.path.basename(path))
+    except (OSError, ValueError):
+        raise Http404
+
+
+def parse_date_param(value):
+    """Parse a YYYY-MM-DD query parameter, ignoring malformed values"""
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+
+def parse_id_param(value, name):
+    """Parse an integer ID query parameter; malformed values are a 400"""
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: 'Ожидается целое число'})
+
+
 class DepartmentViewSet(viewsets.ModelViewSet):
-    queryset = Department.objects.all()
+    queryset = Department.objects.select_related('head')
     serializer_class = DepartmentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    @action(detail=True, methods=['get'])
+    def subtree(self, request, pk=None):
+        """The department and everything below it, nearest levels first"""
+        department = self.get_object()
+        departments = Department.objects.filter(ancestor_links__ancestor=department).select_related('head').annotate(
+            depth=F('ancestor_links__depth')
+        ).order_by('depth', 'name')
+        return Response([
+            {**data, 'depth': dept.depth}
+            for dept, data in zip(departments, self.get_serializer(departments, many=True).data)
+        ])
+
 
 class DocumentTypeViewSet(viewsets.ModelViewSet):
     queryset = DocumentType.objects.all()
@@ -39,9 +102,10 @@ class DocumentViewSet(viewsets.ModelViewSet):
     serializer_class = DocumentSerializer
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [parsers.MultiPartParser, parsers.FormParser, parsers.JSONParser]
+    pagination_class = KeysetPagination
 
     def get_serializer_class(self):
-        if self.action == 'list':
+        if self.action in ['list', 'search']:
             return DocumentListSerializer
         return DocumentSerializer
 
@@ -59,26 +123,61 @@ class DocumentViewSet(viewsets.ModelViewSet):
         if doc_type:
             queryset = queryset.filter(document_type_id=doc_type)
 
-        # Filter by role-based access
-        if user.role in ['admin', 'rector', 'secretary']:
-            pass  # Full access
-        elif user.role in ['prorector', 'dept_head']:
-            # See docs they created, assigned to them, or in their department
-            queryset = queryset.filter(
-                Q(creator=user) |
-                Q(current_approver=user) |
-                Q(assignments__assignee=user) |
-                Q(assignments__assigned_by=user) |
-                Q(creator__department=user.department)
-            ).distinct()
-        else:
-            # Regular employees see their own docs and assigned to them
-            queryset = queryset.filter(
-                Q(creator=user) |
-                Q(assignments__assignee=user)
-            ).distinct()
-
-        return queryset.order_by('-created_at')
+        # Filter by priority
+        priority = self.request.query_params.get('priority')
+        if priority:
+            queryset = queryset.filter(priority=priority)
+
+        # Filter by author's department, including subdepartments
+        subtree = parse_id_param(self.request.query_params.get('subtree'), 'subtree')
+        if subtree:
+            queryset = queryset.filter(subtree_q('creator__department', subtree))
+
+        # Filter by deadline range
+        deadline_from = parse_date_param(self.request.query_params.get('deadline_from'))
+        if deadline_from:
+            queryset = queryset.filter(deadline__gte=deadline_from)
+        deadline_to = parse_date_param(self.request.query_params.get('deadline_to'))
+        if deadline_to:
+            queryset = queryset.filter(deadline__lte=deadline_to)
+
+        # Filter by creation date range
+        created_from = parse_date_param(self.request.query_params.get('created_from'))
+        if created_from:
+            queryset = queryset.filter(created_at__date__gte=created_from)
+        created_to = parse_date_param(self.request.query_params.get('created_to'))
+        if created_to:
+            queryset = queryset.filter(created_at__date__lte=created_to)
+
+        # Full-text search (the search action ranks results itself)
+        search = self.request.query_params.get('q', '').strip()
+        if search and self.action != 'search':
+            queryset = get_search_backend().filter(queryset, search)
+
+        # Filter by role-based access (materialized in DocumentAccess)
+        queryset = visible_documents(user, queryset)
+
+        return self.with_related(queryset).order_by('-created_at', '-id')
+
+    def with_related(self, queryset):
+        """Load everything the serializer for this action touches up front"""
+        queryset = queryset.select_related('creator', 'document_type', 'current_approver')
+        if self.action in ['list', 'search']:
+            # Counted in a subquery so the visibility joins above cannot inflate it
+            assignment_count = DocumentAssignment.objects.filter(
+                document=OuterRef('pk')
+            ).order_by().values('document').annotate(c=Count('id')).values('c')
+            return queryset.annotate(
+                assignment_count=Coalesce(Subquery(assignment_count, output_field=IntegerField()), 0)
+            )
+        if self.action in ['retrieve', 'update', 'partial_update']:
+            return queryset.prefetch_related(
+                Prefetch('assignments', queryset=DocumentAssignment.objects.select_related(
+                    'assignee__department', 'assigned_by'
+                )),
+                Prefetch('versions', queryset=DocumentVersion.objects.select_related('creator')),
+            )
+        return queryset
 
     def perform_create(self, serializer):
         doc = serializer.save(creator=self.request.user)
@@ -90,6 +189,120 @@ class DocumentViewSet(viewsets.ModelViewSet):
             signed_at=timezone.now()
         )
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Ranked full-text search with highlighted snippets"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'Не указан поисковый запрос'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            return Response({'error': 'Неверные параметры страницы'}, status=status.HTTP_400_BAD_REQUEST)
+
+        hits = get_search_backend().search(self.get_queryset(), query, limit=limit, offset=offset)
+        serializer = self.get_serializer([hit.document for hit in hits], many=True)
+        results = []
+        for hit, data in zip(hits, serializer.data):
+            results.append({
+                **data,
+                'rank': hit.rank,
+                'title_highlight': hit.title_highlight,
+                'snippet': hit.snippet,
+            })
+        return Response({'results': results})
+
+    @action(detail=False, methods=['get'], url_path=r'export/(?P<fmt>csv|xlsx)')
+    def export(self, request, fmt=None):
+        """Stream every document matching the list filters as CSV or XLSX"""
+        return stream_export(request, self.get_queryset(), DOCUMENT_COLUMNS, fmt, 'documents')
+
+    @action(detail=False, methods=['get'])
+    def archive(self, request):
+        """Stream a ZIP of the files, versions and attachments of every matching document"""
+        return stream_archive(request, self.get_queryset(), 'documents')
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.AllowAny])
+    def download(self, request, pk=None):
+        """The document's file; accepts a JWT or a signed token from file_url"""
+        return serving.download(request, 'document', pk)
+
+    @action(detail=True, methods=['get', 'post'])
+    def versions(self, request, pk=None):
+        """
+        List the document's versions, or upload `file` as the next one:
+        201 for a new version, 200 with the current one if the content is unchanged
+        """
+        document = self.get_object()
+        context = self.get_serializer_context()
+        if request.method == 'POST':
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({'error': 'Файл не передан'}, status=status.HTTP_400_BAD_REQUEST)
+            version, created = add_version(document, upload, upload.name, request.user)
+            version = version_list(document.pk).get(pk=version.pk)
+            return Response(DocumentVersionListSerializer(version, context=context).data,
+                            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+        return Response(DocumentVersionListSerializer(version_list(document.pk), many=True, context=context).data)
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.AllowAny],
+            url_path=r'versions/(?P<version_id>\d+)/download')
+    def version_download(self, request, pk=None, version_id=None):
+        return serving.download(request, 'version', version_id, document_id=pk)
+
+    @action(detail=True, methods=['get'])
+    def preview(self, request, pk=None):
+        """Thumbnail or text preview of the document's file, or of ?version=<id>"""
+        document = self.get_object()
+        source = document
+        version_id = parse_id_param(request.query_params.get('version'), 'version')
+        if version_id:
+            source = document.versions.filter(pk=version_id).first()
+        if source is None or not source.file:
+            return Response({'error': 'Файл не найден'}, status=status.HTTP_404_NOT_FOUND)
+
+        preview = previews.cached_preview(source.file.name)
+        if preview is None:
+            return Response({'error': 'Предпросмотр для этого формата недоступен'}, status=status.HTTP_404_NOT_FOUND)
+        if preview is False:
+            return Response({'status': 'Предпросмотр готовится'}, status=status.HTTP_202_ACCEPTED)
+        path, content_type, sha256 = preview
+        etag = f'"{sha256}"'
+        response = get_conditional_response(request, etag=etag) or FileResponse(
+            open(path, 'rb'), content_type=content_type
+        )
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Approve, reject or assign many documents in one transaction"""
+        action_type = request.data.get('action')
+        if action_type not in BULK_ACTIONS:
+            return Response({'error': 'Неизвестное действие'}, status=status.HTTP_400_BAD_REQUEST)
+        # Form submissions repeat the key, JSON bodies send a list
+        data = request.data
+        ids = data.getlist('ids') if hasattr(data, 'getlist') else data.get('ids', [])
+        if not isinstance(ids, list):
+            return Response({'error': 'Неверный список документов'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = list(dict.fromkeys(int(pk) for pk in ids))
+        except (TypeError, ValueError):
+            return Response({'error': 'Неверный список документов'}, status=status.HTTP_400_BAD_REQUEST)
+        if not ids:
+            return Response({'error': 'Не выбраны документы'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > MAX_BULK_DOCUMENTS:
+            return Response({'error': f'Не более {MAX_BULK_DOCUMENTS} документов за раз'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results = run_bulk_action(request.user, ids, action_type, request.data)
+        except BulkActionError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': results})
+
     @action(detail=True, methods=['post'])
     def submit(self, request, pk=None):
         """Submit document for approval"""
@@ -98,33 +311,30 @@ class DocumentViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Документ не в статусе черновика'}, status=status.HTTP_400_BAD_REQUEST)
         
         # Check if document has assignments (Direct Assignment Flow)
-        first_route = None
-        if document.assignments.exists():
+        assignment = document.assignments.first()
+        if assignment:
             # If assigned, the assignee becomes the approver
-            assignment = document.assignments.first()
-            document.current_approver = assignment.assignee
-            document.status = 'pending'
+            move(document, 'submit', approver_id=assignment.assignee_id)
             msg = 'Документ отправлен на согласование исполнителю'
             action_type = 'submitted'
         else:
             # Route-based Flow
-            routes = ApprovalRoute.objects.filter(document_type=document.document_type).order_by('step_order')
-            first_route = routes.first()
-            
-            if first_route:
-                approver = User.objects.filter(role=first_route.approver_role).first()
-                document.current_approver = approver
-                document.status = 'pending'
+            route = get_route(document.document_type_id)
+            if route.stages:
+                slots = open_stage(document, 0, route)
+                move(document, 'submit', step=0, approver_id=slots[0].approver_id)
                 msg = 'Документ отправлен на согласование'
                 action_type = 'submitted'
             else:
                 # No routes - auto approve
-                document.status = 'approved'
-                document.current_approver = None
+                move(document, 'auto_approve')
                 msg = 'Документ утвержден (маршруты не настроены)'
                 action_type = 'approved'
-        
-        document.save()
+
+        try:
+            save_transition(document)
+        except TransitionConflict as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
 
         ActionLog.objects.create(
             user=request.user,
@@ -144,48 +354,19 @@ class DocumentViewSet(viewsets.ModelViewSet):
         if document.status != 'pending':
             return Response({'error': 'Документ не на согласовании'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Check if this is a Direct Assignment Flow
-        if document.assignments.exists():
-            # In direct flow, approval by the assignee finalizes the document
-            # Check if the current user is the assignee (or current_approver)
-            is_assignee = document.assignments.filter(assignee=request.user).exists()
-            
-            if is_assignee or document.current_approver == request.user:
-                document.status = 'in_progress'
-                document.current_approver = None
-                msg = 'Документ согласован и принят в работу'
-            else:
-                # Should not happen if logic is correct, but fallback
-                document.status = 'in_progress'
-                document.current_approver = None
-                msg = 'Документ согласован'
-        else:
-            # Route-based Flow
-            routes = list(ApprovalRoute.objects.filter(document_type=document.document_type).order_by('step_order'))
-            
-            # Determine current step based on user role or current_approver
-            current_idx = -1
-            for i, route in enumerate(routes):
-                if route.approver_role == request.user.role:
-                    current_idx = i
-                    # If we found multiple steps with same role, we should ideally know which one we are at.
-                    # For simplicity, we take the first one that matches the role if current_approver matches user
-                    if document.current_approver == request.user:
-                        break
-
-            next_idx = current_idx + 1
-            if next_idx < len(routes):
-                next_route = routes[next_idx]
-                next_approver = User.objects.filter(role=next_route.approver_role).first()
-                document.current_approver = next_approver
-                msg = 'Документ передан на следующий этап согласования'
-            else:
-                # Final approval
-                document.status = 'approved'
-                msg = 'Документ утвержден'
-                document.current_approver = None
-
-        document.save()
+        try:
+            with transaction.atomic():
+                # Approvals of a parallel stage are counted under the row lock
+                document = lock(document)
+                direct_flow = document.assignments.exists()
+                is_assignee = direct_flow and document.assignments.filter(assignee=request.user).exists()
+                route = None if direct_flow else get_route(document.document_type_id)
+                msg = apply_approve(document, request.user, direct_flow, is_assignee, route)
+                save_transition(document)
+        except TransitionConflict as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        except TransitionError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
         # Handle file upload
         uploaded_file = request.FILES.get('file', None)
@@ -209,9 +390,16 @@ class DocumentViewSet(viewsets.ModelViewSet):
         if document.status != 'pending':
             return Response({'error': 'Документ не на согласовании'}, status=status.HTTP_400_BAD_REQUEST)
 
-        document.status = 'rejected'
-        document.current_approver = None
-        document.save()
+        try:
+            with transaction.atomic():
+                # Closing the stage drops slots and approver loads; they go back with a lost race
+                document = lock(document)
+                msg = apply_reject(document)
+                save_transition(document)
+        except TransitionConflict as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        except TransitionError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
         # Handle file upload
         uploaded_file = request.FILES.get('file', None)
@@ -226,51 +414,29 @@ class DocumentViewSet(viewsets.ModelViewSet):
             signed_at=timezone.now()
         )
 
-        return Response({'status': 'Документ отклонен'})
+        return Response({'status': msg})
 
     @action(detail=True, methods=['post'])
     def assign(self, request, pk=None):
-        """Assign document to executor"""
+        """Assign document to one executor or fan out to users, a department or a role"""
         document = self.get_object()
         
-        assignee_id = request.data.get('assignee')
-        instruction = request.data.get('instruction', '')
-        deadline = request.data.get('deadline')
-
-        if not assignee_id:
-            return Response({'error': 'Не указан исполнитель'}, status=status.HTTP_400_BAD_REQUEST)
-
         try:
-            assignee = User.objects.get(id=assignee_id)
-        except User.DoesNotExist:
-            return Response({'error': 'Исполнитель не найден'}, status=status.HTTP_404_NOT_FOUND)
-
-        assignment = DocumentAssignment.objects.create(
-            document=document,
-            assignee=assignee,
-            assigned_by=request.user,
-            instruction=instruction,
-            deadline=deadline,
-            signature=generate_signature(request.user, document, 'assigned'),
-            signed_at=timezone.now()
-        )
+            assignees = resolve_assignees(request.data)
+        except BulkActionError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Update document status
-        if document.status == 'approved':
-            document.status = 'in_progress'
-            document.save()
-
-        ActionLog.objects.create(
-            user=request.user,
-            document=document,
-            assignment=assignment,
-            action='assigned',
-            comment=f'Назначен исполнитель: {assignee.get_full_name()}. Резолюция: {instruction}',
-            signature=generate_signature(request.user, document, 'assigned'),
-            signed_at=timezone.now()
-        )
+        try:
+            assignments = fan_out_assignment(
+                request.user, document, assignees,
+                request.data.get('instruction', ''), request.data.get('deadline') or None
+            )
+        except TransitionConflict as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
 
-        return Response(DocumentAssignmentSerializer(assignment).data, status=status.HTTP_201_CREATED)
+        if len(assignments) == 1 and not ({'assignees', 'department', 'role'} & set(request.data.keys())):
+            return Response(DocumentAssignmentSerializer(assignments[0]).data, status=status.HTTP_201_CREATED)
+        return Response(DocumentAssignmentSerializer(assignments, many=True).data, status=status.HTTP_201_CREATED)
 
 
 class DocumentAssignmentViewSet(viewsets.ModelViewSet):
@@ -280,25 +446,35 @@ class DocumentAssignmentViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        queryset = DocumentAssignment.objects.all()
+        queryset = DocumentAssignment.objects.select_related('assignee__department', 'assigned_by')
 
         # Filter by document
-        doc_id = self.request.query_params.get('document')
+        doc_id = parse_id_param(self.request.query_params.get('document'), 'document')
         if doc_id:
             queryset = queryset.filter(document_id=doc_id)
 
+        # Filter by assignee's department, including subdepartments
+        subtree = parse_id_param(self.request.query_params.get('subtree'), 'subtree')
+        if subtree:
+            queryset = queryset.filter(subtree_q('assignee__department', subtree))
+
         # Filter by role
         if user.role in ['admin', 'rector', 'secretary']:
             pass
         elif user.is_manager():
             queryset = queryset.filter(
-                Q(assignee=user) | Q(assigned_by=user) | Q(assignee__supervisor=user)
+                Q(assignee=user) | Q(assigned_by=user) | Q(assignee_id__in=subordinate_ids(user))
             )
         else:
             queryset = queryset.filter(assignee=user)
 
         return queryset.order_by('-created_at')
 
+    @action(detail=False, methods=['get'], url_path=r'export/(?P<fmt>csv|xlsx)')
+    def export(self, request, fmt=None):
+        """Stream every assignment matching the list filters as CSV or XLSX"""
+        return stream_export(request, self.get_queryset(), ASSIGNMENT_COLUMNS, fmt, 'assignments')
+
     @action(detail=True, methods=['post'])
     def accept(self, request, pk=None):
         """Accept assignment"""
@@ -349,7 +525,55 @@ class DocumentAssignmentViewSet(viewsets.ModelViewSet):
         document = assignment.document
         pending_assignments = document.assignments.exclude(status='completed').count()
         if pending_assignments == 0 and document.status in ['in_progress', 'approved']:
-            document.status = 'completed'
-            document.save()
+            move(document, 'complete')
+            try:
+                save_transition(document)
+            except TransitionConflict:
+                pass  # A parallel completion already closed the document
 
         return Response({'status': 'Задание выполнено'})
+
+
+class UploadSessionViewSet(viewsets.ModelViewSet):
+    """Resumable uploads: create a session, PUT chunks with Content-Range, then finalize"""
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    http_method_names = ['get', 'post', 'put', 'delete', 'head', 'options']
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user).order_by('-created_at')
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        serializer.instance = uploads.create_session(self.request.user, data['filename'], data['size'])
+
+    def update(self, request, *args, **kwargs):
+        """Write one chunk; the body is the raw bytes, Content-Range gives their position"""
+        session = self.get_object()
+        try:
+            offset, length = uploads.parse_content_range(request.headers.get('Content-Range', ''))
+            received = uploads.write_chunk(session, offset, request.stream, length)
+        except UploadConflict as exc:
+            session.refresh_from_db()
+            return Response({'error': str(exc), 'received': session.received}, status=status.HTTP_409_CONFLICT)
+        except UploadError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'received': received, 'size': session.size})
+
+    def perform_destroy(self, instance):
+        uploads.discard(instance)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """Attach the complete file to a document, a new version or an action log entry"""
+        session = self.get_object()
+        try:
+            instance, sha256 = uploads.finalize(
+                session, request.user, request.data.get('target'),
+                request.data.get('document'), request.data.get('action_log')
+            )
+        except UploadError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'id': instance.pk, 'file': instance.file.name, 'sha256': sha256},
+                        status=status.HTTP_201_CREATED)
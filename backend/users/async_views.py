@@ -0,0 +1,15 @@
+"""Async GET handlers for the current user and the user list (see documents.async_views)"""
+from documents.async_views import api_response, fetch_all, read_view
+
+from .serializers import UserSerializer
+from .views import UserListView
+
+
+async def me(request):
+    # authenticate() loaded the department and supervisor the serializer reads
+    return api_response(UserSerializer(request.user).data)
+
+
+async def user_list(request):
+    view = read_view(UserListView, request)
+    return api_response(view.get_serializer(await fetch_all(view.get_queryset()), many=True).data)
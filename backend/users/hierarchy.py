@@ -0,0 +1,89 @@
+"""
+Supervisor hierarchy.
+
+subordinate_ids(user) is everyone below the user in the `supervisor`
+chain, at any depth, resolved with one recursive CTE. Results are cached
+per user under a shared generation token that any supervisor change
+replaces (see users.signals). supervisor_chains() walks the other way, for
+a batch of users at once, and is not cached.
+"""
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+
+GENERATION_KEY = 'users:hierarchy:generation'
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def invalidate():
+    """Drop every cached subordinate set"""
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def query_subordinate_ids(user_id):
+    User = get_user_model()
+    quote = connection.ops.quote_name
+    table = quote(User._meta.db_table)
+    pk = quote(User._meta.pk.column)
+    supervisor = quote(User._meta.get_field('supervisor').column)
+    # UNION (not UNION ALL) drops repeats, so a cycle in the data terminates
+    sql = f"""
+        WITH RECURSIVE subordinates(id) AS (
+            SELECT {pk} FROM {table} WHERE {supervisor} = %s
+            UNION
+            SELECT u.{pk} FROM {table} u JOIN subordinates s ON u.{supervisor} = s.id
+        )
+        SELECT id FROM subordinates
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id])
+        return {row[0] for row in cursor.fetchall() if row[0] != user_id}
+
+
+def subordinate_ids(user):
+    """IDs of all direct and indirect subordinates of `user`"""
+    key = f'users:subordinates:{get_generation()}:{user.pk}'
+    ids = cache.get(key)
+    if ids is None:
+        ids = query_subordinate_ids(user.pk)
+        cache.set(key, ids, timeout=None)
+    return ids
+
+
+def supervisor_chains(user_ids):
+    """Map each of `user_ids` to the IDs of everyone above it in the supervisor chain"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    User = get_user_model()
+    quote = connection.ops.quote_name
+    table = quote(User._meta.db_table)
+    pk = quote(User._meta.pk.column)
+    supervisor = quote(User._meta.get_field('supervisor').column)
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    sql = f"""
+        WITH RECURSIVE chain(user_id, supervisor_id) AS (
+            SELECT {pk}, {supervisor} FROM {table}
+            WHERE {pk} IN ({placeholders}) AND {supervisor} IS NOT NULL
+            UNION
+            SELECT c.user_id, u.{supervisor} FROM chain c JOIN {table} u ON u.{pk} = c.supervisor_id
+            WHERE u.{supervisor} IS NOT NULL
+        )
+        SELECT user_id, supervisor_id FROM chain
+    """
+    chains = {}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, user_ids)
+        for user_id, supervisor_id in cursor.fetchall():
+            if supervisor_id != user_id:
+                chains.setdefault(user_id, set()).add(supervisor_id)
+    return chains
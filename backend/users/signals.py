@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import hierarchy
+
+User = get_user_model()
+
+
+@receiver(post_init, sender=User)
+def remember_supervisor(sender, instance, **kwargs):
+    instance._hierarchy_supervisor = instance.__dict__.get('supervisor_id')
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if instance.supervisor_id != (None if created else instance._hierarchy_supervisor):
+        hierarchy.invalidate()
+    instance._hierarchy_supervisor = instance.supervisor_id
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    # Subordinates lose their supervisor through a plain UPDATE
+    hierarchy.invalidate()
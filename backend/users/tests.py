@@ -1,3 +1,66 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
 
-# Create your tests here.
+from .hierarchy import subordinate_ids
+
+User = get_user_model()
+
+# cache.clear() must not reach the shared cache
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class SubordinateHierarchyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rector = User.objects.create_user(username='rector', password='x', role='rector')
+        self.prorector = User.objects.create_user(username='prorector', password='x', role='prorector', supervisor=self.rector)
+        self.head = User.objects.create_user(username='head', password='x', role='dept_head', supervisor=self.prorector)
+        self.employee = User.objects.create_user(username='employee', password='x', supervisor=self.head)
+
+    def test_resolves_all_levels(self):
+        self.assertEqual(subordinate_ids(self.rector), {self.prorector.id, self.head.id, self.employee.id})
+        self.assertEqual(subordinate_ids(self.head), {self.employee.id})
+        self.assertEqual(subordinate_ids(self.employee), set())
+
+    def test_cached_until_supervisor_changes(self):
+        subordinate_ids(self.prorector)
+        with self.assertNumQueries(0):
+            self.assertEqual(subordinate_ids(self.prorector), {self.head.id, self.employee.id})
+
+        self.employee.supervisor = self.rector
+        self.employee.save()
+        self.assertEqual(subordinate_ids(self.prorector), {self.head.id})
+
+        # Saves that leave the supervisor alone keep the cache
+        self.head.position = 'Заведующий'
+        self.head.save()
+        with self.assertNumQueries(0):
+            subordinate_ids(self.prorector)
+
+    def test_cycle_terminates(self):
+        User.objects.filter(pk=self.rector.pk).update(supervisor=self.employee)
+        self.assertEqual(subordinate_ids(self.head), {self.employee.id, self.rector.id, self.prorector.id})
+
+    def test_subordinates_view_includes_indirect(self):
+        client = APIClient()
+        client.force_authenticate(self.prorector)
+        response = client.get('/api/users/subordinates/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({row['id'] for row in response.data}, {self.head.id, self.employee.id})
+
+
+class UserListFilterTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin).access_token}')
+
+    def test_malformed_ids_are_rejected(self):
+        for url in ('/api/users/list/', '/api/users/manage/'):
+            for param in ('subtree', 'department'):
+                response = self.client.get(url, {param: 'abc'})
+                self.assertEqual((url, param, response.status_code), (url, param, 400))
@@ -4,6 +4,8 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
+from documents.async_views import async_read
+from .async_views import me, user_list
 from .views import MeView, UserListView, SubordinatesView, UserViewSet
 
 router = DefaultRouter()
@@ -13,7 +15,7 @@ urlpatterns = [
     path('', include(router.urls)),
     path('login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-    path('me/', MeView.as_view(), name='user_me'),
-    path('list/', UserListView.as_view(), name='user_list'),
+    path('me/', async_read(me, MeView.as_view()), name='user_me'),
+    path('list/', async_read(user_list, UserListView.as_view()), name='user_list'),
     path('subordinates/', SubordinatesView.as_view(), name='user_subordinates'),
 ]
@@ -4,6 +4,9 @@ from rest_framework.response import Response
 from .serializers import UserSerializer, UserListSerializer
 from .permissions import IsSystemAdmin
 from django.contrib.auth import get_user_model
+from documents.department_tree import subtree_q
+from documents.views import parse_id_param
+from .hierarchy import subordinate_ids
 
 User = get_user_model()
 
@@ -14,11 +17,14 @@ class UserViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        department = self.request.query_params.get('department')
+        department = parse_id_param(self.request.query_params.get('department'), 'department')
         role = self.request.query_params.get('role')
         
         if department:
             queryset = queryset.filter(department_id=department)
+        subtree = parse_id_param(self.request.query_params.get('subtree'), 'subtree')
+        if subtree:
+            queryset = queryset.filter(subtree_q('department', subtree))
         if role:
             queryset = queryset.filter(role=role)
         
@@ -39,12 +45,15 @@ class UserListView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        queryset = User.objects.all()
-        department = self.request.query_params.get('department')
+        queryset = User.objects.select_related('department')
+        department = parse_id_param(self.request.query_params.get('department'), 'department')
         role = self.request.query_params.get('role')
         
         if department:
             queryset = queryset.filter(department_id=department)
+        subtree = parse_id_param(self.request.query_params.get('subtree'), 'subtree')
+        if subtree:
+            queryset = queryset.filter(subtree_q('department', subtree))
         if role:
             queryset = queryset.filter(role=role)
         
@@ -52,13 +61,13 @@ class UserListView(generics.ListAPIView):
 
 
 class SubordinatesView(APIView):
-    """Get subordinates of current user"""
+    """Get all subordinates of current user, at any depth"""
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
         user = request.user
-        # Get direct subordinates
-        subordinates = User.objects.filter(supervisor=user)
+        # Direct and indirect subordinates
+        subordinates = User.objects.filter(id__in=subordinate_ids(user))
         # If user is dept head, also get department employees
         if user.role == 'dept_head' and user.department:
             dept_employees = User.objects.filter(department=user.department).exclude(id=user.id)
@@ -0,0 +1,70 @@
+"""
+Approver selection.
+
+Among the active users holding a step's role, the approver is the one
+closest to the document's department, then the one with the fewest open
+approval slots, then the lowest ID. Closeness is the number of levels
+walked up Department.parent from the document's department until reaching
+the candidate's department (or a department the candidate heads);
+candidates outside that chain come last.
+
+Open slots per user are kept in StatCounter (metric 'approver_pending')
+and adjusted whenever StageApproval slots are created, signed or dropped.
+"""
+from collections import Counter
+
+from .models import StatCounter
+from .rollups import bump
+
+LOAD_METRIC = 'approver_pending'
+FAR = float('inf')
+
+
+def department_chain(departments, department_id):
+    """The department and its ancestors, nearest first"""
+    chain = []
+    while department_id is not None and department_id not in chain:
+        chain.append(department_id)
+        department_id = departments.get(department_id, (None, None))[0]
+    return chain
+
+
+def pending_loads(user_ids):
+    rows = StatCounter.objects.filter(metric=LOAD_METRIC, key__in=[str(pk) for pk in user_ids])
+    return {int(key): value for key, value in rows.values_list('key', 'value')}
+
+
+def adjust_loads(user_ids, delta):
+    """Add delta to the open-slot counter of every user in user_ids (repeats count)"""
+    for user_id, count in Counter(pk for pk in user_ids if pk is not None).items():
+        bump(StatCounter, {'metric': LOAD_METRIC, 'key': str(user_id)}, delta * count)
+
+
+def select_approvers(route, roles, department_id):
+    """
+    Pick one approver per role (a stage may list several roles) with a
+    single load query; a user is not picked twice for the same stage.
+    Returns user IDs, None where a role has no active users.
+    """
+    chain = department_chain(route.departments, department_id)
+    distance = {}
+    for level, pk in enumerate(chain):
+        distance.setdefault(pk, level)
+        head_id = route.departments.get(pk, (None, None))[1]
+        if head_id is not None:
+            distance.setdefault(('head', head_id), level)
+
+    candidates = {role: route.candidates.get(role, ()) for role in roles}
+    loads = pending_loads({user_id for pool in candidates.values() for user_id, _ in pool})
+
+    def rank(user_id, dept_id):
+        closeness = min(distance.get(dept_id, FAR), distance.get(('head', user_id), FAR))
+        return closeness, loads.get(user_id, 0), user_id
+
+    chosen = []
+    for role in roles:
+        pool = candidates[role]
+        # Prefer someone not already on this stage, but reuse if the role has no one else
+        fresh = [candidate for candidate in pool if candidate[0] not in chosen] or pool
+        chosen.append(min(rank(*candidate) for candidate in fresh)[2] if fresh else None)
+    return chosen
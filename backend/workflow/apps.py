@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class WorkflowConfig(AppConfig):
     name = 'workflow'
+
+    def ready(self):
+        from . import signals  # noqa: F401
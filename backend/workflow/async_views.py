@@ -0,0 +1,26 @@
+"""Async GET handlers for the action log and the statistics dashboard (see documents.async_views)"""
+from asgiref.sync import sync_to_async
+from django.http import Http404
+
+from documents.async_views import api_response, fetch_all, read_view
+
+from .views import ActionLogViewSet, statistics_data
+
+
+async def log_list(request):
+    view = read_view(ActionLogViewSet, request, 'list')
+    return api_response(view.get_serializer(await fetch_all(view.get_queryset()), many=True).data)
+
+
+async def log_detail(request, pk):
+    view = read_view(ActionLogViewSet, request, 'retrieve', pk=pk)
+    log = await view.get_queryset().filter(pk=pk).afirst()
+    if log is None:
+        raise Http404
+    return api_response(view.get_serializer(log).data)
+
+
+async def statistics(request):
+    # Snapshots live in the shared cache and are rebuilt under its lock, all sync
+    data, status = await sync_to_async(statistics_data)(request.user)
+    return api_response(data, status=status)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from workflow import rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild statistics rollups from documents, assignments and action logs'
+
+    def handle(self, *args, **options):
+        rollups.reconcile()
+        self.stdout.write(self.style.SUCCESS('Статистика пересчитана'))
@@ -0,0 +1,64 @@
+# Generated by Django 6.0 on 2026-10-18 05:42
+
+from django.db import migrations, models
+
+
+def populate_rollups(apps, schema_editor):
+    from workflow.rollups import reconcile
+    reconcile(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflow', '0003_actionlog_file'),
+        ('documents', '0008_registrationsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=50, verbose_name='Показатель')),
+                ('day', models.DateField(verbose_name='День')),
+                ('key', models.CharField(blank=True, max_length=50, verbose_name='Ключ')),
+                ('value', models.IntegerField(default=0, verbose_name='Значение')),
+            ],
+            options={
+                'verbose_name': 'Дневная статистика',
+                'verbose_name_plural': 'Дневная статистика',
+                'constraints': [models.UniqueConstraint(fields=('metric', 'day', 'key'), name='unique_daily_stat')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=50, verbose_name='Показатель')),
+                ('month', models.DateField(help_text='Первое число месяца', verbose_name='Месяц')),
+                ('key', models.CharField(blank=True, max_length=50, verbose_name='Ключ')),
+                ('value', models.IntegerField(default=0, verbose_name='Значение')),
+            ],
+            options={
+                'verbose_name': 'Месячная статистика',
+                'verbose_name_plural': 'Месячная статистика',
+                'constraints': [models.UniqueConstraint(fields=('metric', 'month', 'key'), name='unique_monthly_stat')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=50, verbose_name='Показатель')),
+                ('key', models.CharField(max_length=50, verbose_name='Ключ')),
+                ('value', models.IntegerField(default=0, verbose_name='Значение')),
+            ],
+            options={
+                'verbose_name': 'Счетчик статистики',
+                'verbose_name_plural': 'Счетчики статистики',
+                'constraints': [models.UniqueConstraint(fields=('metric', 'key'), name='unique_stat_counter')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
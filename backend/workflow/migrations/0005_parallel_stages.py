@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-18 10:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflow', '0004_statistics_rollups'),
+        ('documents', '0009_document_current_step'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='approvalroute',
+            name='quorum',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Шаги с одинаковым номером согласуются параллельно. Сколько согласований этапа достаточно; пусто — нужны все', null=True, verbose_name='Кворум этапа'),
+        ),
+        migrations.CreateModel(
+            name='StageApproval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('step', models.PositiveSmallIntegerField(verbose_name='Этап')),
+                ('approver_role', models.CharField(max_length=50, verbose_name='Роль согласующего')),
+                ('approved_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата согласования')),
+                ('approver', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stage_approvals', to=settings.AUTH_USER_MODEL, verbose_name='Согласующий')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stage_approvals', to='documents.document', verbose_name='Документ')),
+            ],
+            options={
+                'verbose_name': 'Согласование этапа',
+                'verbose_name_plural': 'Согласования этапов',
+                'indexes': [models.Index(fields=['document', 'step'], name='stage_approval_doc_step_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflow', '0005_parallel_stages'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='actionlog',
+            name='file',
+            field=models.FileField(blank=True, max_length=255, null=True, upload_to='action_logs/%Y/%m/%d/', verbose_name='Прикрепленный файл'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 6.0 on 2026-10-18 17:20
+
+from django.db import migrations
+from django.db.models import Exists, F, OuterRef
+
+LOAD_METRIC = 'approver_pending'
+
+
+def create_pending_slots(apps, schema_editor):
+    """
+    Documents already pending when stage slots were introduced have none,
+    so pick_slot() would turn their current approver away and open_stage()
+    could pick someone else. Give each the slots of its current stage, with
+    the current approver in the slot of their role (or the first one).
+    Documents approved by their assignees (direct flow) use no slots.
+    """
+    Document = apps.get_model('documents', 'Document')
+    ApprovalRoute = apps.get_model('workflow', 'ApprovalRoute')
+    StageApproval = apps.get_model('workflow', 'StageApproval')
+    StatCounter = apps.get_model('workflow', 'StatCounter')
+
+    has_slots = StageApproval.objects.filter(document=OuterRef('pk'), step=OuterRef('current_step'))
+    pending = Document.objects.filter(status='pending', assignments__isnull=True).exclude(
+        Exists(has_slots)
+    ).values_list('id', 'document_type_id', 'current_step', 'current_approver_id', 'current_approver__role')
+    if not pending.exists():
+        return
+
+    # {type_id: [[roles of the first stage], [roles of the second], ...]}
+    stages = {}
+    last_order = {}
+    routes = ApprovalRoute.objects.order_by('document_type_id', 'step_order', 'id').values_list(
+        'document_type_id', 'step_order', 'approver_role'
+    )
+    for type_id, step_order, role in routes:
+        if last_order.get(type_id) != step_order:
+            stages.setdefault(type_id, []).append([])
+            last_order[type_id] = step_order
+        stages[type_id][-1].append(role)
+
+    slots, loads = [], {}
+    for document_id, type_id, step, approver_id, approver_role in pending.distinct().iterator():
+        route = stages.get(type_id, [])
+        if step >= len(route):
+            continue
+        roles = route[step]
+        # The current approver takes the slot of their role, or the first one
+        assigned = roles.index(approver_role) if approver_role in roles else 0
+        for index, role in enumerate(roles):
+            slot_approver = approver_id if index == assigned else None
+            slots.append(StageApproval(document_id=document_id, step=step, approver_role=role,
+                                       approver_id=slot_approver))
+            if slot_approver is not None:
+                loads[slot_approver] = loads.get(slot_approver, 0) + 1
+    StageApproval.objects.bulk_create(slots, batch_size=500)
+
+    for user_id, count in loads.items():
+        counter, _ = StatCounter.objects.get_or_create(metric=LOAD_METRIC, key=str(user_id))
+        StatCounter.objects.filter(pk=counter.pk).update(value=F('value') + count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflow', '0007_cache_table'),
+        ('documents', '0014_documentversion_unique_number'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_pending_slots, migrations.RunPython.noop),
+    ]
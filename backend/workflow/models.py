@@ -5,6 +5,7 @@ class ApprovalRoute(models.Model):
     document_type = models.ForeignKey('documents.DocumentType', on_delete=models.CASCADE, related_name='routes', verbose_name='Тип документа')
     step_order = models.PositiveIntegerField(verbose_name='Порядковый номер шага')
     approver_role = models.CharField(max_length=50, verbose_name='Роль согласующего', help_text='Код роли (например, dept_head, prorector)')
+    quorum = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name='Кворум этапа', help_text='Шаги с одинаковым номером согласуются параллельно. Сколько согласований этапа достаточно; пусто — нужны все')
     
     class Meta:
         verbose_name = 'Маршрут согласования'
@@ -12,6 +13,22 @@ class ApprovalRoute(models.Model):
         ordering = ['step_order']
 
 
+class StageApproval(models.Model):
+    """One approver slot of a route stage a document has entered"""
+    document = models.ForeignKey('documents.Document', on_delete=models.CASCADE, related_name='stage_approvals', verbose_name='Документ')
+    step = models.PositiveSmallIntegerField(verbose_name='Этап')
+    approver_role = models.CharField(max_length=50, verbose_name='Роль согласующего')
+    approver = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='stage_approvals', verbose_name='Согласующий')
+    approved_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата согласования')
+
+    class Meta:
+        verbose_name = 'Согласование этапа'
+        verbose_name_plural = 'Согласования этапов'
+        indexes = [
+            models.Index(fields=['document', 'step'], name='stage_approval_doc_step_idx'),
+        ]
+
+
 class ActionLog(models.Model):
     ACTION_CHOICES = (
         ('created', 'Создан'),
@@ -32,7 +49,7 @@ class ActionLog(models.Model):
     assignment = models.ForeignKey('documents.DocumentAssignment', on_delete=models.CASCADE, null=True, blank=True, related_name='logs', verbose_name='Назначение')
     action = models.CharField(max_length=20, choices=ACTION_CHOICES, verbose_name='Действие')
     comment = models.TextField(blank=True, verbose_name='Комментарий')
-    file = models.FileField(upload_to='action_logs/%Y/%m/%d/', blank=True, null=True, verbose_name='Прикрепленный файл')
+    file = models.FileField(upload_to='action_logs/%Y/%m/%d/', max_length=255, blank=True, null=True, verbose_name='Прикрепленный файл')
     signature = models.CharField(max_length=255, blank=True, verbose_name='Подпись (хэш)')
     signed_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата подписи')
     timestamp = models.DateTimeField(auto_now_add=True, verbose_name='Время')
@@ -44,3 +61,47 @@ class ActionLog(models.Model):
 
     def __str__(self):
         return f"{self.user} - {self.get_action_display()} - {self.document}"
+
+
+class StatCounter(models.Model):
+    """Current-state counter, e.g. documents per status (see workflow.rollups)"""
+    metric = models.CharField(max_length=50, verbose_name='Показатель')
+    key = models.CharField(max_length=50, verbose_name='Ключ')
+    value = models.IntegerField(default=0, verbose_name='Значение')
+
+    class Meta:
+        verbose_name = 'Счетчик статистики'
+        verbose_name_plural = 'Счетчики статистики'
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'key'], name='unique_stat_counter'),
+        ]
+
+
+class DailyStat(models.Model):
+    """Per-day rollup, e.g. actions logged per day"""
+    metric = models.CharField(max_length=50, verbose_name='Показатель')
+    day = models.DateField(verbose_name='День')
+    key = models.CharField(max_length=50, blank=True, verbose_name='Ключ')
+    value = models.IntegerField(default=0, verbose_name='Значение')
+
+    class Meta:
+        verbose_name = 'Дневная статистика'
+        verbose_name_plural = 'Дневная статистика'
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'day', 'key'], name='unique_daily_stat'),
+        ]
+
+
+class MonthlyStat(models.Model):
+    """Per-month rollup, e.g. documents created per month"""
+    metric = models.CharField(max_length=50, verbose_name='Показатель')
+    month = models.DateField(verbose_name='Месяц', help_text='Первое число месяца')
+    key = models.CharField(max_length=50, blank=True, verbose_name='Ключ')
+    value = models.IntegerField(default=0, verbose_name='Значение')
+
+    class Meta:
+        verbose_name = 'Месячная статистика'
+        verbose_name_plural = 'Месячная статистика'
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'month', 'key'], name='unique_monthly_stat'),
+        ]
@@ -0,0 +1,242 @@
+"""
+Incrementally maintained statistics.
+
+Every document, assignment and action log contributes +1 to a fixed set
+of rollup rows (see *_contributions below). Signal handlers diff the
+contributions of an object before and after a write and apply the delta
+in the same transaction, so StatisticsView reads a handful of small rows
+instead of scanning the base tables. reconcile() rebuilds everything from
+scratch and is exposed as the reconcile_statistics command.
+"""
+from collections import Counter
+from datetime import date, timedelta
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import DailyStat, MonthlyStat, StatCounter
+
+OPEN_STATUSES = ['pending', 'in_progress']
+COMPLETED_STATUSES = ['completed', 'approved']
+
+
+def month_start(value):
+    return value.replace(day=1)
+
+
+def local_date(value):
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+
+def shift_month(value, months):
+    month_index = value.year * 12 + value.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def document_contributions(state):
+    if state is None:
+        return []
+    rows = [
+        (StatCounter, (('key', state['status']), ('metric', 'document_status'))),
+        (StatCounter, (('key', str(state['document_type_id'])), ('metric', 'document_type'))),
+    ]
+    if state['created_at']:
+        created = local_date(state['created_at'])
+        rows.append((MonthlyStat, (('key', ''), ('metric', 'documents_created'), ('month', month_start(created)))))
+    if state['status'] in OPEN_STATUSES and state['deadline']:
+        rows.append((DailyStat, (('day', state['deadline']), ('key', ''), ('metric', 'open_deadline'))))
+    return rows
+
+
+def assignment_contributions(state):
+    if state is None:
+        return []
+    rows = [(StatCounter, (('key', state['status']), ('metric', 'assignment_status')))]
+    if state['status'] == 'completed':
+        rows.append((StatCounter, (('key', str(state['assignee_id'])), ('metric', 'executor_completed'))))
+    return rows
+
+
+def log_contributions(state):
+    if state is None or not state['timestamp']:
+        return []
+    return [(DailyStat, (('day', local_date(state['timestamp'])), ('key', state['action']), ('metric', 'log_action')))]
+
+
+CONTRIBUTIONS = {
+    'documents.Document': (
+        document_contributions, ['status', 'document_type_id', 'deadline', 'created_at']
+    ),
+    'documents.DocumentAssignment': (assignment_contributions, ['status', 'assignee_id']),
+    'workflow.ActionLog': (log_contributions, ['action', 'timestamp']),
+}
+
+
+def capture_state(instance, fields):
+    """Field values as loaded, or None if any of them is deferred"""
+    values = instance.__dict__
+    if any(field not in values for field in fields):
+        return None
+    return {field: values[field] for field in fields}
+
+
+def bump(model, lookup, delta):
+    """Add delta to one rollup row, creating it on first use"""
+    rows = model.objects.filter(**lookup)
+    if rows.update(value=F('value') + delta):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(value=delta, **lookup)
+    except IntegrityError:
+        rows.update(value=F('value') + delta)
+
+
+def apply_change(old_rows, new_rows):
+    deltas = Counter(new_rows)
+    deltas.subtract(Counter(old_rows))
+    with transaction.atomic():
+        for (model, lookup), delta in deltas.items():
+            if delta:
+                bump(model, dict(lookup), delta)
+
+
+def record_bulk(label, changes):
+    """
+    Apply rollups for writes that bypass signals (bulk_create/bulk_update).
+    changes: (old instance state or None, saved instance) pairs
+    """
+    contributions, fields = CONTRIBUTIONS[label]
+    old_rows, new_rows = [], []
+    for old_state, instance in changes:
+        old_rows.extend(contributions(old_state))
+        new_rows.extend(contributions(capture_state(instance, fields)))
+    apply_change(old_rows, new_rows)
+
+
+def reconcile(apps=global_apps):
+    """Recompute every rollup from the base tables (also used by a data migration)"""
+    Document = apps.get_model('documents', 'Document')
+    DocumentAssignment = apps.get_model('documents', 'DocumentAssignment')
+    ActionLog = apps.get_model('workflow', 'ActionLog')
+    StatCounter = apps.get_model('workflow', 'StatCounter')
+    DailyStat = apps.get_model('workflow', 'DailyStat')
+    MonthlyStat = apps.get_model('workflow', 'MonthlyStat')
+
+    with transaction.atomic():
+        StatCounter.objects.all().delete()
+        DailyStat.objects.all().delete()
+        MonthlyStat.objects.all().delete()
+
+        counters = []
+        for status, count in Document.objects.values_list('status').annotate(c=Count('id')).order_by():
+            counters.append(StatCounter(metric='document_status', key=status, value=count))
+        for type_id, count in Document.objects.values_list('document_type_id').annotate(c=Count('id')).order_by():
+            counters.append(StatCounter(metric='document_type', key=str(type_id), value=count))
+        for status, count in DocumentAssignment.objects.values_list('status').annotate(c=Count('id')).order_by():
+            counters.append(StatCounter(metric='assignment_status', key=status, value=count))
+        completed = DocumentAssignment.objects.filter(status='completed')
+        for assignee_id, count in completed.values_list('assignee_id').annotate(c=Count('id')).order_by():
+            counters.append(StatCounter(metric='executor_completed', key=str(assignee_id), value=count))
+        try:
+            StageApproval = apps.get_model('workflow', 'StageApproval')
+        except LookupError:
+            # Running from a migration that predates approval stages
+            StageApproval = None
+        if StageApproval is not None:
+            open_slots = StageApproval.objects.filter(approved_at__isnull=True, approver__isnull=False)
+            for approver_id, count in open_slots.values_list('approver_id').annotate(c=Count('id')).order_by():
+                counters.append(StatCounter(metric='approver_pending', key=str(approver_id), value=count))
+        StatCounter.objects.bulk_create(counters)
+
+        daily = []
+        open_docs = Document.objects.filter(status__in=OPEN_STATUSES, deadline__isnull=False)
+        for day, count in open_docs.values_list('deadline').annotate(c=Count('id')).order_by():
+            daily.append(DailyStat(metric='open_deadline', day=day, key='', value=count))
+        logs = ActionLog.objects.annotate(day=TruncDate('timestamp')).values_list('day', 'action')
+        for day, action, count in logs.annotate(c=Count('id')).order_by():
+            daily.append(DailyStat(metric='log_action', day=day, key=action, value=count))
+        DailyStat.objects.bulk_create(daily)
+
+        monthly = []
+        created = Document.objects.annotate(month=TruncMonth('created_at')).values_list('month')
+        for month, count in created.annotate(c=Count('id')).order_by():
+            monthly.append(MonthlyStat(metric='documents_created', month=local_date(month), key='', value=count))
+        MonthlyStat.objects.bulk_create(monthly)
+
+
+def statistics_snapshot():
+    """Dashboard payload assembled from the rollup tables"""
+    from django.contrib.auth import get_user_model
+    from documents.models import DocumentType
+
+    today = timezone.localdate()
+    this_month = month_start(today)
+
+    counters = {}
+    for metric, key, value in StatCounter.objects.filter(
+        metric__in=['document_status', 'document_type', 'assignment_status']
+    ).exclude(value=0).values_list('metric', 'key', 'value'):
+        counters.setdefault(metric, {})[key] = value
+
+    type_names = dict(DocumentType.objects.values_list('id', 'name'))
+    status_counts = counters.get('document_status', {})
+    assignment_counts = counters.get('assignment_status', {})
+
+    overdue = DailyStat.objects.filter(
+        metric='open_deadline', day__lt=today
+    ).aggregate(total=Sum('value'))['total'] or 0
+
+    recent = DailyStat.objects.filter(
+        metric='log_action', day__gt=today - timedelta(days=7)
+    ).values('key').annotate(count=Sum('value')).filter(count__gt=0).order_by()
+
+    first_month = shift_month(this_month, -5)
+    created = dict(MonthlyStat.objects.filter(
+        metric='documents_created', month__gte=first_month
+    ).values_list('month', 'value'))
+    monthly_trends = []
+    for offset in range(6):
+        month = shift_month(first_month, offset)
+        monthly_trends.append({'month': month.strftime('%b'), 'count': created.get(month, 0)})
+
+    executors = list(StatCounter.objects.filter(
+        metric='executor_completed', value__gt=0
+    ).order_by('-value')[:5].values_list('key', 'value'))
+    User = get_user_model()
+    names = {
+        str(pk): (first, last)
+        for pk, first, last in User.objects.filter(
+            id__in=[int(key) for key, _ in executors]
+        ).values_list('id', 'first_name', 'last_name')
+    }
+    top_executors = [
+        {'assignee__first_name': names.get(key, ('', ''))[0],
+         'assignee__last_name': names.get(key, ('', ''))[1],
+         'count': value}
+        for key, value in executors
+    ]
+
+    total_docs = sum(status_counts.values())
+    completed_docs = sum(status_counts.get(status, 0) for status in COMPLETED_STATUSES)
+    completion_rate = round((completed_docs / total_docs * 100) if total_docs > 0 else 0, 1)
+
+    return {
+        'status_stats': [{'status': key, 'count': value} for key, value in status_counts.items()],
+        'type_stats': [
+            {'document_type__name': type_names.get(int(key), key), 'count': value}
+            for key, value in counters.get('document_type', {}).items()
+        ],
+        'overdue_count': overdue,
+        'assignment_stats': [{'status': key, 'count': value} for key, value in assignment_counts.items()],
+        'recent_activity': [{'action': row['key'], 'count': row['count']} for row in recent],
+        'docs_this_month': created.get(this_month, 0),
+        'top_executors': top_executors,
+        'total_documents': total_docs,
+        'total_assignments': sum(assignment_counts.values()),
+        'monthly_trends': monthly_trends,
+        'completion_rate': completion_rate,
+    }
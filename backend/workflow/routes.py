@@ -0,0 +1,125 @@
+"""
+Compiled approval routes.
+
+ApprovalRoute rows sharing a step_order form one stage whose approvers
+work in parallel; a stage is complete once `required` of them approved.
+A document type's stages, the users who can fill each role and the
+department tree are compiled once and kept in process memory, so
+submit/approve do not query routes or candidates (workflow.approvers picks
+among the candidates). Every process checks a version token in the
+shared cache before using its table; route and department edits and user
+role/department changes replace that token and all processes recompile on
+next use.
+"""
+import threading
+import uuid
+from dataclasses import dataclass, field
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from .models import ApprovalRoute
+
+VERSION_KEY = 'workflow:routes:version'
+
+_lock = threading.Lock()
+_compiled = {}
+_compiled_version = None
+
+
+@dataclass(frozen=True)
+class Stage:
+    roles: tuple
+    required: int
+
+
+@dataclass(frozen=True)
+class CompiledRoute:
+    """
+    Ordered stages of a document type.
+    candidates: role -> ((user_id, department_id), ...) ordered by user ID
+    departments: department_id -> (parent_id, head_id) for the whole tree
+    """
+    stages: tuple
+    candidates: dict = field(default_factory=dict)
+    departments: dict = field(default_factory=dict)
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate():
+    """Make every process recompile its route tables"""
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def compile_routes(document_type_ids):
+    """Build CompiledRoute objects for the given types with three queries"""
+    from documents.models import Department
+
+    User = get_user_model()
+    # {type_id: {step_order: ([roles], [quorums])}}, insertion-ordered by step_order
+    steps = {type_id: {} for type_id in document_type_ids}
+    for type_id, step_order, role, quorum in ApprovalRoute.objects.filter(
+        document_type_id__in=document_type_ids
+    ).order_by('document_type_id', 'step_order', 'id').values_list(
+        'document_type_id', 'step_order', 'approver_role', 'quorum'
+    ):
+        roles, quorums = steps[type_id].setdefault(step_order, ([], []))
+        roles.append(role)
+        if quorum:
+            quorums.append(quorum)
+
+    all_roles = {role for type_steps in steps.values() for roles, _ in type_steps.values() for role in roles}
+    candidates = {}
+    for user_id, role, department_id in User.objects.filter(
+        role__in=all_roles, is_active=True
+    ).order_by('id').values_list('id', 'role', 'department_id'):
+        candidates.setdefault(role, []).append((user_id, department_id))
+    departments = {
+        pk: (parent_id, head_id)
+        for pk, parent_id, head_id in Department.objects.values_list('id', 'parent_id', 'head_id')
+    }
+
+    compiled = {}
+    for type_id, type_steps in steps.items():
+        stages = tuple(
+            Stage(roles=tuple(roles), required=min(max(quorums, default=len(roles)), len(roles)))
+            for roles, quorums in type_steps.values()
+        )
+        roles = {role for stage in stages for role in stage.roles}
+        compiled[type_id] = CompiledRoute(
+            stages=stages,
+            candidates={role: tuple(candidates.get(role, ())) for role in roles},
+            departments=departments,
+        )
+    return compiled
+
+
+def get_routes(document_type_ids):
+    """CompiledRoute per document type ID, compiling whatever is missing"""
+    global _compiled, _compiled_version
+    # Read the version before compiling, so a concurrent change is never masked
+    version = get_version()
+    with _lock:
+        if version != _compiled_version:
+            _compiled = {}
+            _compiled_version = version
+        table = _compiled
+    missing = [type_id for type_id in set(document_type_ids) if type_id not in table]
+    if missing:
+        compiled = compile_routes(missing)
+        with _lock:
+            if _compiled_version == version:
+                _compiled.update(compiled)
+        table = {**table, **compiled}
+    return {type_id: table[type_id] for type_id in document_type_ids}
+
+
+def get_route(document_type_id):
+    return get_routes([document_type_id])[document_type_id]
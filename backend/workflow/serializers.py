@@ -1,24 +1,30 @@
 from rest_framework import serializers
+from documents.serving import download_url
+
 from .models import ApprovalRoute, ActionLog
 
 class ApprovalRouteSerializer(serializers.ModelSerializer):
     class Meta:
         model = ApprovalRoute
-        fields = ['id', 'document_type', 'step_order', 'approver_role']
+        fields = ['id', 'document_type', 'step_order', 'approver_role', 'quorum']
 
 
 class ActionLogSerializer(serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.get_full_name', read_only=True, allow_null=True)
     action_display = serializers.CharField(source='get_action_display', read_only=True)
     assignment_info = serializers.SerializerMethodField()
+    file_url = serializers.SerializerMethodField()
 
     class Meta:
         model = ActionLog
         fields = [
             'id', 'user', 'user_name', 'document', 'assignment', 'assignment_info',
-            'action', 'action_display', 'comment', 'file', 'signature', 'signed_at', 'timestamp'
+            'action', 'action_display', 'comment', 'file', 'file_url', 'signature', 'signed_at', 'timestamp'
         ]
 
+    def get_file_url(self, obj):
+        return download_url(self.context.get('request'), 'log', obj)
+
     def get_assignment_info(self, obj):
         if obj.assignment:
             return {
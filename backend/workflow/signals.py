@@ -0,0 +1,70 @@
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from django.conf import settings
+
+from . import rollups, routes, snapshots
+
+
+def connect_rollups(label, contributions, fields):
+    # Closures, so the receivers must be kept alive with weak=False
+    @receiver(post_init, sender=label, weak=False)
+    def remember(sender, instance, **kwargs):
+        instance._rollup_state = rollups.capture_state(instance, fields)
+
+    @receiver(pre_save, sender=label, weak=False)
+    def load_missing(sender, instance, raw=False, **kwargs):
+        if raw or instance._state.adding or instance._rollup_state is not None:
+            return
+        instance._rollup_state = sender.objects.filter(pk=instance.pk).values(*fields).first()
+
+    @receiver(post_save, sender=label, weak=False)
+    def saved(sender, instance, created, raw=False, **kwargs):
+        if raw:
+            return
+        old = None if created else instance._rollup_state
+        new = rollups.capture_state(instance, fields)
+        rollups.apply_change(contributions(old), contributions(new))
+        instance._rollup_state = new
+
+    @receiver(post_delete, sender=label, weak=False)
+    def deleted(sender, instance, **kwargs):
+        rollups.apply_change(contributions(rollups.capture_state(instance, fields)), [])
+
+
+for label, (contributions, fields) in rollups.CONTRIBUTIONS.items():
+    connect_rollups(label, contributions, fields)
+
+
+@receiver(post_save, sender='workflow.ActionLog')
+def actionlog_written(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    snapshots.invalidate()
+
+
+@receiver(post_save, sender='workflow.ApprovalRoute')
+@receiver(post_delete, sender='workflow.ApprovalRoute')
+@receiver(post_save, sender='documents.Department')
+@receiver(post_delete, sender='documents.Department')
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def routes_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    routes.invalidate()
+
+
+@receiver(post_init, sender=settings.AUTH_USER_MODEL)
+def remember_route_scope(sender, instance, **kwargs):
+    values = instance.__dict__
+    instance._route_scope = (values.get('role'), values.get('department_id'), values.get('is_active'))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    scope = (instance.role, instance.department_id, instance.is_active)
+    if created or scope != instance._route_scope:
+        routes.invalidate()
+    instance._route_scope = scope
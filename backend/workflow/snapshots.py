@@ -0,0 +1,62 @@
+"""
+Cached statistics snapshots.
+
+The statistics are the same for every role allowed to see them, so all of
+them share one cached snapshot. It is stale once it is older than
+STATISTICS_CACHE_TTL or once an ActionLog write has replaced the cache
+generation. Only the request that wins the recompute lock rebuilds a
+stale snapshot; concurrent requests keep getting the previous one.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .rollups import statistics_snapshot
+
+GENERATION_KEY = 'statistics:generation'
+SNAPSHOT_KEY = 'statistics:snapshot'
+LOCK_KEY = 'statistics:lock'
+LOCK_TIMEOUT = 30
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def invalidate():
+    """Mark every cached snapshot stale"""
+    # A fresh token rather than incr(), which no cache backend here does
+    # atomically: concurrent invalidations can then never cancel out
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def get_snapshot():
+    """Return (payload, generated_at timestamp)"""
+    ttl = getattr(settings, 'STATISTICS_CACHE_TTL', 60)
+    generation = get_generation()
+    entry = cache.get(SNAPSHOT_KEY)
+    if entry and entry['generation'] == generation and time.time() - entry['generated_at'] < ttl:
+        return entry['payload'], entry['generated_at']
+
+    acquired = cache.add(LOCK_KEY, 1, timeout=LOCK_TIMEOUT)
+    if entry and not acquired:
+        # Someone else is already recomputing; serve the last value
+        return entry['payload'], entry['generated_at']
+
+    try:
+        entry = {
+            'payload': statistics_snapshot(),
+            'generated_at': time.time(),
+            'generation': generation,
+        }
+        cache.set(SNAPSHOT_KEY, entry, timeout=None)
+    finally:
+        if acquired:
+            cache.delete(LOCK_KEY)
+    return entry['payload'], entry['generated_at']
@@ -1,3 +1,166 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import serializers
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from documents.models import Department, Document, DocumentAssignment, DocumentType
+from documents.transitions import open_stage
+from . import approvers, routes, snapshots
+from .models import ActionLog, ApprovalRoute, StatCounter
+from .rollups import reconcile, statistics_snapshot
+
+User = get_user_model()
+
+# cache.clear() must not reach the shared cache
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class StatisticsRollupTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='password', first_name='Анна')
+        self.executor = User.objects.create_user(username='executor', password='password', first_name='Иван')
+        self.doc_type = DocumentType.objects.create(name='Приказ')
+
+    def populate(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        docs = [
+            Document.objects.create(title=f'Приказ {i}', document_type=self.doc_type, creator=self.author,
+                                    status='pending', deadline=yesterday)
+            for i in range(3)
+        ]
+        docs[0].status = 'approved'
+        docs[0].save()
+        docs[1].delete()
+        assignment = DocumentAssignment.objects.create(document=docs[2], assignee=self.executor)
+        assignment.status = 'completed'
+        assignment.save()
+        ActionLog.objects.create(user=self.author, document=docs[2], action='submitted')
+
+    def test_incremental_rollups_match_reconciliation(self):
+        self.populate()
+        incremental = statistics_snapshot()
+        self.assertEqual(incremental['total_documents'], 2)
+        self.assertEqual(incremental['overdue_count'], 1)
+        self.assertEqual(incremental['completion_rate'], 50.0)
+        self.assertEqual(incremental['top_executors'][0]['assignee__first_name'], 'Иван')
+
+        reconcile()
+        self.assertEqual(statistics_snapshot(), incremental)
+
+    def test_snapshot_query_count_is_constant(self):
+        self.populate()
+        with self.assertNumQueries(7):
+            statistics_snapshot()
+        self.populate()
+        with self.assertNumQueries(7):
+            statistics_snapshot()
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class StatisticsSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rector = User.objects.create_user(username='rector', password='password', role='rector')
+        self.doc_type = DocumentType.objects.create(name='Приказ')
+
+    def test_snapshot_is_cached_until_actionlog_write(self):
+        payload, generated_at = snapshots.get_snapshot()
+        with self.assertNumQueries(0):
+            self.assertEqual(snapshots.get_snapshot(), (payload, generated_at))
+
+        doc = Document.objects.create(title='Приказ', document_type=self.doc_type, creator=self.rector)
+        ActionLog.objects.create(user=self.rector, document=doc, action='created')
+        payload, _ = snapshots.get_snapshot()
+        self.assertEqual(payload['total_documents'], 1)
+
+    def test_stale_snapshot_served_while_another_request_recomputes(self):
+        payload, generated_at = snapshots.get_snapshot()
+        snapshots.invalidate()
+        cache.add(snapshots.LOCK_KEY, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(snapshots.get_snapshot(), (payload, generated_at))
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class RouteCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doc_type = DocumentType.objects.create(name='Служебная записка')
+        ApprovalRoute.objects.create(document_type=self.doc_type, step_order=1, approver_role='dept_head')
+        ApprovalRoute.objects.create(document_type=self.doc_type, step_order=2, approver_role='rector')
+        self.head = User.objects.create_user(username='head', password='password', role='dept_head')
+        self.rector = User.objects.create_user(username='rector', password='password', role='rector')
+
+    def test_compiled_route_is_reused_until_invalidated(self):
+        route = routes.get_route(self.doc_type.id)
+        self.assertEqual([stage.roles for stage in route.stages], [('dept_head',), ('rector',)])
+        self.assertEqual(route.candidates['dept_head'], ((self.head.id, None),))
+        with self.assertNumQueries(0):
+            self.assertIs(routes.get_route(self.doc_type.id), route)
+
+        ApprovalRoute.objects.create(document_type=self.doc_type, step_order=3, approver_role='prorector')
+        self.assertEqual(len(routes.get_route(self.doc_type.id).stages), 3)
+
+    def test_role_change_recompiles_candidates(self):
+        routes.get_route(self.doc_type.id)
+        self.head.role = 'employee'
+        self.head.save()
+        self.assertEqual(routes.get_route(self.doc_type.id).candidates['dept_head'], ())
+
+    def test_invalidation_seen_by_other_processes(self):
+        route = routes.get_route(self.doc_type.id)
+        # Another process replacing the shared version
+        cache.set(routes.VERSION_KEY, 'another-process')
+        self.assertIsNot(routes.get_route(self.doc_type.id), route)
+
+    def test_fixture_loading_leaves_the_cache_alone(self):
+        data = serializers.serialize('json', [self.head, ApprovalRoute.objects.first()])
+        route = routes.get_route(self.doc_type.id)
+        # loaddata saves with raw=True
+        for obj in serializers.deserialize('json', data):
+            obj.save()
+        self.assertIs(routes.get_route(self.doc_type.id), route)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ApproverSelectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.university = Department.objects.create(name='Университет')
+        self.faculty = Department.objects.create(name='Факультет', parent=self.university)
+        self.other = Department.objects.create(name='Другой факультет', parent=self.university)
+        self.author = User.objects.create_user(username='author', password='password', department=self.faculty)
+        self.prorectors = [
+            User.objects.create_user(username=f'prorector{i}', password='password', role='prorector')
+            for i in range(2)
+        ]
+        self.doc_type = DocumentType.objects.create(name='Заявление')
+        ApprovalRoute.objects.create(document_type=self.doc_type, step_order=1, approver_role='prorector')
+
+    def submit(self):
+        doc = Document.objects.create(title='Заявление', document_type=self.doc_type, creator=self.author)
+        route = routes.get_route(self.doc_type.id)
+        slots = open_stage(doc, 0, route)
+        return slots[0].approver_id
+
+    def test_load_is_spread_across_equal_candidates(self):
+        chosen = [self.submit() for _ in range(4)]
+        self.assertEqual(sorted(chosen), sorted([p.id for p in self.prorectors] * 2))
+        self.assertEqual(approvers.pending_loads([p.id for p in self.prorectors]),
+                         {p.id: 2 for p in self.prorectors})
+
+        incremental = list(StatCounter.objects.filter(metric='approver_pending').values_list('key', 'value'))
+        reconcile()
+        self.assertCountEqual(
+            StatCounter.objects.filter(metric='approver_pending').values_list('key', 'value'), incremental
+        )
+
+    def test_department_proximity_wins_over_load(self):
+        self.other.head = self.prorectors[0]
+        self.other.save()
+        self.university.head = self.prorectors[1]
+        self.university.save()
+        self.assertEqual({self.submit() for _ in range(3)}, {self.prorectors[1].id})
@@ -1,5 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from documents.async_views import async_read, file_download, routed
+from .async_views import log_detail, log_list, statistics
 from .views import ApprovalRouteViewSet, ActionLogViewSet, StatisticsView
 
 router = DefaultRouter()
@@ -7,6 +9,10 @@ router.register(r'routes', ApprovalRouteViewSet)
 router.register(r'logs', ActionLogViewSet)
 
 urlpatterns = [
+    path('logs/', async_read(log_list, routed(router, 'actionlog-list'))),
+    path('logs/<int:pk>/', async_read(log_detail, routed(router, 'actionlog-detail'))),
+    path('logs/<int:pk>/download/',
+         async_read(file_download('log'), routed(router, 'actionlog-download'), anonymous=True)),
     path('', include(router.urls)),
-    path('statistics/', StatisticsView.as_view(), name='statistics'),
+    path('statistics/', async_read(statistics, StatisticsView.as_view()), name='statistics'),
 ]
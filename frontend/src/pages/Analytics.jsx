@@ -143,10 +143,17 @@ const Analytics = () => {
     return (
         <div className="p-6 bg-gradient-to-br from-slate-50 to-blue-50 min-h-screen">
             <div className="flex justify-between items-center mb-8">
-                <h1 className="text-3xl font-bold text-gray-800 flex items-center gap-3">
-                    <PieChartIcon size={32} className="text-blue-600" />
-                    Аналитика
-                </h1>
+                <div>
+                    <h1 className="text-3xl font-bold text-gray-800 flex items-center gap-3">
+                        <PieChartIcon size={32} className="text-blue-600" />
+                        Аналитика
+                    </h1>
+                    {stats.snapshot_age !== undefined && (
+                        <div className="text-sm text-gray-500 mt-1">
+                            Данные обновлены {Math.round(stats.snapshot_age)} сек. назад
+                        </div>
+                    )}
+                </div>
                 <div className="flex gap-3">
                     <button
                         onClick={exportToPDF}
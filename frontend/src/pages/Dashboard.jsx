@@ -14,8 +14,8 @@ const Dashboard = () => {
     useEffect(() => {
         const fetchData = async () => {
             try {
-                const docsRes = await api.get('/documents/');
-                setMyDocs(docsRes.data.slice(0, 5));
+                const docsRes = await api.get('/documents/', { params: { page_size: 5 } });
+                setMyDocs(docsRes.data.results);
 
                 const assignRes = await api.get('/assignments/');
                 setMyAssignments(assignRes.data.filter(a => a.assignee === user.id && a.status !== 'completed').slice(0, 5));
@@ -4,6 +4,9 @@ import { useParams, useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
 import { ArrowLeft, Check, X, Send, FileText, UserPlus, Clock, History } from 'lucide-react';
 
+const PREVIEW_RETRIES = 5;
+const PREVIEW_RETRY_MS = 1000;
+
 const DocumentDetail = () => {
     const { id } = useParams();
     const navigate = useNavigate();
@@ -25,10 +28,48 @@ const DocumentDetail = () => {
     const [approvalFile, setApprovalFile] = useState(null);
     const [approvalAction, setApprovalAction] = useState(''); // 'approve' or 'reject'
 
+    const [preview, setPreview] = useState(null);
+
     useEffect(() => {
         fetchData();
     }, [id]);
 
+    // Small server-side preview instead of downloading the original
+    useEffect(() => {
+        setPreview(null);
+        if (!document?.file) return;
+        let objectUrl;
+        let timer;
+        let cancelled = false;
+        // 202 means the preview is still being generated: ask again a little later
+        const load = (attempt) => {
+            api.get(`/documents/${id}/preview/`, { responseType: 'blob' })
+                .then(async (res) => {
+                    if (cancelled) return;
+                    if (res.status === 202) {
+                        if (attempt < PREVIEW_RETRIES) {
+                            timer = setTimeout(() => load(attempt + 1), PREVIEW_RETRY_MS * (attempt + 1));
+                        }
+                        return;
+                    }
+                    if (res.status !== 200) return;
+                    if (res.data.type.startsWith('image/')) {
+                        objectUrl = URL.createObjectURL(res.data);
+                        setPreview({ image: objectUrl });
+                    } else {
+                        setPreview({ text: await res.data.text() });
+                    }
+                })
+                .catch(() => !cancelled && setPreview(null));
+        };
+        load(0);
+        return () => {
+            cancelled = true;
+            clearTimeout(timer);
+            if (objectUrl) URL.revokeObjectURL(objectUrl);
+        };
+    }, [id, document?.file]);
+
     const fetchData = async () => {
         try {
             const [docRes, logsRes, usersRes] = await Promise.all([
@@ -107,7 +148,11 @@ const DocumentDetail = () => {
     if (!document) return <div className="p-6">Документ не найден</div>;
 
     const canSubmit = document.status === 'draft' && document.creator === user.id;
-    const canApprove = document.status === 'pending' && (document.current_approver === user.id || user.role === 'admin');
+    const canApprove = document.status === 'pending' && (
+        document.current_approver === user.id
+        || (document.pending_approvers || []).includes(user.id)
+        || user.role === 'admin'
+    );
     const canAssign = ['approved', 'in_progress'].includes(document.status) && user.is_manager;
 
     return (
@@ -146,7 +191,15 @@ const DocumentDetail = () => {
 
                 {document.file && (
                     <div className="mb-4">
-                        <a href={document.file} target="_blank" rel="noopener noreferrer"
+                        {preview?.image && (
+                            <img src={preview.image} alt="Предпросмотр" className="mb-2 max-h-80 rounded border" />
+                        )}
+                        {preview?.text && (
+                            <pre className="mb-2 max-h-80 overflow-auto whitespace-pre-wrap bg-gray-50 p-3 rounded border text-sm text-gray-700">
+                                {preview.text}
+                            </pre>
+                        )}
+                        <a href={document.file_url || document.file} target="_blank" rel="noopener noreferrer"
                             className="flex items-center text-blue-600 hover:underline">
                             <FileText size={18} className="mr-2" /> Скачать файл
                         </a>
@@ -248,7 +301,7 @@ const DocumentDetail = () => {
                                 {log.comment && <div className="text-sm text-gray-600 mt-1 bg-gray-50 p-2 rounded">{log.comment}</div>}
                                 {log.file && (
                                     <a
-                                        href={log.file}
+                                        href={log.file_url || log.file}
                                         target="_blank"
                                         rel="noopener noreferrer"
                                         className="flex items-center gap-2 text-blue-600 hover:underline text-sm mt-2"
@@ -5,22 +5,35 @@ import { Plus, Search, Filter } from 'lucide-react';
 
 const Documents = () => {
     const [documents, setDocuments] = useState([]);
+    const [nextUrl, setNextUrl] = useState(null);
     const [loading, setLoading] = useState(true);
+    const [loadingMore, setLoadingMore] = useState(false);
     const [statusFilter, setStatusFilter] = useState('');
     const [search, setSearch] = useState('');
+    const [query, setQuery] = useState('');
+
+    // Debounce search input before hitting the server
+    useEffect(() => {
+        const timer = setTimeout(() => setQuery(search.trim()), 300);
+        return () => clearTimeout(timer);
+    }, [search]);
 
     useEffect(() => {
         fetchDocuments();
-    }, [statusFilter]);
+    }, [statusFilter, query]);
 
     const fetchDocuments = async () => {
         try {
-            let url = '/documents/';
+            const params = {};
             if (statusFilter) {
-                url += `?status=${statusFilter}`;
+                params.status = statusFilter;
+            }
+            if (query) {
+                params.q = query;
             }
-            const response = await api.get(url);
-            setDocuments(response.data);
+            const response = await api.get('/documents/', { params });
+            setDocuments(response.data.results);
+            setNextUrl(response.data.next);
         } catch (error) {
             console.error('Failed to fetch documents', error);
         } finally {
@@ -28,10 +41,19 @@ const Documents = () => {
         }
     };
 
-    const filteredDocs = documents.filter(doc =>
-        doc.title.toLowerCase().includes(search.toLowerCase()) ||
-        (doc.registration_number && doc.registration_number.includes(search))
-    );
+    const loadMore = async () => {
+        if (!nextUrl) return;
+        setLoadingMore(true);
+        try {
+            const response = await api.get(nextUrl);
+            setDocuments(prev => [...prev, ...response.data.results]);
+            setNextUrl(response.data.next);
+        } catch (error) {
+            console.error('Failed to fetch documents', error);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
 
     const statusOptions = [
         { value: '', label: 'Все статусы' },
@@ -98,7 +120,7 @@ const Documents = () => {
                         </tr>
                     </thead>
                     <tbody>
-                        {filteredDocs.map(doc => (
+                        {documents.map(doc => (
                             <tr key={doc.id} className="border-b hover:bg-gray-50">
                                 <td className="px-4 py-3">
                                     <Link to={`/documents/${doc.id}`} className="text-blue-600 hover:underline">
@@ -128,9 +150,20 @@ const Documents = () => {
                         ))}
                     </tbody>
                 </table>
-                {filteredDocs.length === 0 && (
+                {documents.length === 0 && (
                     <div className="p-6 text-center text-gray-500">Документы не найдены</div>
                 )}
+                {nextUrl && (
+                    <div className="p-4 text-center border-t">
+                        <button
+                            onClick={loadMore}
+                            disabled={loadingMore}
+                            className="px-4 py-2 text-blue-600 hover:bg-blue-50 rounded-lg disabled:opacity-50"
+                        >
+                            {loadingMore ? 'Загрузка...' : 'Показать еще'}
+                        </button>
+                    </div>
+                )}
             </div>
         </div>
     );